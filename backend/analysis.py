@@ -0,0 +1,224 @@
+# analysis.py - Document analysis shared by the API and the job workers
+#
+# Model calls go through the provider selected by ANALYSIS_PROVIDER
+# (providers.py); this module handles extraction, chunking and caching.
+import logging
+import mimetypes
+import threading
+from datetime import datetime
+from typing import Optional
+
+from models import ContentType, DocumentStatus
+from analysis_cache import analysis_cache, content_hash, make_cache_key
+from ocr_pipeline import ocr_pdf_pages
+from fetch import fetch_file, FetchedFile
+from text_extraction import extract_pdf_text
+from chunking import analyze_in_chunks
+from prompts import PromptTemplate, DOCUMENT_PROMPT, IMAGE_PROMPT, OCR_PROMPT
+from providers import (create_provider, response_stats, AnalysisError, MalformedResponseError,  # noqa: F401
+                       OverloadedError, GEMINI_NOT_CONFIGURED)
+
+logger = logging.getLogger(__name__)
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_analysis_provider():
+    """The ANALYSIS_PROVIDER provider, created on first use (configuring Gemini
+    imports its SDK, so it is not done at import; the API does it at startup)"""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = create_provider()
+        return _provider
+
+
+def _should_cache(analysis: Optional[dict]) -> bool:
+    # Fallback results are a degraded answer; the primary provider should retry next time
+    return bool(analysis) and not analysis.get("fallback")
+
+
+def analysis_prompt_for(document_data: dict) -> PromptTemplate:
+    """The prompt a document is analyzed with (text and PDFs vs images)"""
+    if document_data.get("content_type", ContentType.FILE) == ContentType.TEXT:
+        return DOCUMENT_PROMPT
+    file_name = (document_data.get("file_name") or "").lower()
+    return DOCUMENT_PROMPT if file_name.endswith(".pdf") else IMAGE_PROMPT
+
+
+def is_analysis_stale(document_data: dict) -> bool:
+    """True if the document was not analyzed with the active prompt version"""
+    return document_data.get("prompt_version") != analysis_prompt_for(document_data).id
+
+
+def analysis_cache_key(digest: str, prompt: PromptTemplate = DOCUMENT_PROMPT) -> str:
+    return make_cache_key(digest, prompt.id, get_analysis_provider().model_name)
+
+
+def _with_prompt_version(analysis: Optional[dict], prompt: PromptTemplate) -> Optional[dict]:
+    # Recorded on the document so stale analyses can be found after a prompt change.
+    # Fallback answers get a suffixed version, so they count as stale too.
+    if analysis:
+        fallback = analysis.get("fallback")
+        analysis["prompt_version"] = f"{prompt.id}+{fallback}" if fallback else prompt.id
+    return analysis
+
+
+def analyze_text_with_gemini(text_content: str) -> dict:
+    """Analyze plain document text, reusing cached results for identical text"""
+    key = analysis_cache_key(content_hash(text_content))
+    return analysis_cache.get_or_compute(key, lambda: _generate_text_analysis(text_content), _should_cache)
+
+
+def _generate_text_analysis(text_content: str) -> dict:
+    if not get_analysis_provider().available:
+        raise AnalysisError(GEMINI_NOT_CONFIGURED)
+    return _with_prompt_version(analyze_in_chunks([text_content], _analyze_chunk), DOCUMENT_PROMPT)
+
+
+def _analyze_pdf_text(pages: list) -> dict:
+    """Analyze extracted PDF page texts (long documents are chunked on page boundaries)"""
+    return analyze_in_chunks(pages, _analyze_chunk)
+
+
+def _analyze_chunk(text_content: str, part: int = 1, total: int = 1) -> dict:
+    if total == 1:
+        return get_analysis_provider().analyze_text(text_content)
+    # Chunks are cached too, so an edited long document only re-sends the changed parts
+    provider = get_analysis_provider()
+    key = make_cache_key(content_hash(text_content), DOCUMENT_PROMPT.id, provider.model_name, namespace="chunk")
+    return analysis_cache.get_or_compute(
+        key, lambda: provider.analyze_text(text_content, part, total), _should_cache
+    )
+
+
+def analyze_fetched_document(fetched: FetchedFile, file_type):
+    """Analyze a downloaded file (PDF or image); returns None on failure"""
+    try:
+        # ---------- PDF CASE ----------
+        if file_type.lower() == "pdf":
+
+            # Per-page text extraction; only pages without a text layer need OCR
+            extraction = extract_pdf_text(fetched.path())
+
+            # ---------- SCANNED PAGES (NO TEXT) ----------
+            if extraction.ocr_pages:
+                # Map: OCR page chunks (cached per page); reduce: analyze the combined text
+                provider = get_analysis_provider()
+                ocr_texts = ocr_pdf_pages(
+                    fetched.path(),
+                    provider.transcribe_pages,
+                    cache=analysis_cache,
+                    cache_key=lambda digest: make_cache_key(
+                        digest, OCR_PROMPT.id, provider.model_name, namespace="ocr"
+                    ),
+                    page_numbers=extraction.ocr_pages
+                )
+                for page_number, text in zip(extraction.ocr_pages, ocr_texts):
+                    extraction.pages[page_number] = text
+
+            if len(extraction.text) <= 30:
+                raise AnalysisError("No text could be extracted from the PDF")
+            return _with_prompt_version(_analyze_pdf_text(extraction.pages), DOCUMENT_PROMPT)
+
+        # ---------- IMAGE CASE ----------
+        else:
+            image_bytes = fetched.read()
+
+            # Find MIME type
+            mime = fetched.content_type
+            if not mime or mime == "application/octet-stream":
+                mime = mimetypes.guess_type(fetched.url)[0] or "image/png"
+
+            return _with_prompt_version(get_analysis_provider().analyze_image(image_bytes, mime), IMAGE_PROMPT)
+
+    except OverloadedError:
+        # Not a property of the document: the caller should retry later
+        raise
+    except Exception:
+        logger.exception("Document analysis failed", extra={"provider": get_analysis_provider().name})
+        return None
+
+
+def run_document_analysis(document_data: dict):
+    """Analyze a stored document (text or file).
+
+    Returns (analysis, content_hash); identical content analyzed with the same
+    prompt version and model is served from the analysis cache.
+    """
+    if not get_analysis_provider().available:
+        raise AnalysisError(GEMINI_NOT_CONFIGURED)
+
+    content_type = document_data.get("content_type", ContentType.FILE)
+
+    if content_type == ContentType.TEXT:
+        text_content = document_data.get("content", "")
+        if not text_content:
+            raise AnalysisError("No text content found")
+        digest = content_hash(text_content)
+        analysis_result = analysis_cache.get_or_compute(
+            analysis_cache_key(digest),
+            lambda: _generate_text_analysis(text_content),
+            _should_cache
+        )
+        return analysis_result, digest
+
+    file_url = document_data.get("file_url")
+    if not file_url:
+        raise AnalysisError("No file URL found")
+
+    # Determine file type from filename
+    file_name = document_data["file_name"].lower()
+    file_type = "pdf" if file_name.endswith('.pdf') else "image"
+
+    # Download once (hashed while streaming); every extractor reads the same copy
+    with fetch_file(file_url) as fetched:
+        digest = fetched.sha256
+        analysis_result = analysis_cache.get_or_compute(
+            analysis_cache_key(digest, analysis_prompt_for(document_data)),
+            lambda: analyze_fetched_document(fetched, file_type),
+            _should_cache
+        )
+    if not analysis_result:
+        raise AnalysisError("Failed to analyze document")
+    return analysis_result, digest
+
+
+def cached_analysis_for(document_data: dict) -> Optional[tuple]:
+    """Return (analysis, content_hash) if the document's content is already cached.
+
+    Text documents are hashed directly; file documents need a content_hash
+    recorded by a previous analysis, since hashing them means downloading.
+    """
+    if document_data.get("content_type", ContentType.FILE) == ContentType.TEXT:
+        if not document_data.get("content"):
+            return None
+        digest = content_hash(document_data["content"])
+    else:
+        digest = document_data.get("content_hash")
+        if not digest:
+            return None
+
+    analysis_result = analysis_cache.get(analysis_cache_key(digest, analysis_prompt_for(document_data)))
+    return (analysis_result, digest) if analysis_result is not None else None
+
+
+def build_analysis_update(analysis_data: dict, digest: Optional[str] = None) -> dict:
+    """Firestore update that moves a document to ANALYZED with the given results"""
+    update_data = {
+        "processing_status": DocumentStatus.ANALYZED,
+        "summary": analysis_data.get("summary", ""),
+        "document_type": analysis_data.get("document_type", "Unknown"),
+        "urgency_score": analysis_data.get("urgency_score"),
+        "importance_score": analysis_data.get("importance_score"),
+        "departments_responsible": analysis_data.get("departments_responsible", []),
+        "confidence": analysis_data.get("confidence"),
+        "key_findings": analysis_data.get("key_findings", []),
+        "prompt_version": analysis_data.get("prompt_version"),
+        "analyzed_at": datetime.now(),
+        "error_message": None
+    }
+    if digest:
+        update_data["content_hash"] = digest
+    return update_data
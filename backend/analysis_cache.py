@@ -0,0 +1,219 @@
+# analysis_cache.py - Content-hash keyed cache of parsed Gemini analyses
+#
+# Keys combine the SHA-256 of the normalized text (or raw file bytes) with the
+# prompt version and model name, so re-uploads of the same invoice or contract
+# skip the LLM round trip while prompt/model changes naturally miss.
+#
+# ANALYSIS_CACHE_BACKEND selects memory (default), sqlite, redis or none.
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Optional, Union
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_BACKEND = os.getenv("ANALYSIS_CACHE_BACKEND", "memory").lower()
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "1024"))
+ANALYSIS_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", "analysis_cache.sqlite3")
+ANALYSIS_CACHE_REDIS_URL = os.getenv(
+    "ANALYSIS_CACHE_REDIS_URL",
+    os.getenv("REDIS_URL", "redis://localhost:6379/2")
+)
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so whitespace/unicode-form differences hash the same"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def content_hash(content: Union[str, bytes]) -> str:
+    """SHA-256 of normalized text or raw file bytes"""
+    if isinstance(content, str):
+        content = normalize_text(content).encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def make_cache_key(digest: str, prompt_version: str, model_name: str, namespace: str = "analysis") -> str:
+    return f"{namespace}:{prompt_version}:{model_name}:{digest}"
+
+
+# ---------------------------- BACKENDS ----------------------------
+
+class MemoryCacheBackend:
+    """In-process LRU with per-entry TTL"""
+
+    def __init__(self, max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES, ttl: int = ANALYSIS_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteCacheBackend:
+    """On-disk store shared by every worker process on the node"""
+
+    def __init__(self, path: str = ANALYSIS_CACHE_PATH, ttl: int = ANALYSIS_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[dict]:
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM analysis_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at < time.time():
+            with self._connection() as conn:
+                conn.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+            return None
+        return json.loads(value)
+
+    def set(self, key: str, value: dict):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + self.ttl)
+            )
+
+
+class RedisCacheBackend:
+    """Redis store shared across nodes (same Redis the Celery workers use)"""
+
+    def __init__(self, url: str = ANALYSIS_CACHE_REDIS_URL, ttl: int = ANALYSIS_CACHE_TTL):
+        import redis
+        self.ttl = ttl
+        # Short timeouts: a Redis outage should degrade to misses, not stall analysis
+        self._client = redis.Redis.from_url(url, socket_connect_timeout=1, socket_timeout=1)
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self._client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, value: dict):
+        self._client.set(key, json.dumps(value), ex=self.ttl)
+
+
+# ---------------------------- CACHE ----------------------------
+
+class AnalysisCache:
+    """Backend-agnostic cache with hit/miss counters.
+
+    Backend errors are counted and treated as misses so a cache outage never
+    fails an analysis.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key: str) -> Optional[dict]:
+        if self.backend is None:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning("Analysis cache get failed", extra={"error": str(e)})
+            self._count("errors")
+            value = None
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def set(self, key: str, value: dict):
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            logger.warning("Analysis cache set failed", extra={"error": str(e)})
+            self._count("errors")
+
+    def get_or_compute(self, key: str, compute: Callable[[], Optional[dict]],
+                       should_store: Callable[[Optional[dict]], bool] = bool) -> Optional[dict]:
+        """Return the cached value or compute, store (if should_store) and return it"""
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = compute()
+        if should_store(value):
+            self.set(key, value)
+        return value
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__ if self.backend else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+def _create_backend():
+    if ANALYSIS_CACHE_BACKEND == "none":
+        return None
+    try:
+        if ANALYSIS_CACHE_BACKEND == "sqlite":
+            return SQLiteCacheBackend()
+        if ANALYSIS_CACHE_BACKEND == "redis":
+            return RedisCacheBackend()
+    except Exception as e:
+        logger.error("Analysis cache backend unavailable, using memory",
+                     extra={"backend": ANALYSIS_CACHE_BACKEND, "error": str(e)})
+    return MemoryCacheBackend()
+
+
+analysis_cache = AnalysisCache(_create_backend())
@@ -0,0 +1,95 @@
+"""Analysis pipeline throughput with an offline provider (no network, no API spend).
+
+Usage (from backend/):
+    python benchmarks/bench_analysis.py [--provider stub] [--documents N] [--pages P]
+                                        [--workers W] [--latency-ms MS] [--failure-rate R]
+
+Runs run_document_analysis on synthetic text documents from W threads, the
+way the job workers call it, and reports documents/sec and latency
+percentiles. Documents of P pages are chunked like real long documents, so
+chunk fan-out and merging are included. The stub provider's latency and
+failure rate simulate the model; "stub,heuristic" measures failover. The
+analysis cache is disabled so every document reaches the provider.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--provider", default="stub")
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=6)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--failure-rate", type=float, default=0)
+    return parser.parse_args()
+
+
+args = parse_args()
+# Read by providers.py and analysis_cache.py at import
+os.environ["ANALYSIS_PROVIDER"] = args.provider
+os.environ["STUB_LATENCY_MS"] = str(args.latency_ms)
+os.environ["STUB_FAILURE_RATE"] = str(args.failure_rate)
+os.environ["ANALYSIS_CACHE_BACKEND"] = "none"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis import run_document_analysis, AnalysisError  # noqa: E402
+from chunking import ANALYSIS_CHUNK_TOKENS, CHARS_PER_TOKEN  # noqa: E402
+from models import ContentType  # noqa: E402
+
+PARAGRAPH = (
+    "Invoice {n}: payment for the maintenance contract is overdue. The vendor "
+    "requests settlement within 24 hours to avoid a penalty under the agreement. "
+)
+
+
+def build_document(number: int, pages: int) -> dict:
+    # Three pages (plus page headers and separators) fit in one chunk: P/3 chunks
+    page_chars = ANALYSIS_CHUNK_TOKENS * CHARS_PER_TOKEN // 4
+    paragraph = PARAGRAPH.format(n=number)
+    page = (paragraph * (page_chars // len(paragraph) + 1))[:page_chars]
+    content = "\n\n".join(f"Page {p + 1}. {page}" for p in range(pages))
+    return {"content_type": ContentType.TEXT, "content": content}
+
+
+def main():
+    documents = [build_document(n, args.pages) for n in range(args.documents)]
+    latencies, failures = [], 0
+
+    def analyze(document):
+        start = time.perf_counter()
+        try:
+            run_document_analysis(document)
+        except AnalysisError:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for latency in pool.map(analyze, documents):
+            if latency is None:
+                failures += 1
+            else:
+                latencies.append(latency)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else 0.0
+
+    print(f"provider={args.provider} documents={args.documents} pages={args.pages} workers={args.workers} "
+          f"latency={args.latency_ms}ms failure_rate={args.failure_rate}")
+    print(f"{'docs/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'failed':>7}")
+    print(f"{len(latencies) / elapsed:>8.1f} {percentile(0.5):>8.1f} {percentile(0.95):>8.1f} "
+          f"{percentile(0.99):>8.1f} {failures:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Compare PDF text-extraction engines (pages/sec).
+
+Usage (from backend/):
+    python benchmarks/bench_extraction.py [PDF_DIR] [--repeat N]
+
+Without PDF_DIR a synthetic corpus (prose pages and ruled table pages) is
+generated in a temp directory.
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # noqa: E402
+import text_extraction  # noqa: E402
+from text_extraction import ENGINES, extract_pdf_text  # noqa: E402
+
+PROSE = (
+    "This agreement is entered into by the parties named below. Payment is due "
+    "within thirty days of the invoice date. Late payments accrue interest at "
+    "the rate stated in section four. "
+) * 6
+
+
+def build_corpus(directory: str, documents: int = 10, pages: int = 20):
+    for d in range(documents):
+        pdf = fitz.open()
+        for p in range(pages):
+            page = pdf.new_page()
+            if p % 4 == 3:
+                # Ruled table: 12 rows x 4 columns
+                for row in range(12):
+                    y = 72 + row * 24
+                    page.draw_line((72, y), (520, y))
+                    for col in range(4):
+                        page.insert_text((76 + col * 112, y + 16), f"R{row}C{col} {d * 100 + row}")
+                for col in range(5):
+                    page.draw_line((72 + col * 112, 72), (72 + col * 112, 72 + 11 * 24))
+            else:
+                page.insert_textbox(fitz.Rect(72, 72, 520, 770), PROSE, fontsize=10)
+        pdf.save(os.path.join(directory, f"sample_{d:02d}.pdf"))
+        pdf.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf_dir", nargs="?")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pdf_dir = args.pdf_dir or tempfile.mkdtemp(prefix="extraction-corpus-")
+    if not args.pdf_dir:
+        build_corpus(pdf_dir)
+    paths = sorted(glob.glob(os.path.join(pdf_dir, "*.pdf")))
+    if not paths:
+        sys.exit(f"No PDFs found in {pdf_dir}")
+
+    total_pages = 0
+    for path in paths:
+        with fitz.open(path) as pdf:
+            total_pages += len(pdf)
+    print(f"Corpus: {len(paths)} PDFs, {total_pages} pages ({pdf_dir})")
+    print(f"{'engine':<12} {'pages/sec':>10} {'seconds':>9} {'ocr pages':>10} {'chars':>10}")
+
+    # "pymupdf-text" is the PyMuPDF fast path alone, without the per-page table fallback
+    runs = [(engine, engine, None) for engine in ENGINES]
+    runs.insert(1, ("pymupdf-text", "pymupdf", float("inf")))
+
+    for label, engine, table_threshold in runs:
+        default_threshold = text_extraction.TABLE_DRAWINGS_THRESHOLD
+        if table_threshold is not None:
+            text_extraction.TABLE_DRAWINGS_THRESHOLD = table_threshold
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            ocr_pages = chars = 0
+            for path in paths:
+                result = extract_pdf_text(path, engine=engine)
+                ocr_pages += len(result.ocr_pages)
+                chars += len(result.text)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        text_extraction.TABLE_DRAWINGS_THRESHOLD = default_threshold
+        print(f"{label:<12} {total_pages / best:>10.1f} {best:>9.3f} {ocr_pages:>10} {chars:>10}")
+
+
+if __name__ == "__main__":
+    main()
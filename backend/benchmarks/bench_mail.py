@@ -0,0 +1,127 @@
+"""Messages/sec sending mail with a connection per message vs. pooled SMTP sessions.
+
+Usage (from backend/):
+    python benchmarks/bench_mail.py [--messages N] [--pool-size P] [--handshake-ms MS] [--message-ms MS]
+
+Mail goes to a local SMTP stub (aiosmtpd, accepts any login, keeps nothing),
+so no mail server or credentials are needed. Requires aiosmtpd.
+The stub adds --handshake-ms to each new session (standing in for the TLS
+handshake and login to a real provider) and --message-ms to each message.
+Three modes send the same N credential emails:
+  per-message  a new connection and login for every message (the old email_utils)
+  pooled       SMTPTransport.send_many on a pool of 1 connection
+  pooled xP    SMTPTransport.send_many on a pool of P connections
+"""
+import argparse
+import asyncio
+import logging
+import os
+import smtplib
+import socket
+import sys
+import time
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiosmtpd.controller import Controller  # noqa: E402
+from aiosmtpd.smtp import AuthResult  # noqa: E402
+
+from email_utils import credentials_mail  # noqa: E402
+from mail_transport import SMTPPool, SMTPTransport, email_message  # noqa: E402
+
+# aiosmtpd logs a deprecation warning (its own API) on every login
+logging.getLogger("mail.log").setLevel(logging.ERROR)
+
+HOST = "127.0.0.1"
+SENDER = "noreply@example.com"
+PASSWORD = "stub-password"
+
+
+class StubHandler:
+    """Counts accepted messages; sleeps to simulate provider latency"""
+
+    def __init__(self, handshake: float, per_message: float):
+        self.handshake = handshake
+        self.per_message = per_message
+        self.sessions = 0
+        self.messages = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        session.host_name = hostname
+        await asyncio.sleep(self.handshake)
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        await asyncio.sleep(self.per_message)
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def accept_any_login(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=True)
+
+
+def send_per_message(port: int, mails: list):
+    """The old email_utils._send_via_smtp: connect, log in, send, quit"""
+    for mail in mails:
+        with smtplib.SMTP(HOST, port, timeout=10) as server:
+            server.login(SENDER, PASSWORD)
+            server.send_message(email_message(mail, SENDER))
+    return {"sent": len(mails), "failed": []}, len(mails)
+
+
+def send_pooled(port: int, mails: list, size: int):
+    pool = SMTPPool(HOST, port, SENDER, PASSWORD, use_ssl=False, use_tls=False, size=size)
+    transport = SMTPTransport(pool, sender=SENDER)
+    result = transport.send_many(mails)
+    transport.close()
+    return result, pool.connections_opened
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--handshake-ms", type=float, default=50)
+    parser.add_argument("--message-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    handler = StubHandler(args.handshake_ms / 1000, args.message_ms / 1000)
+    port = free_port()
+    controller = Controller(handler, hostname=HOST, port=port, authenticator=accept_any_login,
+                            auth_require_tls=False)
+    controller.start()
+    mails = [credentials_mail(f"employee-{n}@example.com", f"password-{n}") for n in range(args.messages)]
+
+    modes = [
+        ("per-message", lambda: send_per_message(port, mails)),
+        ("pooled", lambda: send_pooled(port, mails, 1)),
+        (f"pooled x{args.pool_size}", lambda: send_pooled(port, mails, args.pool_size)),
+    ]
+    print(f"{args.messages} messages, handshake={args.handshake_ms}ms per session, "
+          f"{args.message_ms}ms per message")
+    print(f"{'mode':<12} {'msg/s':>8} {'seconds':>8} {'sessions':>9} {'failed':>7}")
+    try:
+        for mode, run in modes:
+            received = handler.messages
+            start = time.perf_counter()
+            result, sessions = run()
+            elapsed = time.perf_counter() - start
+            assert handler.messages - received == result["sent"], "stub received a different count"
+            print(f"{mode:<12} {result['sent'] / elapsed:>8.1f} {elapsed:>8.2f} {sessions:>9} "
+                  f"{len(result['failed']):>7}")
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()
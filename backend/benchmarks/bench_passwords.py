@@ -0,0 +1,73 @@
+"""Password hashing cost: logins/sec per worker at the configured parameters.
+
+Usage (from backend/):
+    python benchmarks/bench_passwords.py [--seconds S] [--workers N]
+
+For each hasher (scrypt, pbkdf2 and the legacy sha256) it reports the time of
+one verification and verifications/sec on one thread. It then reports
+logins/sec through the password pool with PASSWORD_HASH_WORKERS (or
+--workers) threads, which is what one API worker can sustain. Cost
+parameters come from the PASSWORD_* environment variables.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import passwords  # noqa: E402
+
+
+def single_thread_rate(stored_hash: str, seconds: float) -> tuple:
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        passwords.verify_password("correct horse battery staple", stored_hash)
+        count += 1
+    elapsed = time.perf_counter() - start
+    return elapsed / count, count / elapsed
+
+
+async def pool_rate(stored_hash: str, seconds: float, concurrency: int) -> float:
+    count = 0
+    deadline = time.perf_counter() + seconds
+
+    async def client():
+        nonlocal count
+        while time.perf_counter() < deadline:
+            await passwords.verify_password_async("correct horse battery staple", stored_hash)
+            count += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--workers", type=int, default=passwords.PASSWORD_HASH_WORKERS)
+    args = parser.parse_args()
+    passwords.PASSWORD_HASH_WORKERS = args.workers
+
+    password = "correct horse battery staple"
+    hashes = {}
+    for hasher in ("scrypt", "pbkdf2"):
+        passwords.PASSWORD_HASHER = hasher
+        hashes[hasher] = passwords.hash_password(password)
+    hashes["sha256 (legacy)"] = hashlib.sha256(password.encode()).hexdigest()
+
+    print(f"scrypt n={passwords.PASSWORD_SCRYPT_N} r={passwords.PASSWORD_SCRYPT_R} p={passwords.PASSWORD_SCRYPT_P}, "
+          f"pbkdf2 iterations={passwords.PASSWORD_PBKDF2_ITERATIONS}, pool workers={args.workers}, cpus={os.cpu_count()}")
+    print(f"{'hasher':<16} {'ms/verify':>10} {'1 thread/s':>11} {'pool logins/s':>14}")
+    for name, stored_hash in hashes.items():
+        per_call, rate = single_thread_rate(stored_hash, args.seconds)
+        pooled = asyncio.run(pool_rate(stored_hash, args.seconds, concurrency=args.workers * 4))
+        print(f"{name:<16} {per_call * 1000:>10.2f} {rate:>11.1f} {pooled:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Data-store round trips per endpoint, checked against budgets (catches N+1 queries).
+
+Usage (from backend/):
+    python benchmarks/bench_round_trips.py [--scale N]
+
+Runs the app in-process (httpx ASGI transport) on the in-memory repository
+(DATA_BACKEND=memory), so no Firebase credentials or network are needed, and
+reads each response's X-Data-Operations header. Two checks, exit status 1 if
+either fails:
+  budget  each endpoint makes at most its budgeted number of round trips
+  scale   round trips stay the same when the company is --scale times larger
+          (a query per employee or per document shows up here), apart from
+          extra batch commits once writes pass WRITE_BATCH_SIZE
+Reads and writes (documents) are reported and are expected to grow with scale.
+The user cache is disabled (USER_CACHE_TTL=0) so every request reads the
+session user, as on a cold worker. Requires httpx.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+os.environ["DATA_BACKEND"] = "memory"
+os.environ["USER_CACHE_TTL"] = "0"
+os.environ["ANALYSIS_PROVIDER"] = "stub"
+os.environ["STUB_LATENCY_MS"] = "0"
+os.environ["ANALYSIS_EXECUTOR"] = "local"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+import main as api  # noqa: E402
+import passwords  # noqa: E402
+from repository import WRITE_BATCH_SIZE, InMemoryRepository, AsyncRepository, get_repository  # noqa: E402
+from user_cache import UserCache  # noqa: E402
+
+COMPANY = "Acme"
+ADMIN = "admin@example.com"
+EMPLOYEE = "employee-0-0@example.com"
+PASSWORD = "correct horse battery staple"
+DEPARTMENTS = ["Finance", "Legal", "Operations"]
+
+# Base company size; --scale multiplies employees and documents
+EMPLOYEES_PER_DEPARTMENT = 5
+DOCUMENTS = 40
+
+
+# (label, role, method, path, request kwargs, round-trip budget). Paths and
+# kwargs may be callables of the run state (ids created by earlier steps).
+# Budgets are for scale 1; endpoints run in this order.
+WORKLOAD = [
+    ("POST /login/ (admin)", None, "POST", "/login/", {}, 1),
+    ("GET /me/", "admin", "GET", "/me/", {}, 1),
+    ("GET /departments/", "admin", "GET", "/departments/", {}, 2),
+    ("GET /departments/?include_employees=false", "admin", "GET",
+     "/departments/?include_employees=false", {}, 1),
+    ("GET /documents/ (page 1)", "admin", "GET", "/documents/?limit=10&fields=file_name,summary", {}, 1),
+    ("GET /documents/ (page 2)", "admin", "GET",
+     lambda s: f"/documents/?limit=10&fields=file_name,summary&start_after={s['cursor']}", {}, 2),
+    ("GET /documents/?min_urgency=50", "admin", "GET", "/documents/?min_urgency=50&limit=10", {}, 1),
+    ("POST /create-department/", "admin", "POST", "/create-department/",
+     {"json": {"department_name": "Research"}}, 5),  # incl. the employee count aggregation
+    ("POST /add-employee/", "admin", "POST", "/add-employee/", {"json": {
+        "name": "New Hire", "email": "new-hire@example.com", "department_name": "Research", "password": PASSWORD
+    }}, 4),
+    ("POST /create-text-document/", "admin", "POST", "/create-text-document/",
+     {"data": {"title": "Memo", "content": "Quarterly budget review.", "analyze": "false"}}, 1),
+    ("POST /assign-document/", "admin", "POST", "/assign-document/",
+     lambda s: {"json": {"document_id": s["unassigned"], "departments": DEPARTMENTS}}, 3),
+    ("POST /update-document-status/", "admin", "POST", "/update-document-status/",
+     lambda s: {"json": {"document_id": s["unassigned"], "status": "completed"}}, 2),
+    ("GET /employee-document-status/{id}", "admin", "GET",
+     lambda s: f"/employee-document-status/{s['assigned']}", {}, 3),
+    ("POST /analyze-document/", "admin", "POST", "/analyze-document/",
+     lambda s: {"json": {"document_id": s["pending"]}}, 3),
+    ("GET /jobs/{id}", "admin", "GET", lambda s: f"/jobs/{s['job_id']}", {}, 1),
+    ("POST /login/ (employee)", None, "POST", "/login/", {}, 1),
+    ("GET /my-documents/", "employee", "GET", "/my-documents/", {}, 3),
+    ("GET /documents/ (employee)", "employee", "GET", "/documents/", {}, 3),
+    ("POST /update-personal-doc-status/", "employee", "POST", "/update-personal-doc-status/",
+     lambda s: {"json": {"document_id": s["assigned"], "status": "in_progress"}}, 3),
+    ("DELETE /delete-employee/{email}", "admin", "DELETE", "/delete-employee/new-hire@example.com", {}, 4),
+    ("DELETE /delete-department/{id}", "admin", "DELETE",
+     lambda s: f"/delete-department/{s['department_ids']['Legal']}", {}, 4),
+]
+
+
+def seed(repository: InMemoryRepository, scale: int) -> dict:
+    """A company with DEPARTMENTS, scale * EMPLOYEES_PER_DEPARTMENT employees
+    each, and scale * DOCUMENTS documents; the first half are assigned"""
+    password = passwords.hash_password(PASSWORD)
+    employees = EMPLOYEES_PER_DEPARTMENT * scale
+    repository.create_user({"name": "Admin", "email": ADMIN, "password": password, "isAdmin": True,
+                            "company_name": COMPANY, "departments": list(DEPARTMENTS)})
+    department_ids = {}
+    for number, name in enumerate(DEPARTMENTS):
+        department_ids[name] = f"dept-{number}"
+        repository.create_department({"department_id": department_ids[name], "department_name": name,
+                                      "company_name": COMPANY, "created_by": ADMIN,
+                                      "created_at": datetime.now(), "employee_count": employees})
+        for n in range(employees):
+            repository.create_user({"name": f"Employee {number}-{n}", "email": f"employee-{number}-{n}@example.com",
+                                    "password": password, "isAdmin": False, "company_name": COMPANY,
+                                    "department_name": name, "docs_received": []})
+
+    start = datetime(2024, 1, 1)
+    documents = [{
+        "document_id": f"doc-{n}", "company_name": COMPANY, "file_name": f"invoice-{n}.txt",
+        "content_type": "text", "content": f"Invoice {n}: payment is overdue.", "uploaded_by": ADMIN,
+        "timestamp": start + timedelta(minutes=n), "processing_status": "analyzed",
+        "summary": f"Invoice {n}", "document_type": "Invoice", "urgency_score": n % 100
+    } for n in range(DOCUMENTS * scale)]
+    documents[-1]["processing_status"] = "pending"
+    repository.create_documents(documents)
+
+    for document in documents[:len(documents) // 2]:
+        records = [{"document_id": document["document_id"], "employee_email": f"employee-{d}-{n}@example.com",
+                    "personal_status": "pending", "last_updated": datetime.now()}
+                   for d in range(len(DEPARTMENTS)) for n in range(employees)]
+        repository.assign_document(document["document_id"], {"departments_assigned": list(DEPARTMENTS),
+                                                             "processing_status": "assigned"}, records)
+    return {
+        "department_ids": department_ids,
+        "assigned": documents[0]["document_id"],
+        "unassigned": documents[len(documents) // 2]["document_id"],
+        "pending": documents[-1]["document_id"],
+    }
+
+
+def parse_operations(header: str) -> dict:
+    return {key: int(value) for key, value in (part.strip().split("=") for part in header.split(";"))}
+
+
+async def run_workload(scale: int) -> list:
+    # The process-wide repository: job and batch workers use it too
+    repository = get_repository()
+    repository.collections.clear()
+    state = seed(repository, scale)
+    api.repo = AsyncRepository(repository)
+    api.user_cache = UserCache(repository.get_user, ttl=0, executor=api.repo.executor)
+
+    results = []
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="https://bench") as admin, \
+            httpx.AsyncClient(transport=transport, base_url="https://bench") as employee:
+        clients = {"admin": admin, "employee": employee}
+        for label, role, method, path, kwargs, budget in WORKLOAD:
+            if role is None:
+                # Login steps: the label says whose session to open
+                role = "employee" if "employee" in label else "admin"
+                kwargs = {"json": {"email": EMPLOYEE if role == "employee" else ADMIN, "password": PASSWORD}}
+            path = path(state) if callable(path) else path
+            kwargs = kwargs(state) if callable(kwargs) else kwargs
+            response = await clients[role].request(method, path, **kwargs)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{label}: HTTP {response.status_code} {response.text}")
+
+            body = response.json()
+            if label == "GET /documents/ (page 1)":
+                state["cursor"] = body["next_cursor"]
+            elif label == "POST /analyze-document/":
+                state["job_id"] = body.get("job_id")
+            operations = parse_operations(response.headers["X-Data-Operations"])
+            results.append(dict(operations, label=label, budget=budget))
+    api.repo.executor.shutdown(wait=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=int, default=5)
+    args = parser.parse_args()
+
+    base = asyncio.run(run_workload(1))
+    scaled = asyncio.run(run_workload(args.scale))
+
+    failures = 0
+    print(f"round trips at scale 1 and {args.scale} (reads/writes at scale {args.scale})")
+    print(f"{'endpoint':<44} {'budget':>6} {'x1':>4} {f'x{args.scale}':>4} {'reads':>6} {'writes':>6}")
+    for small, large in zip(base, scaled):
+        problems = []
+        if small["round_trips"] > small["budget"]:
+            problems.append("over budget")
+        extra_commits = -(-large["writes"] // WRITE_BATCH_SIZE) - -(-small["writes"] // WRITE_BATCH_SIZE)
+        if large["round_trips"] > small["round_trips"] + extra_commits:
+            problems.append("grows with data")
+        failures += bool(problems)
+        print(f"{small['label']:<44} {small['budget']:>6} {small['round_trips']:>4} {large['round_trips']:>4} "
+              f"{large['reads']:>6} {large['writes']:>6}  {', '.join(problems) or 'ok'}")
+
+    if failures:
+        print(f"{failures} endpoint(s) failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
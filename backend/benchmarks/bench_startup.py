@@ -0,0 +1,117 @@
+"""Cold-start cost of the API: `import main` time and what it loads.
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py [--runs N] [--top K] [--output FILE]
+
+Each run imports main in a fresh interpreter under `python -X importtime`
+(DATA_BACKEND=memory, so no credentials or network are needed) and the
+report shows the median over the runs:
+  - wall time of `import main`;
+  - the modules main imports, by cumulative import time;
+  - the time preload() takes (what PRELOAD=true / --preload adds at startup).
+The heavy SDKs and PDF libraries must load on first use, not at import: if
+one of LAZY_MODULES is imported by `import main` the exit status is 1.
+benchmarks/startup_report.txt is this script's output (--output) and is
+regenerated when imports change.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAZY_MODULES = ["google.generativeai", "cloudinary", "PyPDF2", "fitz", "pdfplumber", "PIL",
+                "firebase_admin", "google.cloud.firestore", "grpc", "requests"]
+
+# Runs in the subprocess; prints one JSON line on stdout
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter() - start
+lazy_loaded = [m for m in {lazy!r} if m in sys.modules]
+start = time.perf_counter()
+main.preload()
+preloaded = time.perf_counter() - start
+print(json.dumps({{"import": imported, "preload": preloaded,
+                  "lazy_loaded": lazy_loaded}}))
+"""
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Cumulative microseconds of each module imported directly by main"""
+    children, pending = {}, []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # the header line
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0:
+            if name.strip() == "main":
+                children = {module: us for module, module_depth, us in pending if module_depth == 1}
+            pending = []
+        else:
+            pending.append((name.strip(), depth, int(cumulative)))
+    return children
+
+
+def run_once() -> tuple:
+    env = dict(os.environ, DATA_BACKEND="memory", LOG_LEVEL="WARNING", STORAGE_BACKEND="local",
+               ANALYSIS_PROVIDER=os.getenv("ANALYSIS_PROVIDER", "stub"))
+    env.pop("PRELOAD", None)
+    code = PROBE.format(lazy=LAZY_MODULES)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-W", "ignore", "-c", code],
+                            cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    return probe, parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", help="also write the report to this file")
+    args = parser.parse_args()
+
+    imports, preloads, lazy_loaded = [], [], set()
+    module_times = defaultdict(list)
+    for _ in range(args.runs):
+        probe, children = run_once()
+        imports.append(probe["import"])
+        preloads.append(probe["preload"])
+        lazy_loaded.update(probe["lazy_loaded"])
+        for module, us in children.items():
+            module_times[module].append(us)
+
+    lines = [
+        f"python {sys.version.split()[0]}, {args.runs} runs (medians), DATA_BACKEND=memory",
+        f"import main   {statistics.median(imports) * 1000:8.1f} ms",
+        f"preload()     {statistics.median(preloads) * 1000:8.1f} ms  (PRELOAD=true / --preload, at startup)",
+        "",
+        f"top {args.top} modules imported by main (cumulative)",
+    ]
+    ranked = sorted(module_times.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for module, times in ranked[:args.top]:
+        lines.append(f"  {module:<36} {statistics.median(times) / 1000:8.1f} ms")
+    lines.append("")
+    lines.append("loaded by `import main` but meant to be lazy: " + (", ".join(sorted(lazy_loaded)) or "none"))
+
+    report = "\n".join(lines)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    if lazy_loaded:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Requests/sec of one API worker with blocking vs. offloaded Firestore calls.
+
+Usage (from backend/):
+    python benchmarks/load_test.py [--latency-ms MS] [--concurrency C] [--seconds S]
+
+The app runs in-process behind httpx's ASGI transport (one event loop, like
+one uvicorn worker). Firestore is replaced by the in-memory repository
+(DATA_BACKEND=memory), sleeping --latency-ms per round trip, so no
+credentials or network are used. Requires httpx.
+
+Two modes run the same employee workload (GET /me/, GET /my-documents/,
+POST /update-personal-doc-status/) from C concurrent clients:
+  blocking   repository calls run on the event loop (the old behavior)
+  offloaded  repository calls run on the Firestore I/O pool (AsyncRepository)
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ["DATA_BACKEND"] = "memory"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+import main as api  # noqa: E402
+import passwords  # noqa: E402
+from repository import AsyncRepository, InMemoryRepository  # noqa: E402
+from user_cache import UserCache  # noqa: E402
+
+EMPLOYEE = "employee@example.com"
+PASSWORD = "correct horse battery staple"
+DOCUMENTS = 20
+
+
+class LatencyRepository(InMemoryRepository):
+    """The in-memory repository, sleeping per round trip"""
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+
+    def _record(self, round_trips: int = 1, reads: int = 0, writes: int = 0):
+        super()._record(round_trips, reads, writes)
+        time.sleep(self.latency * round_trips)
+
+
+class BlockingRepository:
+    """Awaitable like AsyncRepository, but each call blocks the event loop"""
+
+    def __init__(self, repository):
+        self.sync = repository
+
+    async def run(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    def __getattr__(self, name):
+        method = getattr(self.sync, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+
+def seed(repository: LatencyRepository):
+    doc_ids = [f"doc-{n}" for n in range(DOCUMENTS)]
+    repository.create_user({
+        "name": "Load Test", "email": EMPLOYEE, "password": passwords.hash_password(PASSWORD),
+        "isAdmin": False, "company_name": "Acme", "department_name": "Finance", "docs_received": doc_ids
+    })
+    repository.create_documents([{"document_id": doc_id, "company_name": "Acme",
+                                  "file_name": f"{doc_id}.pdf", "summary": "Quarterly invoice"}
+                                 for doc_id in doc_ids])
+
+
+async def run_mode(mode: str, latency: float, concurrency: int, seconds: float) -> dict:
+    repository = LatencyRepository(latency)
+    seed(repository)
+    if mode == "blocking":
+        api.repo = BlockingRepository(repository)
+        user_cache = UserCache(repository.get_user, ttl=0)
+
+        async def get_async(email, request=None, refresh=False):
+            return user_cache.get(email, request, refresh)
+
+        user_cache.get_async = get_async
+    else:
+        api.repo = AsyncRepository(repository)
+        user_cache = UserCache(repository.get_user, ttl=0, executor=api.repo.executor)
+    # ttl=0: every request reads the user, as without the process cache
+    api.user_cache = user_cache
+
+    transport = httpx.ASGITransport(app=api.app)
+    completed, errors = 0, 0
+    async with httpx.AsyncClient(transport=transport, base_url="https://loadtest") as client:
+        response = await client.post("/login/", json={"email": EMPLOYEE, "password": PASSWORD})
+        response.raise_for_status()
+
+        deadline = time.perf_counter() + seconds
+
+        async def worker(number: int):
+            nonlocal completed, errors
+            step = number
+            while time.perf_counter() < deadline:
+                kind = step % 3
+                step += 1
+                if kind == 0:
+                    response = await client.get("/me/")
+                elif kind == 1:
+                    response = await client.get("/my-documents/")
+                else:
+                    response = await client.post("/update-personal-doc-status/", json={
+                        "document_id": f"doc-{step % DOCUMENTS}", "status": "in_progress"
+                    })
+                if response.status_code == 200:
+                    completed += 1
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return {"mode": mode, "rps": completed / elapsed, "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"latency={args.latency_ms}ms per round trip, concurrency={args.concurrency}, {args.seconds}s per mode")
+    print(f"{'mode':<10} {'req/s':>8} {'errors':>7}")
+    for mode in ("blocking", "offloaded"):
+        result = asyncio.run(run_mode(mode, args.latency_ms / 1000, args.concurrency, args.seconds))
+        print(f"{result['mode']:<10} {result['rps']:>8.1f} {result['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+# bulk_analysis.py - Server-side analysis of many documents at once
+#
+# POST /analyze-documents/bulk records a batch (explicit document ids, or
+# filters on status, upload date and prompt version) and returns immediately.
+# A worker (the local executor or Celery, like single-document jobs) then:
+#   - reads the matching documents page by page
+#   - groups them by content hash, so identical content is analyzed once and
+#     the result is written to every copy
+#   - leaves documents alone while a single-document job (jobs.py) owns them
+#   - applies cached analyses without a model call
+#   - analyzes the rest on one process-wide pool: at most
+#     BULK_ANALYSIS_CONCURRENCY documents in flight across all batches (the
+#     Gemini client's rate limits apply on top)
+# Local batches run BULK_ANALYSIS_MAX_BATCHES at a time; the rest wait QUEUED.
+# Progress is kept on the batch record (flushed every PROGRESS_FLUSH_SECONDS)
+# and streamed to clients as Server-Sent Events.
+#
+# Batches hold a lease like analysis jobs (jobs.is_job_stale), renewed by each
+# flush. An active batch whose lease has expired lost its worker and is failed
+# when read; requeue_local_batches() redispatches the local executor's QUEUED
+# batches when the API starts.
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from models import AnalysisBatch, BulkAnalyzeRequest, ContentType, DocumentStatus, JobStatus
+from analysis import (run_document_analysis, cached_analysis_for, build_analysis_update,
+                      is_analysis_stale, OverloadedError)
+from analysis_cache import content_hash
+from jobs import ACTIVE_JOB_STATUSES, ANALYSIS_EXECUTOR, ANALYSIS_JOB_MAX_ATTEMPTS, is_job_stale, lease_expiry
+from repository import get_repository
+
+BULK_ANALYSIS_CONCURRENCY = int(os.getenv("BULK_ANALYSIS_CONCURRENCY", "4"))
+# Batches the local executor runs at once (they share the analysis pool)
+BULK_ANALYSIS_MAX_BATCHES = int(os.getenv("BULK_ANALYSIS_MAX_BATCHES", "2"))
+BULK_ANALYSIS_MAX_DOCUMENTS = int(os.getenv("BULK_ANALYSIS_MAX_DOCUMENTS", "5000"))
+PROGRESS_FLUSH_SECONDS = 2.0
+# How often the SSE stream checks for progress
+PROGRESS_POLL_SECONDS = 1.0
+# Comment lines sent on an idle stream so proxies keep it open
+SSE_KEEPALIVE_SECONDS = 15.0
+MAX_RECORDED_ERRORS = 20
+
+PROGRESS_FIELDS = ("total", "processed", "analyzed", "cached", "deduplicated", "skipped", "failed")
+DONE_STATUSES = (JobStatus.SUCCEEDED, JobStatus.FAILED)
+# Re-analysis refreshes these documents' results but leaves their workflow status alone
+KEEP_STATUSES = (DocumentStatus.ASSIGNED, DocumentStatus.COMPLETED, DocumentStatus.IGNORED)
+
+# Everything run_document_analysis and the filters read (skips analysis output)
+DOCUMENT_FIELDS = ["company_name", "content_type", "content", "file_url", "file_name",
+                   "content_hash", "prompt_version", "processing_status"]
+
+logger = logging.getLogger(__name__)
+
+# Live progress of batches running in this process (batch_id -> batch dict)
+_live = {}
+_live_lock = threading.Lock()
+
+_batch_executor = None
+_analysis_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_batch_executor():
+    """Runs local batches (each waits on the analysis pool, never calls the model)"""
+    global _batch_executor
+    with _executor_lock:
+        if _batch_executor is None:
+            _batch_executor = ThreadPoolExecutor(
+                max_workers=BULK_ANALYSIS_MAX_BATCHES,
+                thread_name_prefix="bulk-batch"
+            )
+        return _batch_executor
+
+
+def _get_analysis_executor():
+    """The process-wide pool every batch's documents are analyzed on"""
+    global _analysis_executor
+    with _executor_lock:
+        if _analysis_executor is None:
+            _analysis_executor = ThreadPoolExecutor(
+                max_workers=BULK_ANALYSIS_CONCURRENCY,
+                thread_name_prefix="bulk-analysis"
+            )
+        return _analysis_executor
+
+
+def create_batch(company_name: str, requested_by: str, request: BulkAnalyzeRequest) -> dict:
+    """Record a batch and dispatch it; returns the batch record"""
+    filters = request.dict(exclude={"document_ids"}, exclude_none=True)
+    batch = AnalysisBatch(
+        batch_id=str(uuid.uuid4()),
+        company_name=company_name,
+        requested_by=requested_by,
+        executor="celery" if ANALYSIS_EXECUTOR == "celery" else "local",
+        filters=filters,
+        document_ids=list(dict.fromkeys(request.document_ids)) if request.document_ids else None,
+        created_at=datetime.now(),
+        lease_expires_at=lease_expiry()
+    )
+    batch_data = batch.dict()
+    get_repository().create_batch(batch_data)
+    _dispatch(batch.batch_id)
+    return batch_data
+
+
+def _dispatch(batch_id: str):
+    if ANALYSIS_EXECUTOR == "celery":
+        # Imported lazily: tasks imports this module
+        from tasks import analyze_batch_task
+        analyze_batch_task.delay(batch_id)
+    else:
+        _get_batch_executor().submit(run_batch, batch_id)
+
+
+def _expire(batch: dict) -> dict:
+    """Fail a batch whose lease ran out; returns it as stored"""
+    logger.warning("Failing stale analysis batch", extra={"batch_id": batch["batch_id"], "status": batch["status"]})
+    update = {"status": JobStatus.FAILED, "finished_at": datetime.now(), "error_message": "Lease expired (worker lost)"}
+    get_repository().update_batch(batch["batch_id"], update)
+    return dict(batch, **update)
+
+
+def get_batch(batch_id: str) -> Optional[dict]:
+    """The batch with its latest progress (live if it runs in this process)"""
+    with _live_lock:
+        live = _live.get(batch_id)
+        if live is not None:
+            return dict(live, errors=list(live["errors"]))
+    batch = get_repository().get_batch(batch_id)
+    if batch is not None and is_job_stale(batch):
+        return _expire(batch)
+    return batch
+
+
+def requeue_local_batches() -> int:
+    """Redispatch the local executor's QUEUED batches and fail its stale
+    RUNNING ones (nothing survives a restart); returns how many were requeued.
+
+    Called at API startup. claim_batch lets only one process run a batch.
+    """
+    if ANALYSIS_EXECUTOR == "celery":
+        return 0
+    repo = get_repository()
+    queued = repo.list_batches(JobStatus.QUEUED, "local")
+    for batch in queued:
+        _dispatch(batch["batch_id"])
+    for batch in repo.list_batches(JobStatus.RUNNING, "local"):
+        if is_job_stale(batch):
+            _expire(batch)
+    if queued:
+        logger.info("Requeued analysis batches", extra={"batches": len(queued)})
+    return len(queued)
+
+
+def _local_time(value: Optional[datetime]) -> Optional[datetime]:
+    # Filters may carry an offset (2024-01-01T00:00:00Z); documents are stamped with naive local time
+    return value.astimezone().replace(tzinfo=None) if value and value.tzinfo else value
+
+
+def select_documents(batch: dict) -> List[dict]:
+    """The batch's documents: its id list or its filters, minus deleted documents and those mid-analysis"""
+    filters = batch.get("filters") or {}
+    repo = get_repository()
+    if batch.get("document_ids"):
+        documents = [d for d in repo.get_documents_by_ids(batch["document_ids"])
+                     if d.get("company_name") == batch["company_name"]]
+    else:
+        documents = repo.iter_company_documents(
+            batch["company_name"],
+            processing_status=filters.get("processing_status"),
+            uploaded_after=_local_time(filters.get("uploaded_after")),
+            uploaded_before=_local_time(filters.get("uploaded_before")),
+            fields=DOCUMENT_FIELDS
+        )
+
+    selected = []
+    for document_data in documents:
+        if document_data.get("processing_status") in (DocumentStatus.PROCESSING, DocumentStatus.DELETED):
+            continue
+        if filters.get("stale_only") and not is_analysis_stale(document_data):
+            continue
+        selected.append(document_data)
+        if len(selected) >= BULK_ANALYSIS_MAX_DOCUMENTS:
+            break
+    return selected
+
+
+def group_by_content(documents: List[dict]) -> List[List[dict]]:
+    """Documents with the same content, analyzed once per group.
+
+    Text is hashed here; files use the hash recorded by an earlier analysis
+    (files never analyzed are their own group, the analysis cache still
+    catches repeats once one copy is done).
+    """
+    groups: Dict[str, List[dict]] = {}
+    for document_data in documents:
+        if document_data.get("content_type", ContentType.FILE) == ContentType.TEXT and document_data.get("content"):
+            key = "text:" + content_hash(document_data["content"])
+        elif document_data.get("content_hash"):
+            key = "file:" + document_data["content_hash"]
+        else:
+            key = "doc:" + document_data["document_id"]
+        groups.setdefault(key, []).append(document_data)
+    return list(groups.values())
+
+
+def _status_update(document_data: dict, update: dict) -> dict:
+    if document_data.get("processing_status") in KEEP_STATUSES:
+        return {field: value for field, value in update.items() if field != "processing_status"}
+    return update
+
+
+def _owned_by_job(document_data: dict) -> bool:
+    """A single-document analysis job is queued or running on the document"""
+    # enqueue_analysis moves the document to PENDING; finished jobs leave it in any status
+    if document_data.get("processing_status") not in (DocumentStatus.PENDING, DocumentStatus.PROCESSING):
+        return False
+    job_id = document_data.get("analysis_job_id")
+    if not job_id:
+        return False
+    job_data = get_repository().get_job(job_id)
+    return bool(job_data) and job_data.get("status") in ACTIVE_JOB_STATUSES and not is_job_stale(job_data)
+
+
+def _analyze_group(group: List[dict]) -> dict:
+    """Analyze a group, skipping documents a single-document job owns.
+
+    Returns the batch counts for the group, plus "error" if its analysis failed.
+    """
+    # Re-read now rather than trust the selection: a job may have been queued since
+    current = get_repository().get_documents_by_ids([d["document_id"] for d in group])
+    free = [d for d in current
+            if d.get("processing_status") != DocumentStatus.DELETED and not _owned_by_job(d)]
+    outcome = {"skipped": len(group) - len(free)}
+    if free:
+        try:
+            outcome.update(_analyze_documents(free))
+        except Exception as e:
+            _fail_group(free, e)
+            outcome.update(failed=len(free), error=e)
+    return outcome
+
+
+def _analyze_documents(group: List[dict]) -> Dict[str, int]:
+    """Analyze the first document of a group and write the result to all of them"""
+    lead = group[0]
+    repo = get_repository()
+    outcome = {"deduplicated": len(group) - 1}
+
+    cached = cached_analysis_for(lead)
+    if cached:
+        outcome["cached"] = 1
+        analysis_data, digest = cached
+    else:
+        outcome["analyzed"] = 1
+        repo.update_documents([(d["document_id"], {"processing_status": DocumentStatus.PROCESSING})
+                               for d in group if d.get("processing_status") not in KEEP_STATUSES])
+        attempts = 0
+        while True:
+            try:
+                analysis_data, digest = run_document_analysis(lead)
+                break
+            except OverloadedError as e:
+                attempts += 1
+                if attempts >= ANALYSIS_JOB_MAX_ATTEMPTS:
+                    raise
+                # Rate limited or circuit open: this worker waits instead of failing the batch
+                time.sleep(e.retry_after)
+
+    update = build_analysis_update(analysis_data, digest)
+    repo.update_documents([(d["document_id"], _status_update(d, update)) for d in group])
+    return outcome
+
+
+def _fail_group(group: List[dict], error: Exception):
+    try:
+        update = {"processing_status": DocumentStatus.PENDING, "error_message": str(error)}
+        get_repository().update_documents([(d["document_id"], _status_update(d, update)) for d in group])
+    except Exception as e:
+        logger.error("Failed to reset documents after bulk analysis error", extra={"error": str(e)})
+
+
+def _flush(batch: dict, **extra):
+    update = {field: batch[field] for field in PROGRESS_FIELDS}
+    update["errors"] = list(batch["errors"])
+    update["lease_expires_at"] = lease_expiry()
+    update.update(extra)
+    get_repository().update_batch(batch["batch_id"], update)
+
+
+def run_batch(batch_id: str):
+    """Worker entry point: analyze every document in the batch"""
+    claim = {"status": JobStatus.RUNNING, "started_at": datetime.now(), "lease_expires_at": lease_expiry()}
+    batch = get_repository().claim_batch(batch_id, claim)
+    if batch is None:
+        # Missing, or already picked up (e.g. broker redelivery, requeued at startup)
+        return
+    batch.update(claim)
+    with _live_lock:
+        _live[batch_id] = batch
+
+    futures = {}
+    try:
+        documents = select_documents(batch)
+        groups = group_by_content(documents)
+        with _live_lock:
+            batch["total"] = len(documents)
+        _flush(batch)
+
+        last_flush = time.monotonic()
+        pool = _get_analysis_executor()
+        futures = {pool.submit(_analyze_group, group): group for group in groups}
+        pending = set(futures)
+        while pending:
+            # Wakes up at least every flush interval: the flush renews the lease
+            # while this batch waits behind other batches in the shared pool
+            done, pending = wait(pending, timeout=PROGRESS_FLUSH_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                group = futures[future]
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    # The documents could not be read: nothing was written to them
+                    outcome = {"failed": len(group), "error": e}
+                error = outcome.pop("error", None)
+                if error is not None:
+                    logger.warning("Bulk analysis of a document failed", extra={
+                        "batch_id": batch_id, "document_id": group[0]["document_id"], "error": str(error)
+                    })
+                    with _live_lock:
+                        if len(batch["errors"]) < MAX_RECORDED_ERRORS:
+                            batch["errors"].append({"document_id": group[0]["document_id"], "error": str(error)})
+                with _live_lock:
+                    batch["processed"] += len(group)
+                    for field, count in outcome.items():
+                        batch[field] += count
+            if time.monotonic() - last_flush >= PROGRESS_FLUSH_SECONDS:
+                _flush(batch)
+                last_flush = time.monotonic()
+
+        with _live_lock:
+            batch.update(status=JobStatus.SUCCEEDED, finished_at=datetime.now())
+        _flush(batch, status=JobStatus.SUCCEEDED, finished_at=batch["finished_at"])
+    except Exception as e:
+        logger.exception("Bulk analysis failed", extra={"batch_id": batch_id})
+        # Documents still waiting in the shared pool are not analyzed for a failed batch
+        for future in futures:
+            future.cancel()
+        with _live_lock:
+            batch.update(status=JobStatus.FAILED, finished_at=datetime.now(), error_message=str(e))
+        _flush(batch, status=JobStatus.FAILED, finished_at=batch["finished_at"], error_message=str(e))
+    finally:
+        with _live_lock:
+            _live.pop(batch_id, None)
+
+
+def progress_event(batch: dict) -> dict:
+    """The public progress view of a batch (what the SSE stream sends)"""
+    return {
+        "batch_id": batch["batch_id"],
+        "status": batch["status"],
+        **{field: batch.get(field, 0) for field in PROGRESS_FIELDS},
+        "errors": batch.get("errors", []),
+        "error_message": batch.get("error_message")
+    }
@@ -0,0 +1,163 @@
+# chunking.py - Map-reduce analysis of long documents
+#
+# Long text is split on page, then paragraph, then line boundaries into chunks
+# of at most ANALYSIS_CHUNK_TOKENS (estimated at CHARS_PER_TOKEN characters per
+# token). Chunks are analyzed concurrently, with at most ANALYSIS_CHUNK_WORKERS
+# model calls in flight per process. The per-chunk results are then merged
+# locally into one analysis with the usual schema. Latency follows the slowest
+# chunk, not the document length.
+import contextvars
+import os
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+ANALYSIS_CHUNK_TOKENS = int(os.getenv("ANALYSIS_CHUNK_TOKENS", "8000"))
+ANALYSIS_CHUNK_WORKERS = int(os.getenv("ANALYSIS_CHUNK_WORKERS", "4"))
+CHARS_PER_TOKEN = 4
+# Merged results keep at most this many findings and summary characters
+MAX_MERGED_FINDINGS = 15
+MAX_MERGED_SUMMARY_CHARS = 1500
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+_chunk_pool = None
+
+
+def _get_chunk_pool() -> ThreadPoolExecutor:
+    global _chunk_pool
+    if _chunk_pool is None:
+        _chunk_pool = ThreadPoolExecutor(max_workers=ANALYSIS_CHUNK_WORKERS, thread_name_prefix="analysis-chunk")
+    return _chunk_pool
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _split_segment(text: str, max_chars: int) -> List[str]:
+    """Split one oversized piece on paragraphs, then lines, then whitespace"""
+    if len(text) <= max_chars:
+        return [text]
+    for parts in (_PARAGRAPH_BREAK.split(text), text.split("\n")):
+        if len(parts) > 1:
+            return [piece for part in parts if part.strip() for piece in _split_segment(part, max_chars)]
+
+    # A single run-on line: cut at the last whitespace before the limit
+    pieces = []
+    while len(text) > max_chars:
+        cut = text.rfind(" ", 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(text[:cut])
+        text = text[cut:].lstrip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def split_into_chunks(pages: List[str], max_tokens: int = ANALYSIS_CHUNK_TOKENS) -> List[str]:
+    """Pack page texts into chunks of at most max_tokens, keeping boundaries"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks, current, current_len = [], [], 0
+    for page in pages:
+        page = page.strip()
+        if not page:
+            continue
+        for segment in _split_segment(page, max_chars):
+            # +2 for the "\n\n" joining segments
+            if current and current_len + len(segment) + 2 > max_chars:
+                chunks.append("\n\n".join(current))
+                current, current_len = [], 0
+            current.append(segment)
+            current_len += len(segment) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _dedupe(items: List[str]) -> List[str]:
+    seen, result = set(), []
+    for item in items:
+        key = " ".join(str(item).lower().split())
+        if key and key not in seen:
+            seen.add(key)
+            result.append(item)
+    return result
+
+
+def _score(value, default: float = 0) -> float:
+    """A 0-100 score from whatever the model returned"""
+    try:
+        return min(100.0, max(0.0, float(value)))
+    except (TypeError, ValueError):
+        return default
+
+
+def merge_analyses(results: List[dict], weights: List[int]) -> dict:
+    """Combine per-chunk analyses (weights: chunk lengths) into one"""
+    if len(results) == 1:
+        return results[0]
+    total_weight = sum(weights) or 1
+
+    # The document is as urgent/important as its most urgent/important part
+    urgency = max(_score(r.get("urgency_score")) for r in results)
+    importance = max(_score(r.get("importance_score")) for r in results)
+    confidence = sum(_score(r.get("confidence")) * w for r, w in zip(results, weights)) / total_weight
+
+    type_votes = Counter()
+    for result, weight in zip(results, weights):
+        if result.get("document_type") and result["document_type"] != "Unknown":
+            type_votes[result["document_type"]] += weight
+    document_type = type_votes.most_common(1)[0][0] if type_votes else "Unknown"
+
+    departments = _dedupe([d for r in results for d in (r.get("departments_responsible") or [])])
+    findings = _dedupe([f for r in results for f in (r.get("key_findings") or [])])
+
+    summary = " ".join(r.get("summary", "").strip() for r in results if r.get("summary"))
+    if len(summary) > MAX_MERGED_SUMMARY_CHARS:
+        # Cut at the last sentence end that fits
+        cut = summary.rfind(". ", 0, MAX_MERGED_SUMMARY_CHARS)
+        summary = summary[:cut + 1] if cut > 0 else summary[:MAX_MERGED_SUMMARY_CHARS]
+
+    merged = {
+        "summary": summary,
+        "document_type": document_type,
+        "key_findings": findings[:MAX_MERGED_FINDINGS],
+        "urgency_score": round(urgency),
+        "importance_score": round(importance),
+        "departments_responsible": departments,
+        "confidence": round(confidence)
+    }
+    # Any part answered by a fallback provider makes the whole result a fallback
+    fallbacks = _dedupe([r["fallback"] for r in results if r.get("fallback")])
+    if fallbacks:
+        merged["fallback"] = ",".join(fallbacks)
+    return merged
+
+
+def analyze_in_chunks(
+    pages: List[str],
+    analyze_chunk: Callable[[str, int, int], dict],
+    max_tokens: int = ANALYSIS_CHUNK_TOKENS,
+) -> dict:
+    """Split pages into chunks, analyze them concurrently and merge the results.
+
+    analyze_chunk(text, part, total) analyzes one chunk (part is 1-based).
+    Short documents are a single chunk and a single call.
+    """
+    chunks = split_into_chunks(pages, max_tokens)
+    if not chunks:
+        raise ValueError("No text to analyze")
+    if len(chunks) == 1:
+        return analyze_chunk(chunks[0], 1, 1)
+
+    total = len(chunks)
+    # Each chunk runs in a copy of the caller's context (request metrics)
+    futures = [
+        _get_chunk_pool().submit(contextvars.copy_context().run, analyze_chunk, chunk, part, total)
+        for part, chunk in enumerate(chunks, start=1)
+    ]
+    results = [future.result() for future in futures]
+    return merge_analyses(results, [len(chunk) for chunk in chunks])
@@ -0,0 +1,200 @@
+# fetch.py - Shared HTTP session and single-download file fetching
+#
+# All outbound HTTP (Cloudinary downloads, Resend) goes through one pooled
+# keep-alive session with timeouts and retries. fetch_file() downloads a file
+# once per analysis into a spooled temp file (memory below
+# FETCH_SPOOL_MAX_MEMORY, disk above) that every extractor reads from.
+#
+# Set FETCH_BLOB_CACHE_DIR to keep a local copy of downloaded files keyed by
+# URL; cached copies are revalidated with the stored ETag (If-None-Match).
+# requests is imported with the first session, not at import.
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from typing import TYPE_CHECKING, Optional
+
+from dotenv import load_dotenv
+
+import metrics
+
+if TYPE_CHECKING:
+    import requests
+
+load_dotenv()
+
+FETCH_CONNECT_TIMEOUT = float(os.getenv("FETCH_CONNECT_TIMEOUT", "5"))
+FETCH_READ_TIMEOUT = float(os.getenv("FETCH_READ_TIMEOUT", "60"))
+FETCH_RETRIES = int(os.getenv("FETCH_RETRIES", "3"))
+FETCH_POOL_SIZE = int(os.getenv("FETCH_POOL_SIZE", "20"))
+FETCH_SPOOL_MAX_MEMORY = int(os.getenv("FETCH_SPOOL_MAX_MEMORY", str(8 * 1024 * 1024)))
+FETCH_BLOB_CACHE_DIR = os.getenv("FETCH_BLOB_CACHE_DIR")
+
+DEFAULT_TIMEOUT = (FETCH_CONNECT_TIMEOUT, FETCH_READ_TIMEOUT)
+_CHUNK_SIZE = 1024 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def http_session() -> "requests.Session":
+    """Process-wide pooled keep-alive session"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                # Status/read retries only for idempotent methods; connection
+                # errors (nothing sent yet) are retried for every method
+                retry = Retry(
+                    total=FETCH_RETRIES,
+                    backoff_factor=0.5,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset({"GET", "HEAD"}),
+                    respect_retry_after_header=True
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=FETCH_POOL_SIZE,
+                    pool_maxsize=FETCH_POOL_SIZE,
+                    max_retries=retry
+                )
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+class FetchedFile:
+    """A downloaded file: hashed once, readable as bytes or from a path"""
+
+    def __init__(self, url: str, sha256: str, size: int, content_type: Optional[str],
+                 etag: Optional[str] = None, spool=None, path: Optional[str] = None):
+        self.url = url
+        self.sha256 = sha256
+        self.size = size
+        self.content_type = content_type
+        self.etag = etag
+        self._spool = spool
+        self._path = path
+        self._temp_path = None
+
+    def copy_to(self, fileobj):
+        """Write the content to a binary file object"""
+        if self._spool is not None:
+            self._spool.seek(0)
+            shutil.copyfileobj(self._spool, fileobj)
+        else:
+            with open(self._path, "rb") as f:
+                shutil.copyfileobj(f, fileobj)
+
+    def read(self) -> bytes:
+        if self._spool is not None:
+            self._spool.seek(0)
+            return self._spool.read()
+        with open(self._path, "rb") as f:
+            return f.read()
+
+    def path(self) -> str:
+        """Filesystem path of the content (written to a temp file on first use if needed)"""
+        if self._path:
+            return self._path
+        if self._temp_path is None:
+            with tempfile.NamedTemporaryFile(delete=False) as tmp:
+                self.copy_to(tmp)
+                self._temp_path = tmp.name
+        return self._temp_path
+
+    def close(self):
+        if self._spool is not None:
+            self._spool.close()
+        if self._temp_path:
+            os.unlink(self._temp_path)
+            self._temp_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _blob_paths(url: str):
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    base = os.path.join(FETCH_BLOB_CACHE_DIR, key[:2], key)
+    return base + ".blob", base + ".json"
+
+
+def _read_blob_meta(meta_path: str) -> Optional[dict]:
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def fetch_file(url: str, timeout=DEFAULT_TIMEOUT) -> FetchedFile:
+    """Download url once (or reuse the blob cache) and return a FetchedFile"""
+    headers = {}
+    blob_path = meta_path = meta = None
+    if FETCH_BLOB_CACHE_DIR:
+        blob_path, meta_path = _blob_paths(url)
+        meta = _read_blob_meta(meta_path)
+        if meta and meta.get("etag") and os.path.exists(blob_path):
+            headers["If-None-Match"] = meta["etag"]
+
+    with http_session().get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 304 and meta:
+            return FetchedFile(url, meta["sha256"], meta["size"], meta.get("content_type"),
+                               etag=meta.get("etag"), path=blob_path)
+        response.raise_for_status()
+
+        digest = hashlib.sha256()
+        size = 0
+        spool = tempfile.SpooledTemporaryFile(max_size=FETCH_SPOOL_MAX_MEMORY)
+        for chunk in response.iter_content(_CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+            spool.write(chunk)
+        metrics.record_download(size)
+
+        fetched = FetchedFile(
+            url,
+            digest.hexdigest(),
+            size,
+            response.headers.get("Content-Type"),
+            etag=response.headers.get("ETag"),
+            spool=spool
+        )
+
+    if FETCH_BLOB_CACHE_DIR and fetched.etag:
+        try:
+            _store_blob(fetched, blob_path, meta_path)
+        except OSError as e:
+            logger.warning("Blob cache write failed", extra={"url": url, "error": str(e)})
+    return fetched
+
+
+def _store_blob(fetched: FetchedFile, blob_path: str, meta_path: str):
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+    # Write then rename so concurrent readers never see a partial blob
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(blob_path), delete=False) as tmp:
+        fetched.copy_to(tmp)
+    os.replace(tmp.name, blob_path)
+    with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(meta_path), delete=False) as tmp:
+        json.dump({
+            "url": fetched.url,
+            "etag": fetched.etag,
+            "sha256": fetched.sha256,
+            "size": fetched.size,
+            "content_type": fetched.content_type
+        }, tmp)
+    os.replace(tmp.name, meta_path)
@@ -11,22 +11,35 @@ load_dotenv()
 
 # Read Firebase service account JSON from env
 firebase_json = os.getenv("FIREBASE_SERVICE_ACCOUNT")
+# The Firestore emulator needs no credentials, only a project id
+FIRESTORE_EMULATOR_HOST = os.getenv("FIRESTORE_EMULATOR_HOST")
+# DATA_BACKEND=memory (see repository.py) runs without Firebase: db and bucket stay None
+DATA_BACKEND = os.getenv("DATA_BACKEND", "firestore").lower()
 
-if not firebase_json:
-    raise RuntimeError("❌ FIREBASE_SERVICE_ACCOUNT env variable is missing")
+db = None
+bucket = None
 
-# Initialize Firebase only once
-if not firebase_admin._apps:
-    cred = credentials.Certificate(json.loads(firebase_json))
-    firebase_admin.initialize_app(
-        cred,
-        {
-            "storageBucket": os.getenv("STORAGE_BUCKET")
-        }
-    )
+if DATA_BACKEND == "memory":
+    pass
+elif firebase_json:
+    # Initialize Firebase only once
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(json.loads(firebase_json))
+        firebase_admin.initialize_app(
+            cred,
+            {
+                "storageBucket": os.getenv("STORAGE_BUCKET")
+            }
+        )
 
-# Firestore client
-db = firestore.client()
+    # Firestore client
+    db = firestore.client()
 
-# Storage bucket client
-bucket = storage.bucket()
+    # Storage bucket client
+    bucket = storage.bucket()
+elif FIRESTORE_EMULATOR_HOST:
+    from google.cloud import firestore as cloud_firestore
+    db = cloud_firestore.Client(project=os.getenv("GOOGLE_CLOUD_PROJECT", "demo-documind"))
+else:
+    raise RuntimeError("❌ FIREBASE_SERVICE_ACCOUNT env variable is missing "
+                       "(set FIRESTORE_EMULATOR_HOST for the emulator or DATA_BACKEND=memory)")
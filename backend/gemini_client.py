@@ -0,0 +1,336 @@
+# gemini_client.py - Rate-limited, retrying, concurrency-bounded Gemini calls
+#
+# Every generate_content call goes through GeminiClient.generate:
+#   1. a circuit breaker fails fast (CircuitOpenError) while Gemini is down,
+#      so a FailoverProvider moves on and routes answer 503 instead of hanging
+#   2. token buckets hold calls back to GEMINI_RPM requests/min and GEMINI_TPM
+#      tokens/min; a call that would wait longer than GEMINI_LIMITER_MAX_WAIT
+#      is rejected with RateLimitedError instead of queueing
+#   3. a semaphore caps calls in flight at GEMINI_MAX_CONCURRENCY
+#   4. 429/5xx/timeouts are retried with exponential backoff and full jitter
+#
+# Analysis runs on worker threads (chunk pool, job executor, Celery), so the
+# limits are thread-safe and per process: with N workers, set each to 1/N of
+# the project quota. 0 disables the RPM/TPM limits.
+import logging
+import os
+import random
+import threading
+import time
+from typing import Optional, Tuple
+
+from dotenv import load_dotenv
+
+import metrics
+from chunking import estimate_tokens
+
+load_dotenv()
+
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "60"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "120"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "4"))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "1"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "30"))
+GEMINI_LIMITER_MAX_WAIT = float(os.getenv("GEMINI_LIMITER_MAX_WAIT", "60"))
+GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))
+GEMINI_BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+
+# Gemini bills an image as a fixed number of input tokens
+IMAGE_TOKENS = 258
+# Latency histogram bucket upper bounds (seconds)
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float("inf"))
+
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+class OverloadedError(Exception):
+    """Gemini cannot take the call now; retry after retry_after seconds"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitedError(OverloadedError):
+    pass
+
+
+class CircuitOpenError(OverloadedError):
+    pass
+
+
+def is_retryable(error: Exception) -> bool:
+    """429s, server errors, timeouts and connection failures are worth retrying"""
+    status = getattr(error, "code", None)
+    if isinstance(status, int):
+        return status in _RETRYABLE_STATUS
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+
+def estimate_request_tokens(contents) -> int:
+    parts = contents if isinstance(contents, list) else [contents]
+    return sum(estimate_tokens(part) if isinstance(part, str) else IMAGE_TOKENS for part in parts)
+
+
+def usage_tokens(response) -> Tuple[int, int]:
+    """(input, output) tokens from a response's usage_metadata (0 if not reported)"""
+    usage = getattr(response, "usage_metadata", None)
+    counts = (getattr(usage, "prompt_token_count", 0), getattr(usage, "candidates_token_count", 0))
+    return tuple(count if isinstance(count, int) else 0 for count in counts)
+
+
+class TokenBucket:
+    """Continuous-refill bucket; callers reserve capacity and sleep off any debt"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take amount (going into debt if needed); returns seconds to wait"""
+        # A single request larger than the bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def refund(self, amount: float):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+    def debit(self, amount: float):
+        """Charge usage reported after the call (no waiting)"""
+        with self._lock:
+            self.tokens -= amount
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+
+class CircuitBreaker:
+    """closed -> open after `threshold` consecutive failures -> half-open after
+    `cooldown` (one trial call) -> closed on success, open again on failure"""
+
+    def __init__(self, threshold: int = GEMINI_BREAKER_THRESHOLD, cooldown: float = GEMINI_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_count = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return
+            raise CircuitOpenError("Gemini circuit breaker is open", retry_after=max(remaining, 1.0))
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    self.opened_count += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """The call ended without telling us anything about Gemini's health"""
+        with self._lock:
+            self._trial_running = False
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self.counts[index] += 1
+                    break
+            self.total += seconds
+            self.count += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "count": self.count,
+                "sum_seconds": round(self.total, 3),
+                "buckets": {("+Inf" if bound == float("inf") else str(bound)): count
+                            for bound, count in zip(self.buckets, self.counts)}
+            }
+
+
+class GeminiClient:
+    def __init__(self, model, rpm: int = GEMINI_RPM, tpm: int = GEMINI_TPM,
+                 max_concurrency: int = GEMINI_MAX_CONCURRENCY, timeout: float = GEMINI_TIMEOUT,
+                 max_retries: int = GEMINI_MAX_RETRIES, breaker: Optional[CircuitBreaker] = None):
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.request_bucket = TokenBucket(rpm) if rpm > 0 else None
+        self.token_bucket = TokenBucket(tpm) if tpm > 0 else None
+        self.breaker = breaker or CircuitBreaker()
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.latency = {"success": LatencyHistogram(), "error": LatencyHistogram()}
+        self._counters = {
+            "calls": 0, "succeeded": 0, "failed": 0, "retries": 0, "in_flight": 0,
+            "throttled": 0, "throttle_wait_seconds": 0.0, "rate_limited": 0, "circuit_rejected": 0,
+            "tokens_reported": 0
+        }
+        self._lock = threading.Lock()
+
+    def _count(self, counter: str, amount=1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    def _acquire_rate(self, tokens: int):
+        """Wait for request and token capacity, or raise RateLimitedError"""
+        reserved = []
+        wait = 0.0
+        for bucket, amount in ((self.request_bucket, 1), (self.token_bucket, tokens)):
+            if bucket is not None:
+                wait = max(wait, bucket.reserve(amount))
+                reserved.append((bucket, amount))
+        if wait > GEMINI_LIMITER_MAX_WAIT:
+            for bucket, amount in reserved:
+                bucket.refund(amount)
+            self._count("rate_limited")
+            raise RateLimitedError(f"Gemini rate limit reached; retry in {wait:.0f}s", retry_after=wait)
+        if wait > 0:
+            self._count("throttled")
+            self._count("throttle_wait_seconds", wait)
+            time.sleep(wait)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter spreads out retries from calls that failed together
+        return random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * 2 ** attempt))
+
+    def generate(self, contents, **kwargs):
+        """model.generate_content with rate limiting, retries and the circuit breaker"""
+        tokens = estimate_request_tokens(contents)
+        self._count("calls")
+        attempt = 0
+        while True:
+            try:
+                self.breaker.before_call()
+            except CircuitOpenError:
+                self._count("circuit_rejected")
+                raise
+            try:
+                self._acquire_rate(tokens)
+            except RateLimitedError:
+                self.breaker.release()
+                raise
+
+            with self._semaphore:
+                self._count("in_flight")
+                start = time.perf_counter()
+                try:
+                    response = self.model.generate_content(
+                        contents, request_options={"timeout": self.timeout}, **kwargs
+                    )
+                except Exception as e:
+                    elapsed = time.perf_counter() - start
+                    self.latency["error"].observe(elapsed)
+                    metrics.record_gemini_call(elapsed)
+                    error = e
+                else:
+                    elapsed = time.perf_counter() - start
+                    self.latency["success"].observe(elapsed)
+                    metrics.record_gemini_call(elapsed, *usage_tokens(response))
+                    error = None
+                finally:
+                    self._count("in_flight", -1)
+
+            if error is None:
+                self.breaker.record_success()
+                self._count("succeeded")
+                self._reconcile_tokens(response, tokens)
+                return response
+
+            if not is_retryable(error):
+                # The request itself was bad; says nothing about Gemini's health
+                self.breaker.release()
+                self._count("failed")
+                raise error
+            self.breaker.record_failure()
+            if attempt >= self.max_retries:
+                self._count("failed")
+                raise error
+            delay = self._backoff(attempt)
+            logger.warning("Gemini call failed; retrying", extra={
+                "error": str(error), "retry": attempt + 1, "max_retries": self.max_retries,
+                "delay_seconds": round(delay, 1)
+            })
+            self._count("retries")
+            attempt += 1
+            time.sleep(delay)
+
+    def _reconcile_tokens(self, response, estimated: int):
+        # Charge what the call actually used (including output) beyond the estimate
+        usage = getattr(response, "usage_metadata", None)
+        total = getattr(usage, "total_token_count", None)
+        if not isinstance(total, int):
+            return
+        self._count("tokens_reported", total)
+        if self.token_bucket is not None and total > estimated:
+            self.token_bucket.debit(total - estimated)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        counters["throttle_wait_seconds"] = round(counters["throttle_wait_seconds"], 3)
+        return {
+            **counters,
+            "max_concurrency": self.max_concurrency,
+            "limiter": {
+                "requests_per_minute": self.request_bucket.capacity if self.request_bucket else None,
+                "requests_available": round(self.request_bucket.available(), 2) if self.request_bucket else None,
+                "tokens_per_minute": self.token_bucket.capacity if self.token_bucket else None,
+                "tokens_available": round(self.token_bucket.available()) if self.token_bucket else None
+            },
+            "breaker": {
+                "state": self.breaker.state,
+                "consecutive_failures": self.breaker.failures,
+                "times_opened": self.breaker.opened_count
+            },
+            "latency": {outcome: histogram.snapshot() for outcome, histogram in self.latency.items()}
+        }
@@ -0,0 +1,222 @@
+# jobs.py - Background document analysis jobs
+#
+# Routes enqueue analysis here and return a job id immediately. A worker then
+# drives the document PENDING -> PROCESSING -> ANALYZED and records the outcome
+# on the job so clients can poll GET /jobs/{job_id}.
+#
+# ANALYSIS_EXECUTOR=celery dispatches to the Celery workers in tasks.py,
+# anything else runs jobs on an in-process thread pool (single-node deployments).
+#
+# Active jobs hold a lease (lease_expires_at, ANALYSIS_JOB_LEASE_SECONDS past
+# the last queue or claim). A job whose worker died (process restart, lost
+# broker message) is never finished, so once its lease has expired
+# enqueue_analysis fails it and starts a new job instead of returning it. The
+# local executor's queue lives in memory: requeue_local_jobs() redispatches
+# its QUEUED jobs when the API starts.
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+from models import AnalysisJob, DocumentStatus, JobStatus
+from analysis import run_document_analysis, build_analysis_update, OverloadedError
+from repository import get_repository
+
+ANALYSIS_EXECUTOR = os.getenv("ANALYSIS_EXECUTOR", "local").lower()
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "4"))
+# Jobs that hit Gemini rate limits or an open circuit are requeued this many times
+ANALYSIS_JOB_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_JOB_MAX_ATTEMPTS", "3"))
+# Longer than any one analysis should take (OCR of a long scan included)
+ANALYSIS_JOB_LEASE_SECONDS = int(os.getenv("ANALYSIS_JOB_LEASE_SECONDS", "900"))
+
+ACTIVE_JOB_STATUSES = (JobStatus.QUEUED, JobStatus.RUNNING)
+
+logger = logging.getLogger(__name__)
+
+_local_executor = None
+
+
+def _get_local_executor():
+    global _local_executor
+    if _local_executor is None:
+        _local_executor = ThreadPoolExecutor(
+            max_workers=ANALYSIS_WORKERS,
+            thread_name_prefix="analysis"
+        )
+    return _local_executor
+
+
+def _dispatch(job_id: str, delay: float = 0):
+    """Hand a queued job to the configured executor (after delay seconds)"""
+    if ANALYSIS_EXECUTOR == "celery":
+        # Imported lazily: tasks imports this module
+        from tasks import analyze_document_task
+        analyze_document_task.apply_async((job_id,), countdown=delay or None)
+    elif delay:
+        timer = threading.Timer(delay, _get_local_executor().submit, (run_analysis_job, job_id))
+        timer.daemon = True
+        timer.start()
+    else:
+        _get_local_executor().submit(run_analysis_job, job_id)
+
+
+def lease_expiry(seconds_from_now: float = 0) -> datetime:
+    """When a lease taken now (and starting seconds_from_now) runs out"""
+    return datetime.now() + timedelta(seconds=seconds_from_now + ANALYSIS_JOB_LEASE_SECONDS)
+
+
+def is_job_stale(job_data: dict) -> bool:
+    """An active job whose lease has expired (its worker is presumed gone)"""
+    if job_data.get("status") not in ACTIVE_JOB_STATUSES:
+        return False
+    # Jobs queued before leases existed: measured from the last start or creation
+    expires = job_data.get("lease_expires_at") or (
+        (job_data.get("started_at") or job_data["created_at"]) + timedelta(seconds=ANALYSIS_JOB_LEASE_SECONDS)
+    )
+    return _naive(expires) < datetime.now()
+
+
+def _naive(value: datetime) -> datetime:
+    # Firestore returns tz-aware UTC datetimes; jobs are written with naive local time
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    """Return the job record or None"""
+    return get_repository().get_job(job_id)
+
+
+def enqueue_analysis(document_id: str, document_data: dict, requested_by: str) -> dict:
+    """Queue a document for analysis and return its job record.
+
+    If the document already has a queued or running job, that job is returned
+    instead of starting a second analysis, unless its lease has expired: then
+    it is failed and replaced.
+    """
+    active_job_id = document_data.get("analysis_job_id")
+    if active_job_id:
+        active_job = get_job(active_job_id)
+        if active_job and active_job.get("status") in ACTIVE_JOB_STATUSES:
+            if not is_job_stale(active_job):
+                return active_job
+            logger.warning("Replacing stale analysis job", extra={
+                "job_id": active_job_id, "document_id": document_id, "status": active_job.get("status")
+            })
+            get_repository().update_job(active_job_id, {
+                "status": JobStatus.FAILED,
+                "finished_at": datetime.now(),
+                "error_message": "Lease expired (worker lost)"
+            })
+
+    job = AnalysisJob(
+        job_id=str(uuid.uuid4()),
+        document_id=document_id,
+        company_name=document_data["company_name"],
+        requested_by=requested_by,
+        executor="celery" if ANALYSIS_EXECUTOR == "celery" else "local",
+        created_at=datetime.now(),
+        lease_expires_at=lease_expiry()
+    )
+    job_data = job.dict()
+
+    repo = get_repository()
+    repo.create_job(job_data)
+    repo.update_document(document_id, {
+        "processing_status": DocumentStatus.PENDING,
+        "analysis_job_id": job.job_id
+    })
+
+    _dispatch(job.job_id)
+    return job_data
+
+
+def run_analysis_job(job_id: str):
+    """Worker entry point: analyze the job's document and record the outcome"""
+    repo = get_repository()
+    job_data = repo.claim_job(job_id, {
+        "status": JobStatus.RUNNING,
+        "started_at": datetime.now(),
+        "lease_expires_at": lease_expiry()
+    })
+    if job_data is None:
+        # Missing, or already picked up by another worker (e.g. broker redelivery)
+        return
+
+    document_id = job_data["document_id"]
+    try:
+        document_data = repo.get_document(document_id)
+        if document_data is None:
+            repo.update_job(job_id, {
+                "status": JobStatus.FAILED,
+                "finished_at": datetime.now(),
+                "error_message": "Document not found"
+            })
+            return
+
+        repo.update_document(document_id, {"processing_status": DocumentStatus.PROCESSING})
+        analysis_data, digest = run_document_analysis(document_data)
+        repo.update_document(document_id, build_analysis_update(analysis_data, digest))
+        repo.update_job(job_id, {
+            "status": JobStatus.SUCCEEDED,
+            "finished_at": datetime.now(),
+            "result": analysis_data
+        })
+    except OverloadedError as e:
+        attempts = job_data.get("attempts", 0) + 1
+        if attempts >= ANALYSIS_JOB_MAX_ATTEMPTS:
+            _fail_job(job_id, document_id, e)
+            return
+        logger.warning("Analysis job deferred", extra={
+            "job_id": job_id, "attempt": attempts, "retry_after": round(e.retry_after), "error": str(e)
+        })
+        repo.update_document(document_id, {"processing_status": DocumentStatus.PENDING})
+        repo.update_job(job_id, {
+            "status": JobStatus.QUEUED,
+            "attempts": attempts,
+            "started_at": None,
+            "lease_expires_at": lease_expiry(e.retry_after),
+            "error_message": str(e)
+        })
+        _dispatch(job_id, delay=e.retry_after)
+    except Exception as e:
+        _fail_job(job_id, document_id, e)
+
+
+def _fail_job(job_id: str, document_id: str, e: Exception):
+    logger.error("Analysis job failed", extra={"job_id": job_id, "error": str(e)})
+    repo = get_repository()
+    # The job first: it must not stay RUNNING if the document write fails too
+    repo.update_job(job_id, {
+        "status": JobStatus.FAILED,
+        "finished_at": datetime.now(),
+        "error_message": str(e)
+    })
+    try:
+        repo.update_document(document_id, {
+            "processing_status": DocumentStatus.PENDING,
+            "error_message": str(e)
+        })
+    except Exception as update_error:
+        logger.error("Failed to reset document after analysis error", extra={
+            "job_id": job_id, "document_id": document_id, "error": str(update_error)
+        })
+
+
+def requeue_local_jobs() -> int:
+    """Redispatch the QUEUED jobs of the in-process executor (its queue and
+    retry timers do not survive a restart); returns how many were requeued.
+
+    Called at API startup. With several API workers the same job can be
+    dispatched twice; claim_job lets only one of them run it.
+    """
+    if ANALYSIS_EXECUTOR == "celery":
+        return 0
+    jobs = get_repository().list_jobs(JobStatus.QUEUED, "local")
+    for job_data in jobs:
+        _dispatch(job_data["job_id"])
+    if jobs:
+        logger.info("Requeued analysis jobs", extra={"jobs": len(jobs)})
+    return len(jobs)
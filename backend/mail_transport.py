@@ -0,0 +1,320 @@
+# mail_transport.py - Pooled SMTP sessions and batch sending for outgoing mail
+#
+# SMTPPool keeps up to SMTP_POOL_SIZE logged-in SMTP connections per process
+# and reuses them across messages, instead of a TLS handshake and login per
+# message:
+#   - a connection idle for more than SMTP_IDLE_CHECK_SECONDS is probed with
+#     NOOP before reuse (servers drop idle sessions)
+#   - a connection is closed after SMTP_MAX_MESSAGES_PER_CONNECTION messages
+#     (providers cap messages per session)
+#   - a message whose connection broke is sent once more on a fresh
+#     connection; refused senders/recipients are not retried
+# ResendTransport posts single messages to /emails and send_many() to
+# /emails/batch, RESEND_BATCH_SIZE messages per call.
+#
+# get_transport() picks Resend when RESEND_API_KEY and RESEND_FROM are set and
+# SMTP otherwise. It is created once per process, so Celery workers keep their
+# connections warm between tasks; a forked child opens its own.
+import atexit
+import logging
+import os
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from fetch import http_session
+
+load_dotenv()
+
+EMAIL_SENDER = os.getenv("EMAIL_SENDER")
+EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+SMTP_USE_SSL = os.getenv("SMTP_USE_SSL", "true").lower() == "true"
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "false").lower() == "true"
+SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", "10"))
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+SMTP_IDLE_CHECK_SECONDS = float(os.getenv("SMTP_IDLE_CHECK_SECONDS", "30"))
+RESEND_API_KEY = os.getenv("RESEND_API_KEY")
+RESEND_FROM = os.getenv("RESEND_FROM")
+RESEND_API_URL = "https://api.resend.com/emails"
+# Resend's limit on emails per batch call
+RESEND_BATCH_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+
+class Mail:
+    """One outgoing message"""
+
+    def __init__(self, to: str, subject: str, text: str, html: Optional[str] = None):
+        self.to = to
+        self.subject = subject
+        self.text = text
+        self.html = html
+
+
+def _is_broken_connection(error: Exception) -> bool:
+    """The session is unusable (dropped, timed out, 421), as opposed to a refused message"""
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code == 421
+    # SMTPException is an OSError too; the rest are socket errors
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def email_message(mail: Mail, sender: Optional[str]) -> EmailMessage:
+    """The plain-text SMTP message for mail"""
+    message = EmailMessage()
+    message.set_content(mail.text)
+    message["Subject"] = mail.subject
+    message["From"] = sender
+    message["To"] = mail.to
+    return message
+
+
+def _send_result(mails: List[Mail], errors: List[Optional[Exception]]) -> dict:
+    failed = [{"to": mail.to, "error": str(error)} for mail, error in zip(mails, errors) if error is not None]
+    return {"sent": len(mails) - len(failed), "failed": failed}
+
+
+class _Connection:
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.messages = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPPool:
+    """Logged-in SMTP connections shared by the threads of one process"""
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, username: Optional[str] = EMAIL_SENDER,
+                 password: Optional[str] = EMAIL_PASSWORD, use_ssl: bool = SMTP_USE_SSL,
+                 use_tls: bool = SMTP_USE_TLS, timeout: float = SMTP_TIMEOUT, size: int = SMTP_POOL_SIZE,
+                 max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.size = size
+        self.max_messages = max_messages
+        # Most recently used last: the least likely to have been dropped
+        self._idle: List[_Connection] = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.reconnects = 0
+        self.messages_sent = 0
+
+    def _connect(self) -> _Connection:
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls and not self.use_ssl:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        with self._lock:
+            self.connections_opened += 1
+        return _Connection(smtp)
+
+    def _checkout(self) -> _Connection:
+        while True:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                return self._connect()
+            if time.monotonic() - connection.last_used < SMTP_IDLE_CHECK_SECONDS or self._alive(connection):
+                return connection
+            self._discard(connection)
+
+    @staticmethod
+    def _alive(connection: _Connection) -> bool:
+        try:
+            return connection.smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _checkin(self, connection: _Connection):
+        if connection.messages >= self.max_messages:
+            self._discard(connection)
+            return
+        connection.last_used = time.monotonic()
+        with self._lock:
+            self._idle.append(connection)
+
+    @staticmethod
+    def _discard(connection: _Connection):
+        try:
+            connection.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.smtp.close()
+
+    def send(self, message: EmailMessage):
+        """Send on a pooled connection (blocks while all SMTP_POOL_SIZE are busy)"""
+        with self._slots:
+            connection = self._checkout()
+            for attempt in (1, 2):
+                try:
+                    connection.smtp.send_message(message)
+                    break
+                except Exception as e:
+                    if not _is_broken_connection(e):
+                        # Refused sender/recipients or a bad message: the session is fine
+                        self._checkin(connection)
+                        raise
+                    self._discard(connection)
+                    if attempt == 2:
+                        raise
+                    logger.info("SMTP connection lost, reconnecting", extra={"error": str(e)})
+                    with self._lock:
+                        self.reconnects += 1
+                    connection = self._connect()
+            connection.messages += 1
+            with self._lock:
+                self.messages_sent += 1
+            self._checkin(connection)
+
+    def close(self):
+        """Close the idle connections (ones in use are closed when returned after max_messages)"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self._discard(connection)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "connections_opened": self.connections_opened,
+                "reconnects": self.reconnects,
+                "messages_sent": self.messages_sent
+            }
+
+
+class SMTPTransport:
+    """Mail over an SMTPPool; send_many spreads messages over its connections"""
+    name = "smtp"
+
+    def __init__(self, pool: Optional[SMTPPool] = None, sender: Optional[str] = EMAIL_SENDER):
+        if pool is None and (not EMAIL_SENDER or not EMAIL_PASSWORD):
+            raise RuntimeError("Email not configured: EMAIL_SENDER or EMAIL_PASSWORD missing")
+        self.pool = pool or SMTPPool()
+        self.sender = sender
+
+    def send(self, mail: Mail):
+        self.pool.send(email_message(mail, self.sender))
+
+    def send_many(self, mails: List[Mail]) -> dict:
+        """Send every message; returns {"sent": n, "failed": [{"to", "error"}]}"""
+        def send(mail: Mail) -> Optional[Exception]:
+            try:
+                self.send(mail)
+            except Exception as e:
+                return e
+            return None
+
+        if not mails:
+            return _send_result(mails, [])
+        with ThreadPoolExecutor(max_workers=min(self.pool.size, len(mails)), thread_name_prefix="smtp") as executor:
+            errors = list(executor.map(send, mails))
+        return _send_result(mails, errors)
+
+    def close(self):
+        self.pool.close()
+
+    def stats(self) -> dict:
+        return {"name": self.name, "pool": self.pool.stats()}
+
+
+class ResendTransport:
+    """Mail over Resend's HTTP API (pooled keep-alive session from fetch.py)"""
+    name = "resend"
+
+    def __init__(self, api_key: Optional[str] = RESEND_API_KEY, sender: Optional[str] = RESEND_FROM,
+                 api_url: str = RESEND_API_URL, batch_size: int = RESEND_BATCH_SIZE):
+        if not api_key or not sender:
+            raise RuntimeError("Resend not configured: RESEND_API_KEY or RESEND_FROM missing")
+        self.api_key = api_key
+        self.sender = sender
+        self.api_url = api_url
+        self.batch_size = batch_size
+        self.requests = 0
+
+    def _payload(self, mail: Mail) -> dict:
+        payload = {"from": self.sender, "to": mail.to, "subject": mail.subject, "text": mail.text}
+        if mail.html:
+            payload["html"] = mail.html
+        return payload
+
+    def _post(self, url: str, payload):
+        self.requests += 1
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        resp = http_session().post(url, headers=headers, json=payload, timeout=10)
+        if resp.status_code >= 300:
+            raise RuntimeError(f"Resend error {resp.status_code}: {resp.text}")
+
+    def send(self, mail: Mail):
+        self._post(self.api_url, self._payload(mail))
+
+    def send_many(self, mails: List[Mail]) -> dict:
+        """One batch call per batch_size messages; a failed call fails its whole batch"""
+        errors = []
+        for start in range(0, len(mails), self.batch_size):
+            batch = mails[start:start + self.batch_size]
+            try:
+                self._post(f"{self.api_url}/batch", [self._payload(mail) for mail in batch])
+                errors.extend([None] * len(batch))
+            except Exception as e:
+                logger.warning("Resend batch failed", extra={"messages": len(batch), "error": str(e)})
+                errors.extend([e] * len(batch))
+        return _send_result(mails, errors)
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"name": self.name, "requests": self.requests}
+
+
+_transport = None
+_transport_pid = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """The process-wide transport (Resend if configured, otherwise SMTP)"""
+    global _transport, _transport_pid
+    with _transport_lock:
+        if _transport is None or _transport_pid != os.getpid():
+            # After a fork the parent's sockets are not ours to use
+            _transport = ResendTransport() if RESEND_API_KEY and RESEND_FROM else SMTPTransport()
+            _transport_pid = os.getpid()
+        return _transport
+
+
+def close_transport():
+    global _transport
+    with _transport_lock:
+        if _transport is not None and _transport_pid == os.getpid():
+            _transport.close()
+        _transport = None
+
+
+atexit.register(close_transport)
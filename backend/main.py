@@ -2,51 +2,55 @@
 
 
 # main.py - Complete corrected version
-from fastapi import FastAPI, HTTPException, Request, Depends, Form, BackgroundTasks
-from fastapi.responses import JSONResponse
+from logging_config import configure_logging
+configure_logging()
+
+from fastapi import FastAPI, HTTPException, Request, Depends, Form, BackgroundTasks, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.responses import Response
-from firebase_admin_init import db
 from models import (UserSignup, User, EmployeeCreate, UserLogin, 
                     DocumentCreate, Document, PersonalDocumentStatus,
                     AnalyzeDocumentRequest, AssignDocumentRequest, 
                     UpdateDocumentStatusRequest, UpdatePersonalDocStatusRequest,
                     FileUploadResponse, DocumentStatus, PersonalDocStatus, OtpVerification,     SignupVerification, UserForgotPassword, UserResetPassword,
-                    Department, DepartmentWithEmployees, CreateDepartmentRequest, TextDocumentCreate, ContentType)
-import hashlib
+                    Department, DepartmentWithEmployees, CreateDepartmentRequest, TextDocumentCreate, ContentType,
+                    JobStatus, BulkUploadResponse, FileUploadFailure, BulkAnalyzeRequest)
 import random
 import string
 from typing import List, Optional
 from fastapi import UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 import uuid
 from datetime import datetime, timezone
-import cloudinary
-import cloudinary.uploader
-import requests
-import io
-from PIL import Image
-import PyPDF2
+import asyncio
 import json
-import re
-import fitz  # PyMuPDF
-
-
-import pdfplumber
+import logging
+import time
+from fastapi.staticfiles import StaticFiles
+import contextlib
+import importlib
 
 import mimetypes
 
 from dotenv import load_dotenv
 import os
-import google.generativeai as genai
-try:
-    # types provides Blob/Part for multimodal inputs
-    from google.generativeai import types  # noqa: F401
-except Exception:
-    types = None
+from analysis import (get_analysis_provider, GEMINI_NOT_CONFIGURED, OverloadedError, analyze_text_with_gemini,
+                      cached_analysis_for, build_analysis_update, response_stats)
+from analysis_cache import analysis_cache
+from fetch import http_session
+from jobs import enqueue_analysis, get_job, requeue_local_jobs
+import bulk_analysis
+from repository import AsyncRepository, InMemoryRepository, get_repository
+import metrics
+from storage import get_storage, save_upload, STORAGE_BACKEND, LOCAL_STORAGE_DIR, LOCAL_STORAGE_MOUNT
+from user_cache import UserCache, USER_CACHE_LISTENER
+from passwords import hash_password_async, verify_password_async, verify_missing_user_async
 
 
 load_dotenv()
+logger = logging.getLogger("main")
 # Load configuration from environment
 SESSION_SECRET_KEY = os.getenv("SESSION_SECRET_KEY", "supersecretkey123")
 SESSION_HTTPS_ONLY = os.getenv("SESSION_HTTPS_ONLY", "false").lower() == "true"
@@ -60,27 +64,59 @@ CORS_ORIGINS = [
     if o.strip()
 ]
 
-# Debug: Print CORS origins on startup
-print("=" * 50)
-print("🔧 CORS Configuration:")
-print(f"   Allowed Origins: {CORS_ORIGINS}")
-print(f"   Session SameSite: {SESSION_SAME_SITE}")
-print(f"   Session HTTPS Only: {SESSION_HTTPS_ONLY}")
-print("=" * 50)
+logger.info("CORS configuration", extra={
+    "allowed_origins": CORS_ORIGINS,
+    "session_same_site": SESSION_SAME_SITE,
+    "session_https_only": SESSION_HTTPS_ONLY
+})
+
 
+# Server-Timing response header (per-request durations and costs)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() == "true"
 
-# Cloudinary and Gemini API keys
-CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
-CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
-CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
-# Accept either GENAI_API_KEY or GOOGLE_API_KEY
-GENAI_API_KEY = os.getenv("GENAI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+# Files uploaded concurrently by /upload-files/ (per request)
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
 
+# Heavy SDKs and PDF libraries load on first use; PRELOAD=true (or
+# python main.py --preload) loads them at startup, before the first request
+PRELOAD = os.getenv("PRELOAD", "false").lower() == "true"
+PRELOAD_MODULES = ["fitz", "pdfplumber"]
 
 
 
 
-app = FastAPI()
+
+def preload():
+    """Import the PDF libraries and create the model, storage and HTTP clients now"""
+    start = time.perf_counter()
+    for module in PRELOAD_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            logger.warning("Preload skipped a module", extra={"module": module, "error": str(e)})
+    get_analysis_provider()
+    get_storage()
+    http_session()
+    logger.info("Preload finished", extra={"seconds": round(time.perf_counter() - start, 3)})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Connect the data store when the server starts (not at import), requeue
+    the in-process executor's lost jobs and batches and run the user cache
+    listener; everything else is created on first use unless PRELOAD"""
+    await run_in_threadpool(get_repository)
+    await run_in_threadpool(requeue_local_jobs)
+    await run_in_threadpool(bulk_analysis.requeue_local_batches)
+    if USER_CACHE_LISTENER:
+        user_cache.start_listener(repo.sync)
+    if PRELOAD:
+        await run_in_threadpool(preload)
+    yield
+    user_cache.stop_listener()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # ✅ Session middleware FIRST
 app.add_middleware(
@@ -134,186 +170,51 @@ def guess_mime(file_url):
 
 
 
-# Configuration - In production, move these to environment variables
-cloudinary.config(
-    cloud_name=CLOUDINARY_CLOUD_NAME,
-    api_key=CLOUDINARY_API_KEY,
-    api_secret=CLOUDINARY_API_SECRET
-)
-
-
-
-
-# Initialize Gemini model (once) using gemini-2.5-flash-image as requested
-model = None
-if GENAI_API_KEY:
-    try:
-        genai.configure(api_key=GENAI_API_KEY)
-        model = genai.GenerativeModel("gemini-2.5-flash-image")
-        print("✅ Gemini model initialized: gemini-2.5-flash-image")
-    except Exception as e:
-        print(f"❌ Failed to initialize Gemini model: {e}")
-        model = None
-else:
-    print("⚠️ No Gemini API key found in env (GENAI_API_KEY/GOOGLE_API_KEY)")
-    model = None
-
-
-# ---------------------------- UTIL FUNCTIONS ----------------------------
-# No email functionality needed
-
-def extract_text_from_pdf(file_url):
-    """Extract text from PDF file"""
-    try:
-        response = requests.get(file_url)
-        pdf_file = io.BytesIO(response.content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text.strip()
-    except Exception as e:
-        print(f"Error extracting PDF text: {e}")
-        return None
-
-def parse_gemini_response(response_text: str) -> dict:
-    """Parse Gemini response to extract JSON"""
-    try:
-        # Remove markdown code blocks
-        clean_text = re.sub(r'```json\s*|\s*```', '', response_text).strip()
-        
-        # Find JSON pattern
-        json_pattern = r'\{.*\}'
-        match = re.search(json_pattern, clean_text, re.DOTALL)
-        
-        if match:
-            json_str = match.group(0)
-            return json.loads(json_str)
-        else:
-            return json.loads(clean_text)
-    except json.JSONDecodeError:
-        # Fallback parsing
-        result = {
-            "summary": "",
-            "document_type": "Unknown",
-            "key_findings": [],
-            "urgency_score": 50,
-            "importance_score": 50,
-            "departments_responsible": ["General"],
-            "confidence": 70
-        }
-        
-        # Try to extract summary
-        summary_match = re.search(r'"summary"\s*:\s*"([^"]+)"', response_text)
-        if summary_match:
-            result["summary"] = summary_match.group(1)
-        else:
-            result["summary"] = response_text[:200] + "..."
-        
-        return result
+# Data access layer (batched reads, no per-document round trips); every call
+# is awaited and runs on the Firestore I/O pool, never on the event loop.
+# The repository (and its Firebase connection) is created at startup
+repo = AsyncRepository()
 
+# User records cached per request and per process; routes that change a user invalidate it
+user_cache = UserCache(lambda email: repo.sync.get_user(email), executor=repo.executor)
 
-# Initialize client for genai SDK
-
-
-def analyze_document_with_gemini(file_url, file_type):
-    try:
-        # ---------- PDF CASE ----------
-        if file_type.lower() == "pdf":
 
-            # First try normal text extraction
-            text_content = extract_text_from_pdf(file_url)
-
-            # If digital PDF (text exists)
-            if text_content and len(text_content.strip()) > 30:
-                prompt = f"""
-                Analyze this document and return ONLY JSON with:
-                summary, document_type, key_findings,
-                urgency_score, importance_score,
-                departments_responsible, confidence.
-
-                Document text:
-                {text_content[:5000]}
-                """
-
-                result = model.generate_content(prompt)
-                return parse_gemini_response(result.text)
-
-            # ---------- SCANNED PDF (NO TEXT) ----------
-            response = requests.get(file_url)
-            pdf_bytes = response.content
-
-            # Load the PDF
-            pdf = fitz.open(stream=pdf_bytes, filetype="pdf")
-
-            parts = []
-
-            if types is None:
-                raise Exception("google.generativeai 'types' module not available for multimodal inputs. Please upgrade/install the latest google-generativeai package.")
-
-            for i in range(len(pdf)):
-                page = pdf.load_page(i)
-                pix = page.get_pixmap(dpi=180)   # good DPI for OCR
-                png_bytes = pix.tobytes("png")
-
-                part = types.Part(
-                    inline_data=types.Blob(
-                        mime_type="image/png",
-                        data=png_bytes
-                    )
-                )
-                parts.append(part)
-
-            prompt = """
-            Perform OCR on this scanned PDF and analyze it.
-            Return ONLY valid JSON with:
-            summary, document_type, key_findings,
-            urgency_score, importance_score,
-            departments_responsible, confidence.
-            """
-
-            # gemini-2.5-flash supports image inputs without the -image suffix
-            result = model.generate_content([*parts, prompt])
-
-            return parse_gemini_response(result.text)
-
-        # ---------- IMAGE CASE ----------
-        else:
-            response = requests.get(file_url)
-            image_bytes = response.content
-
-            # Find MIME type
-            mime = response.headers.get("Content-Type")
-            if not mime or mime == "application/octet-stream":
-                mime = mimetypes.guess_type(file_url)[0] or "image/png"
-
-            if types is None:
-                raise Exception("google.generativeai 'types' module not available for multimodal inputs. Please upgrade/install the latest google-generativeai package.")
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """Per-request latency, data store operations, Gemini usage and downloads
+    (Prometheus on /metrics, Server-Timing header)"""
+    start = time.perf_counter()
+    with metrics.track_request() as request_metrics:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - start
+
+    route = request.scope.get("route")
+    metrics.observe_request(request.method, getattr(route, "path", None), response.status_code,
+                            elapsed, request_metrics)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = metrics.server_timing(elapsed, request_metrics)
+    if isinstance(repo.sync, InMemoryRepository):
+        response.headers["X-Data-Operations"] = (
+            f"round_trips={request_metrics.round_trips}; reads={request_metrics.reads}; "
+            f"writes={request_metrics.writes}"
+        )
+    return response
 
-            image_part = types.Part(
-                inline_data=types.Blob(
-                    mime_type=mime,
-                    data=image_bytes
-                )
-            )
 
-            prompt = """
-            Analyze this image (OCR if needed).
-            Return ONLY valid JSON with:
-            summary, document_type, key_findings,
-            urgency_score, importance_score,
-            departments_responsible, confidence.
-            """
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
 
-            # gemini-2.5-flash supports image inputs without the -image suffix
-            result = model.generate_content([image_part, prompt])
+# Admin document list paging
+DOCUMENTS_PAGE_SIZE = int(os.getenv("DOCUMENTS_PAGE_SIZE", "50"))
+DOCUMENTS_MAX_PAGE_SIZE = 500
 
-            return parse_gemini_response(result.text)
+# Local storage backend: the API serves the uploaded files itself
+if STORAGE_BACKEND == "local":
+    os.makedirs(LOCAL_STORAGE_DIR, exist_ok=True)
+    app.mount(LOCAL_STORAGE_MOUNT, StaticFiles(directory=LOCAL_STORAGE_DIR), name="files")
 
-    except Exception as e:
-        print("Error analyzing document with Gemini:", e)
-        return None
 
 
 
@@ -346,12 +247,11 @@ async def signup(request: Request, user: UserSignup):
     """Direct signup without OTP verification"""
     try:
         # Check if user already exists
-        doc_ref = db.collection("users").document(user.email)
-        if doc_ref.get().exists:
+        if await repo.get_user(user.email):
             raise HTTPException(status_code=400, detail="Email already exists")
         
-        # Hash password
-        hashed_pw = hashlib.sha256(user.password.encode()).hexdigest()
+        # Hash password (salted KDF on the password pool, off the event loop)
+        hashed_pw = await hash_password_async(user.password)
         
         # Create user in database
         new_user = User(
@@ -365,7 +265,7 @@ async def signup(request: Request, user: UserSignup):
         )
         
         # Save to database
-        doc_ref.set(new_user.dict())
+        await repo.create_user(new_user.dict())
         
         # Create session for immediate login
         request.session["email"] = new_user.email
@@ -387,7 +287,7 @@ async def signup(request: Request, user: UserSignup):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Signup error: {e}")
+        logger.exception("Signup failed")
         raise HTTPException(status_code=500, detail=f"Failed to signup: {str(e)}")
 
 # OTP endpoints removed - direct signup now
@@ -396,17 +296,21 @@ async def signup(request: Request, user: UserSignup):
 async def login(request: Request, user: UserLogin):
     """Login with email and password"""
     try:
-        doc_ref = db.collection("users").document(user.email)
-        doc = doc_ref.get()
-        if not doc.exists:
+        user_data = await repo.get_user(user.email)
+        if user_data is None:
+            await verify_missing_user_async(user.password)
             raise HTTPException(status_code=400, detail="Invalid email or password")
 
-        user_data = doc.to_dict()
-        hashed_pw = hashlib.sha256(user.password.encode()).hexdigest()
+        matches, needs_rehash = await verify_password_async(user.password, user_data.get("password", ""))
 
-        if user_data["password"] != hashed_pw:
+        if not matches:
             raise HTTPException(status_code=400, detail="Invalid email or password")
 
+        if needs_rehash:
+            # Upgrade legacy SHA-256 (or outdated cost) hashes on successful login
+            await repo.update_user(user.email, {"password": await hash_password_async(user.password)})
+            user_cache.invalidate(user.email)
+
         # Save user session
         request.session["email"] = user.email
         request.session["isAdmin"] = user_data["isAdmin"]
@@ -414,7 +318,7 @@ async def login(request: Request, user: UserLogin):
         request.session["name"] = user_data.get("name")
         request.session["department_name"] = user_data.get("department_name")
         
-        print(f"Login - Session set: {dict(request.session)}")  # Debug log
+        logger.debug("Login", extra={"email": user.email, "is_admin": request.session.get("isAdmin")})
 
         response = JSONResponse({
             "success": True,
@@ -433,7 +337,7 @@ async def login(request: Request, user: UserLogin):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Login error: {e}")
+        logger.exception("Login failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/logout/")
@@ -449,20 +353,16 @@ async def logout(request: Request):
 async def get_me(request: Request):
     """Return currently logged-in user info"""
     try:
-        print(f"Session data: {dict(request.session)}")  # Debug log
-        print(f"Cookies: {request.cookies}")  # Debug log
-        
         if "email" not in request.session:
             raise HTTPException(status_code=401, detail="Not authenticated")
 
         email = request.session["email"]
-        doc = db.collection("users").document(email).get()
-        if not doc.exists:
+        user_data = await user_cache.get_async(email, request)
+        if user_data is None:
             # Clear invalid session
             request.session.clear()
             raise HTTPException(status_code=404, detail="User not found")
 
-        user_data = doc.to_dict()
         # Remove password from response
         user_data.pop("password", None)
         
@@ -489,12 +389,11 @@ async def add_employee(request: Request, employee: EmployeeCreate):
         session_data = require_admin(request)
         
         # Check if employee already exists
-        emp_ref = db.collection("users").document(employee.email)
-        if emp_ref.get().exists:
+        if await repo.get_user(employee.email):
             raise HTTPException(status_code=400, detail="Employee already exists")
 
         # Hash the password provided by admin
-        hashed_pw = hashlib.sha256(employee.password.encode()).hexdigest()
+        hashed_pw = await hash_password_async(employee.password)
 
         # Create employee record
         user_data = User(
@@ -505,7 +404,9 @@ async def add_employee(request: Request, employee: EmployeeCreate):
             company_name=session_data["company_name"],
             isAdmin=False
         )
-        emp_ref.set(user_data.dict())
+        # The department's employee_count is incremented in the same batch
+        await repo.create_employee(user_data.dict())
+        user_cache.invalidate(employee.email)
 
         return {
             "success": True,
@@ -526,14 +427,16 @@ async def create_department(request: Request, dept_request: CreateDepartmentRequ
     try:
         session = require_admin(request)
         
-        # Check if department already exists
-        existing_depts = db.collection("departments").where(
-            "company_name", "==", session["company_name"]
-        ).where(
-            "department_name", "==", dept_request.department_name
-        ).get()
+        # Check if department already exists; the admin record and the employees
+        # added before the department existed (who already name it) are needed
+        # below (independent reads)
+        existing_dept, admin_data, employee_count = await asyncio.gather(
+            repo.find_department(session["company_name"], dept_request.department_name),
+            user_cache.get_async(session["email"], request),
+            repo.count_department_users(session["company_name"], dept_request.department_name)
+        )
         
-        if existing_depts:
+        if existing_dept:
             raise HTTPException(status_code=400, detail="Department already exists")
         
         # Create department
@@ -544,22 +447,17 @@ async def create_department(request: Request, dept_request: CreateDepartmentRequ
             company_name=session["company_name"],
             created_by=session["email"],
             created_at=datetime.now(),
-            description=dept_request.description
+            description=dept_request.description,
+            employee_count=employee_count
         )
         
         # Save to Firestore
-        db.collection("departments").document(department_id).set(department.dict())
+        await repo.create_department(department.dict())
         
         # Update admin's user record with the new department
-        admin_ref = db.collection("users").document(session["email"])
-        admin_doc = admin_ref.get()
-        
-        if admin_doc.exists:
-            admin_data = admin_doc.to_dict()
-            departments = admin_data.get("departments", [])
-            if dept_request.department_name not in departments:
-                departments.append(dept_request.department_name)
-                admin_ref.update({"departments": departments})
+        if admin_data is not None and dept_request.department_name not in admin_data.get("departments", []):
+            await repo.add_user_department(session["email"], dept_request.department_name)
+            user_cache.invalidate(session["email"])
         
         return {
             "success": True,
@@ -574,45 +472,53 @@ async def create_department(request: Request, dept_request: CreateDepartmentRequ
 
 
 @app.get("/departments/")
-async def get_departments(request: Request):
-    """Get all departments of admin's company with employee counts and details"""
+async def get_departments(request: Request, include_employees: bool = True):
+    """Get all departments of admin's company with employee counts and details.
+
+    include_employees=false serves the stored per-department counts without
+    reading any user documents.
+    """
     try:
         session = require_admin(request)
         
-        # Get all departments for this company
-        departments_query = db.collection("departments").where(
-            "company_name", "==", session["company_name"]
-        ).get()
-        
-        departments_list = []
+        # Departments and (optionally) the whole company's users, queried concurrently
+        if include_employees:
+            departments, company_users = await asyncio.gather(
+                repo.list_departments(session["company_name"]),
+                repo.list_company_users(
+                    session["company_name"],
+                    fields=["name", "email", "isAdmin", "department_name"]
+                )
+            )
+        else:
+            departments, company_users = await repo.list_departments(session["company_name"]), []
         
-        for dept_doc in departments_query:
-            dept_data = dept_doc.to_dict()
-            
-            # Get all employees in this department
-            employees_query = db.collection("users").where(
-                "company_name", "==", session["company_name"]
-            ).where(
-                "department_name", "==", dept_data["department_name"]
-            ).get()
-            
-            employees = []
-            for emp_doc in employees_query:
-                emp_data = emp_doc.to_dict()
-                # Remove sensitive information
-                emp_data.pop("password", None)
-                employees.append({
+        employees_by_department = {}
+        if include_employees:
+            # Grouped by department in memory
+            for emp_data in company_users:
+                employees_by_department.setdefault(emp_data.get("department_name"), []).append({
                     "name": emp_data.get("name"),
                     "email": emp_data.get("email"),
                     "isAdmin": emp_data.get("isAdmin", False),
                     "department_name": emp_data.get("department_name")
                 })
+        
+        departments_list = []
+        
+        for dept_data in departments:
+            if include_employees:
+                employees = employees_by_department.get(dept_data.get("department_name"), [])
+                employee_count = len(employees)
+            else:
+                employees = []
+                employee_count = dept_data.get("employee_count", 0)
             
             dept_with_employees = DepartmentWithEmployees(
-                department_id=dept_doc.id,
+                department_id=dept_data["department_id"],
                 department_name=dept_data.get("department_name"),
                 description=dept_data.get("description"),
-                employee_count=len(employees),
+                employee_count=employee_count,
                 employees=employees
             )
             
@@ -625,6 +531,8 @@ async def get_departments(request: Request):
             "departments": departments_list
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -636,48 +544,28 @@ async def delete_department(request: Request, department_id: str):
         session = require_admin(request)
         
         # Get department
-        dept_ref = db.collection("departments").document(department_id)
-        dept = dept_ref.get()
+        dept_data = await repo.get_department(department_id)
         
-        if not dept.exists:
+        if not dept_data:
             raise HTTPException(status_code=404, detail="Department not found")
         
-        dept_data = dept.to_dict()
-        
         # Check if department belongs to admin's company
         if dept_data["company_name"] != session["company_name"]:
             raise HTTPException(status_code=403, detail="Access denied")
         
         department_name = dept_data["department_name"]
         
-        # Get all employees in this department
-        employees_query = db.collection("users").where(
-            "company_name", "==", session["company_name"]
-        ).where(
-            "department_name", "==", department_name
-        ).get()
-        
-        deleted_employees = []
-        
-        # Delete each employee in the department
-        for emp_doc in employees_query:
-            emp_data = emp_doc.to_dict()
-            employee_email = emp_data.get("email")
-            
-            # Also delete their personal document statuses
-            personal_docs = db.collection("personal_doc_status").where(
-                "employee_email", "==", employee_email
-            ).get()
-            
-            for personal_doc in personal_docs:
-                personal_doc.reference.delete()
-            
-            # Delete the employee
-            emp_doc.reference.delete()
-            deleted_employees.append(employee_email)
+        # Employees of this department (one query); their assignments are
+        # found through the documents' assignees
+        employees = await repo.list_department_users(
+            session["company_name"], [department_name], fields=["email"]
+        )
         
-        # Delete the department
-        dept_ref.delete()
+        # Employees, their personal statuses and assignee entries, and the
+        # department itself in batched deletes
+        await repo.delete_employees(employees, department_id=department_id)
+        deleted_employees = [emp_data["email"] for emp_data in employees]
+        user_cache.invalidate(*deleted_employees)
         
         return {
             "success": True,
@@ -699,18 +587,11 @@ async def delete_employee(request: Request, employee_email: str):
         session = require_admin(request)
         
         # Get employee
-        employee_query = db.collection("users").where(
-            "email", "==", employee_email
-        ).where(
-            "company_name", "==", session["company_name"]
-        ).get()
+        emp_data = await repo.get_user(employee_email)
         
-        if not employee_query:
+        if not emp_data or emp_data.get("company_name") != session["company_name"]:
             raise HTTPException(status_code=404, detail="Employee not found")
         
-        employee_doc = employee_query[0]
-        emp_data = employee_doc.to_dict()
-        
         # Check if trying to delete another admin
         if emp_data.get("isAdmin", False):
             raise HTTPException(status_code=403, detail="Cannot delete admin users")
@@ -718,28 +599,11 @@ async def delete_employee(request: Request, employee_email: str):
         employee_name = emp_data.get("name", "")
         department_name = emp_data.get("department_name", "")
         
-        # Delete all personal document statuses for this employee
-        personal_docs = db.collection("personal_doc_status").where(
-            "employee_email", "==", employee_email
-        ).get()
-        
-        for personal_doc in personal_docs:
-            personal_doc.reference.delete()
-        
-        # Remove employee from docs_received in documents collection
-        documents = db.collection("documents").where(
-            "company_name", "==", session["company_name"]
-        ).get()
-        
-        for doc in documents:
-            doc_data = doc.to_dict()
-            docs_received = doc_data.get("docs_received", [])
-            if employee_email in docs_received:
-                docs_received.remove(employee_email)
-                doc.reference.update({"docs_received": docs_received})
-        
-        # Delete the employee
-        employee_doc.reference.delete()
+        # Delete the employee, the statuses of their assigned documents and their
+        # entries in those documents' assignees, touching only their assignments;
+        # the department's employee_count is decremented in the same batch
+        await repo.delete_employees([emp_data])
+        user_cache.invalidate(employee_email)
         
         return {
             "success": True,
@@ -757,89 +621,138 @@ async def delete_employee(request: Request, employee_email: str):
 
 # ---------------------------- DOCUMENT MANAGEMENT ROUTES ----------------------------
 
+def _new_file_document(session: dict, file_name: str, stored) -> dict:
+    """Document record for an uploaded file (content_hash known from the upload)"""
+    document = Document(
+        document_id=str(uuid.uuid4()),
+        file_name=file_name,
+        file_url=stored.url,
+        content_type=ContentType.FILE,
+        uploaded_by=session["email"],
+        company_name=session["company_name"],
+        timestamp=datetime.now(),
+        content_hash=stored.sha256
+    )
+    return document.dict()
+
+
 @app.post("/upload-file/")
 async def upload_file(request: Request, file: UploadFile = File(...)):
-    """Admin uploads a file to Cloudinary and creates document record"""
+    """Admin uploads a file to storage and creates document record"""
     try:
         session = require_admin(request)
         
-        # Upload to Cloudinary
-        upload_result = cloudinary.uploader.upload(
-            file.file,
-            resource_type="raw",  # Automatically detect file type
-            folder="documents"
-        )
-        
-        file_url = upload_result["secure_url"]
-        document_id = str(uuid.uuid4())
-        
-        # Create document record
-        document = Document(
-            document_id=document_id,
-            file_name=file.filename,
-            file_url=file_url,
-            content_type=ContentType.FILE,
-            uploaded_by=session["email"],
-            company_name=session["company_name"],
-            timestamp=datetime.now()
-        )
+        # Upload off the event loop (streams in chunks for large files)
+        stored = await run_in_threadpool(save_upload, file.file, file.filename)
+        document_data = _new_file_document(session, file.filename, stored)
         
         # Save to Firestore
-        doc_ref = db.collection("documents").document(document_id)
-        doc_ref.set(document.dict())
+        await repo.create_documents([document_data])
         
         return FileUploadResponse(
-            file_url=file_url,
-            document_id=document_id,
+            file_url=stored.url,
+            document_id=document_data["document_id"],
             message="File uploaded successfully"
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@app.post("/upload-files/", response_model=BulkUploadResponse)
+async def upload_files(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    analyze: bool = Form(False)
+):
+    """Admin uploads many files at once; optionally queues their analysis.
+
+    Files are stored UPLOAD_CONCURRENCY at a time and all document records
+    are written in one batch. A file that fails does not fail the others.
+    """
+    try:
+        session = require_admin(request)
+        
+        if analyze and not get_analysis_provider().available:
+            raise HTTPException(status_code=500, detail=GEMINI_NOT_CONFIGURED)
+        
+        semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+        
+        async def store(file: UploadFile):
+            async with semaphore:
+                try:
+                    return await run_in_threadpool(save_upload, file.file, file.filename)
+                except Exception as e:
+                    logger.warning("Upload failed", extra={"file_name": file.filename, "error": str(e)})
+                    return e
+        
+        stored_files = await asyncio.gather(*(store(file) for file in files))
+        
+        documents, failed = [], []
+        for file, stored in zip(files, stored_files):
+            if isinstance(stored, Exception):
+                failed.append(FileUploadFailure(file_name=file.filename, error=str(stored)))
+                continue
+            document_data = _new_file_document(session, file.filename, stored)
+            if analyze:
+                # Content analyzed before: store the cached analysis right away
+                cached = await repo.run(cached_analysis_for, document_data)
+                if cached:
+                    document_data.update(build_analysis_update(*cached))
+            documents.append(document_data)
+        
+        await repo.create_documents(documents)
+        
+        uploaded = []
+        for document_data in documents:
+            job_id = None
+            if analyze and document_data["processing_status"] != DocumentStatus.ANALYZED:
+                job = await repo.run(
+                    enqueue_analysis, document_data["document_id"], document_data, session["email"]
+                )
+                job_id = job["job_id"]
+            uploaded.append(FileUploadResponse(
+                file_url=document_data["file_url"],
+                document_id=document_data["document_id"],
+                message="File uploaded successfully",
+                job_id=job_id
+            ))
+        
+        return BulkUploadResponse(uploaded=uploaded, failed=failed)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/analyze-text/")
 async def analyze_text(request: Request, text: str = Form(...)):
     """Analyze text input using Gemini AI"""
     try:
         session = require_admin(request)
         
-        # Debug: log request details for troubleshooting 500s
-        print("/analyze-text called by:", session.get("email"))
-        print("Text length:", len(text) if text else 0)
-        if not model:
+        logger.debug("Analyze text", extra={"email": session.get("email"), "chars": len(text) if text else 0})
+        if not get_analysis_provider().available:
             # Provide clearer error message for ops
-            raise HTTPException(status_code=500, detail="Gemini API not configured. Set GENAI_API_KEY or GOOGLE_API_KEY in environment.")
-        
-        prompt = f"""
-        Analyze this document text and provide:
-        1. Summary (2-3 sentences)
-        2. Document type
-        3. Key findings (list)
-        4. Urgency score (0-100)
-        5. Importance score (0-100)
-        6. Departments that should handle this (list)
-        7. Confidence level (0-100)
-        
-        Document text:
-        {text}
-        
-        Format as JSON with keys: summary, document_type, key_findings, urgency_score, importance_score, departments_responsible, confidence
-        """
+            raise HTTPException(status_code=500, detail=GEMINI_NOT_CONFIGURED)
         
         try:
-            response = model.generate_content(prompt)
-            # Parse the response to extract JSON
-            analysis = parse_gemini_response(response.text)
+            # Run the Gemini round trip off the event loop
+            analysis = await run_in_threadpool(analyze_text_with_gemini, text)
             return analysis
+        except OverloadedError as e:
+            # Rate limited or circuit open: tell the client when to come back
+            raise HTTPException(status_code=503, detail=str(e),
+                                headers={"Retry-After": str(max(1, round(e.retry_after)))})
         except Exception as e:
             # Log and bubble up a helpful message
-            print("Gemini analyze-text error:", e)
+            logger.exception("Text analysis failed")
             raise HTTPException(status_code=500, detail=f"Gemini error: {e}")
         
     except HTTPException:
         raise
     except Exception as e:
-        print("/analyze-text internal error:", e)
+        logger.exception("Analyze text failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -869,53 +782,34 @@ async def create_text_document(
             processing_status=DocumentStatus.PENDING if analyze else DocumentStatus.ANALYZED
         )
         
-        # Analyze if requested
+        if analyze and not get_analysis_provider().available:
+            raise HTTPException(status_code=500, detail=GEMINI_NOT_CONFIGURED)
+        
+        document_data = document.dict()
+        cached = None
         if analyze:
-            if not model:
-                raise HTTPException(status_code=500, detail="Gemini API not configured. Set GENAI_API_KEY or GOOGLE_API_KEY in environment.")
-            
-            prompt = f"""
-            Analyze this document text and provide:
-            1. Summary (2-3 sentences)
-            2. Document type
-            3. Key findings (list)
-            4. Urgency score (0-100)
-            5. Importance score (0-100)
-            6. Departments that should handle this (list)
-            7. Confidence level (0-100)
-            
-            Document text:
-            {content}
-            
-            Format as JSON with keys: summary, document_type, key_findings, urgency_score, importance_score, departments_responsible, confidence
-            """
-            
-            try:
-                response = model.generate_content(prompt)
-                analysis = parse_gemini_response(response.text)
-                
-                # Update document with analysis results
-                document.summary = analysis.get("summary", "")
-                document.document_type = analysis.get("document_type", "Text Document")
-                document.urgency_score = analysis.get("urgency_score", 50)
-                document.importance_score = analysis.get("importance_score", 50)
-                document.departments_responsible = analysis.get("departments_responsible", ["General"])
-                document.confidence = analysis.get("confidence", 70)
-                document.key_findings = analysis.get("key_findings", [])
-                document.processing_status = DocumentStatus.ANALYZED
-                document.analyzed_at = datetime.now()
-            except Exception as e:
-                document.error_message = str(e)
-                document.processing_status = DocumentStatus.PENDING
+            # Same text analyzed before: store the cached analysis right away, no job
+            cached = await repo.run(cached_analysis_for, document_data)
+            if cached:
+                document_data.update(build_analysis_update(*cached))
         
         # Save to Firestore
-        doc_ref = db.collection("documents").document(document_id)
-        doc_ref.set(document.dict())
+        await repo.create_documents([document_data])
         
+        # Otherwise analysis runs in the background; poll /jobs/{job_id} for the result
+        job = None
+        if analyze and not cached:
+            job = await repo.run(enqueue_analysis, document_id, document_data, session["email"])
+        
+        if cached:
+            message = "Text document created and analyzed successfully"
+        else:
+            message = "Text document created successfully" + (" and queued for analysis" if analyze else "")
         return FileUploadResponse(
             file_url=None,
             document_id=document_id,
-            message="Text document created successfully" + (" and analyzed" if analyze else "")
+            message=message,
+            job_id=job["job_id"] if job else None
         )
         
     except HTTPException:
@@ -924,158 +818,234 @@ async def create_text_document(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/analyze-document/")
+@app.post("/analyze-document/", status_code=202)
 async def analyze_document(request: Request, analyze_request: AnalyzeDocumentRequest):
-    """Analyze document using Gemini AI"""
+    """Queue a document for Gemini analysis; poll /jobs/{job_id} for the result"""
     try:
         session = require_admin(request)
         
         # Get document from Firestore
-        doc_ref = db.collection("documents").document(analyze_request.document_id)
-        doc = doc_ref.get()
+        document_data = await repo.get_document(analyze_request.document_id)
         
-        if not doc.exists:
+        if not document_data:
             raise HTTPException(status_code=404, detail="Document not found")
-            
-        document_data = doc.to_dict()
         
         # Check if document belongs to admin's company
         if document_data["company_name"] != session["company_name"]:
             raise HTTPException(status_code=403, detail="Access denied")
-            
-        # Update status to processing
-        doc_ref.update({"processing_status": DocumentStatus.PROCESSING})
         
-        # Check if it's a text document or file document
+        # Reject documents the worker could never analyze before queueing them
         content_type = document_data.get("content_type", ContentType.FILE)
+        if content_type == ContentType.TEXT and not document_data.get("content"):
+            raise HTTPException(status_code=400, detail="No text content found")
+        if content_type != ContentType.TEXT and not document_data.get("file_url"):
+            raise HTTPException(status_code=400, detail="No file URL found")
+        if not get_analysis_provider().available:
+            raise HTTPException(status_code=500, detail=GEMINI_NOT_CONFIGURED)
+        
+        # Same content already analyzed with the current prompt/model: no LLM call
+        cached = await repo.run(cached_analysis_for, document_data)
+        if cached:
+            analysis_data, digest = cached
+            await repo.update_document(analyze_request.document_id, build_analysis_update(analysis_data, digest))
+            return JSONResponse(status_code=200, content={
+                "message": "Document analyzed successfully",
+                "document_id": analyze_request.document_id,
+                "cached": True,
+                "analysis": analysis_data
+            })
         
-        if content_type == ContentType.TEXT:
-            # Analyze text content directly
-            text_content = document_data.get("content", "")
-            if not text_content:
-                raise HTTPException(status_code=400, detail="No text content found")
-                
-            if not model:
-                raise HTTPException(status_code=500, detail="Gemini API not configured. Set GENAI_API_KEY or GOOGLE_API_KEY in environment.")
-            
-            prompt = f"""
-            Analyze this document text and provide:
-            1. Summary (2-3 sentences)
-            2. Document type
-            3. Key findings (list)
-            4. Urgency score (0-100)
-            5. Importance score (0-100)
-            6. Departments that should handle this (list)
-            7. Confidence level (0-100)
-            
-            Document text:
-            {text_content}
-            
-            Format as JSON with keys: summary, document_type, key_findings, urgency_score, importance_score, departments_responsible, confidence
-            """
-            
-            response = model.generate_content(prompt)
-            analysis_data = parse_gemini_response(response.text)
-        else:
-            # Analyze file document
-            if not document_data.get("file_url"):
-                raise HTTPException(status_code=400, detail="No file URL found")
-                
-            # Determine file type from filename
-            file_name = document_data["file_name"].lower()
-            file_type = "pdf" if file_name.endswith('.pdf') else "image"
-            
-            # Analyze with Gemini
-            analysis_result = analyze_document_with_gemini(document_data["file_url"], file_type)
-            
-            if not analysis_result:
-                doc_ref.update({
-                    "processing_status": DocumentStatus.PENDING,
-                    "error_message": "Failed to analyze document"
-                })
-                raise HTTPException(status_code=500, detail="Failed to analyze document")
-                
-            analysis_data = analysis_result
-        
-        # Update document with analysis results
-        update_data = {
-            "processing_status": DocumentStatus.ANALYZED,
-            "summary": analysis_data.get("summary", ""),
-            "document_type": analysis_data.get("document_type", "Unknown"),
-            "urgency_score": analysis_data.get("urgency_score", 50),
-            "importance_score": analysis_data.get("importance_score", 50),
-            "departments_responsible": analysis_data.get("departments_responsible", []),
-            "confidence": analysis_data.get("confidence", 70),
-            "key_findings": analysis_data.get("key_findings", []),
-            "analyzed_at": datetime.now()
+        job = await repo.run(enqueue_analysis, analyze_request.document_id, document_data, session["email"])
+        
+        return {
+            "message": "Document queued for analysis",
+            "document_id": analyze_request.document_id,
+            "job_id": job["job_id"],
+            "status": job["status"]
         }
         
-        doc_ref.update(update_data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Analyze document failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/jobs/{job_id}")
+async def get_analysis_job(request: Request, job_id: str):
+    """Poll the status of a background analysis job"""
+    try:
+        session = require_admin(request)
         
-        return {"message": "Document analyzed successfully", "analysis": analysis_data}
+        job = await repo.run(get_job, job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        
+        if job["company_name"] != session["company_name"]:
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        return {
+            "job": job,
+            "done": job["status"] in (JobStatus.SUCCEEDED, JobStatus.FAILED)
+        }
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Analyze document error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/analyze-documents/bulk", status_code=202)
+async def analyze_documents_bulk(request: Request, bulk_request: BulkAnalyzeRequest):
+    """Queue server-side analysis of many documents (ids or filters).
+
+    Poll /analyze-documents/bulk/{batch_id} or stream .../events for progress.
+    """
+    try:
+        session = require_admin(request)
+
+        if not get_analysis_provider().available:
+            raise HTTPException(status_code=500, detail=GEMINI_NOT_CONFIGURED)
+        if bulk_request.document_ids is not None and not bulk_request.document_ids:
+            raise HTTPException(status_code=400, detail="document_ids is empty")
+        if len(bulk_request.document_ids or []) > bulk_analysis.BULK_ANALYSIS_MAX_DOCUMENTS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {bulk_analysis.BULK_ANALYSIS_MAX_DOCUMENTS} documents per batch"
+            )
+
+        batch = await repo.run(bulk_analysis.create_batch, session["company_name"], session["email"], bulk_request)
+        return {
+            "message": "Bulk analysis queued",
+            "batch_id": batch["batch_id"],
+            "status": batch["status"]
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Bulk analysis request failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _get_company_batch(session: dict, batch_id: str) -> dict:
+    batch = await repo.run(bulk_analysis.get_batch, batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if batch["company_name"] != session["company_name"]:
+        raise HTTPException(status_code=403, detail="Access denied")
+    return batch
+
+
+@app.get("/analyze-documents/bulk/{batch_id}")
+async def get_bulk_analysis(request: Request, batch_id: str):
+    """Progress of a bulk analysis"""
+    session = require_admin(request)
+    batch = await _get_company_batch(session, batch_id)
+    return {
+        "batch": bulk_analysis.progress_event(batch),
+        "done": batch["status"] in bulk_analysis.DONE_STATUSES
+    }
+
+
+@app.get("/analyze-documents/bulk/{batch_id}/events")
+async def stream_bulk_analysis(request: Request, batch_id: str):
+    """Server-Sent Events: a progress event whenever the counts change, then done"""
+    session = require_admin(request)
+    batch = await _get_company_batch(session, batch_id)
+
+    async def events():
+        nonlocal batch
+        last_event, last_sent = None, time.monotonic()
+        while True:
+            event = bulk_analysis.progress_event(batch)
+            done = batch["status"] in bulk_analysis.DONE_STATUSES
+            if event != last_event:
+                yield f"event: {'done' if done else 'progress'}\ndata: {json.dumps(event, default=str)}\n\n"
+                last_event, last_sent = event, time.monotonic()
+            elif time.monotonic() - last_sent >= bulk_analysis.SSE_KEEPALIVE_SECONDS:
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            if done or await request.is_disconnected():
+                return
+            await asyncio.sleep(bulk_analysis.PROGRESS_POLL_SECONDS)
+            batch = await repo.run(bulk_analysis.get_batch, batch_id) or batch
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # nginx: don't buffer the stream
+    })
+
+
+@app.get("/analysis-cache/stats/")
+async def get_analysis_cache_stats(request: Request):
+    """Admin: analysis cache hit/miss and model response parse counters for this worker"""
+    require_admin(request)
+    return {
+        "success": True,
+        "provider": get_analysis_provider().name,
+        "cache": analysis_cache.stats(),
+        "responses": response_stats()
+    }
+
+
+@app.get("/analysis-provider/stats/")
+async def get_analysis_provider_stats(request: Request):
+    """Admin: rate limiter, retries, circuit breaker and call latency for this worker"""
+    require_admin(request)
+    return {"success": True, "provider": get_analysis_provider().stats()}
+
+
 @app.post("/assign-document/")
 async def assign_document(request: Request, assign_request: AssignDocumentRequest):
     """Admin assigns document to departments"""
     try:
         session = require_admin(request)
         
-        # Get document
-        doc_ref = db.collection("documents").document(assign_request.document_id)
-        doc = doc_ref.get()
+        # The document and only the target departments' employees (one query
+        # per 30 departments), read concurrently; employees who already have
+        # the document keep their personal status
+        document_data, department_users = await asyncio.gather(
+            repo.get_document(assign_request.document_id),
+            repo.list_department_users(
+                session["company_name"],
+                assign_request.departments,
+                fields=["email", "isAdmin", "docs_received"]
+            )
+        )
         
-        if not doc.exists:
+        if not document_data:
             raise HTTPException(status_code=404, detail="Document not found")
-            
-        document_data = doc.to_dict()
         
         # Check access
         if document_data["company_name"] != session["company_name"]:
             raise HTTPException(status_code=403, detail="Access denied")
-            
-        # Update document with assignments
-        doc_ref.update({
-            "departments_assigned": assign_request.departments,
-            "processing_status": DocumentStatus.ASSIGNED,
-            "assigned_at": datetime.now()
-        })
-        
-        # Get all users in assigned departments
-        users_query = db.collection("users").where("company_name", "==", session["company_name"])
-        users = users_query.get()
-        
-        assigned_users = []
-        for user_doc in users:
-            user_data = user_doc.to_dict()
-            if (not user_data.get("isAdmin", False) and 
-                user_data.get("department_name") in assign_request.departments):
-                
-                # Add document to user's received docs
-                user_docs = user_data.get("docs_received", [])
-                if assign_request.document_id not in user_docs:
-                    user_docs.append(assign_request.document_id)
-                    
-                    db.collection("users").document(user_data["email"]).update({
-                        "docs_received": user_docs
-                    })
-                    
-                    # Create personal document status record
-                    personal_doc = PersonalDocumentStatus(
-                        document_id=assign_request.document_id,
-                        employee_email=user_data["email"],
-                        personal_status=PersonalDocStatus.PENDING,
-                        last_updated=datetime.now()
-                    )
-                    
-                    db.collection("personal_doc_status").add(personal_doc.dict())
-                    assigned_users.append(user_data["email"])
+
+        now = datetime.now()
+        status_records = [
+            PersonalDocumentStatus(
+                document_id=assign_request.document_id,
+                employee_email=user_data["email"],
+                personal_status=PersonalDocStatus.PENDING,
+                last_updated=now
+            ).dict()
+            for user_data in department_users
+            if not user_data.get("isAdmin", False)
+            and assign_request.document_id not in (user_data.get("docs_received") or [])
+        ]
+        
+        # Document update, docs_received ArrayUnions and status records in batched commits
+        await repo.assign_document(
+            assign_request.document_id,
+            {
+                "departments_assigned": assign_request.departments,
+                "processing_status": DocumentStatus.ASSIGNED,
+                "assigned_at": now
+            },
+            status_records
+        )
+        assigned_users = [record["employee_email"] for record in status_records]
+        user_cache.invalidate(*assigned_users)
                     
         return {
             "message": "Document assigned successfully",
@@ -1083,6 +1053,8 @@ async def assign_document(request: Request, assign_request: AssignDocumentReques
             "departments": assign_request.departments
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1093,13 +1065,10 @@ async def update_document_status(request: Request, status_request: UpdateDocumen
     try:
         session = require_admin(request)
         
-        doc_ref = db.collection("documents").document(status_request.document_id)
-        doc = doc_ref.get()
+        document_data = await repo.get_document(status_request.document_id)
         
-        if not doc.exists:
+        if not document_data:
             raise HTTPException(status_code=404, detail="Document not found")
-            
-        document_data = doc.to_dict()
         
         if document_data["company_name"] != session["company_name"]:
             raise HTTPException(status_code=403, detail="Access denied")
@@ -1111,61 +1080,88 @@ async def update_document_status(request: Request, status_request: UpdateDocumen
         elif status_request.status == DocumentStatus.DELETED:
             update_data["deleted_at"] = datetime.now()
             
-        doc_ref.update(update_data)
+        await repo.update_document(status_request.document_id, update_data)
         
         return {"message": f"Document status updated to {status_request.status}"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/documents/")
-async def get_documents(request: Request):
-    """Get all documents for admin or user's assigned documents"""
+async def get_documents(
+    request: Request,
+    limit: int = Query(DOCUMENTS_PAGE_SIZE, ge=1, le=DOCUMENTS_MAX_PAGE_SIZE),
+    start_after: Optional[str] = None,
+    fields: Optional[str] = None,
+    processing_status: Optional[DocumentStatus] = None,
+    document_type: Optional[str] = None,
+    min_urgency: Optional[float] = Query(None, ge=0, le=100),
+    max_urgency: Optional[float] = Query(None, ge=0, le=100)
+):
+    """Get all documents for admin or user's assigned documents.
+
+    Admins get one page at a time: pass the returned next_cursor as
+    start_after. fields=summary,document_type,... limits the returned fields
+    (list views can skip content and key_findings).
+    """
     try:
         session = require_auth(request)
         
         if session.get("isAdmin", False):
-            # Admin sees all company documents
-            docs_query = db.collection("documents").where(
-                "company_name", "==", session["company_name"]
-            ).order_by("timestamp", direction="DESCENDING")
+            # Admin sees all company documents, one page at a time
+            selected_fields = None
+            if fields:
+                selected_fields = [f.strip() for f in fields.split(",") if f.strip()]
+                unknown = [f for f in selected_fields if f not in Document.model_fields]
+                if unknown:
+                    raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+            
+            try:
+                documents, next_cursor = await repo.list_company_documents(
+                    session["company_name"],
+                    limit=limit,
+                    start_after=start_after,
+                    fields=selected_fields,
+                    processing_status=processing_status,
+                    document_type=document_type,
+                    min_urgency=min_urgency,
+                    max_urgency=max_urgency
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            
+            return {
+                "documents": documents,
+                "next_cursor": next_cursor,
+                "has_more": next_cursor is not None
+            }
         else:
             # Employee sees only assigned documents
-            user_doc = db.collection("users").document(session["email"]).get()
-            user_data = user_doc.to_dict()
+            user_data = await user_cache.get_async(session["email"], request) or {}
             doc_ids = user_data.get("docs_received", [])
             
             if not doc_ids:
                 return {"documents": []}
                 
-            # Get documents by IDs
-            documents = []
-            for doc_id in doc_ids:
-                doc = db.collection("documents").document(doc_id).get()
-                if doc.exists:
-                    doc_data = doc.to_dict()
-                    
-                    # Get personal status for this document
-                    personal_status_query = db.collection("personal_doc_status").where(
-                        "document_id", "==", doc_id
-                    ).where("employee_email", "==", session["email"])
-                    
-                    personal_docs = list(personal_status_query.get())
-                    if personal_docs:
-                        personal_data = personal_docs[0].to_dict()
-                        doc_data["personal_status"] = personal_data.get("personal_status")
-                        doc_data["personal_comments"] = personal_data.get("comments")
-                        
-                    documents.append(doc_data)
+            # Batch-get documents and personal statuses concurrently, join in memory
+            documents, personal_statuses = await asyncio.gather(
+                repo.get_documents_by_ids(doc_ids),
+                repo.get_personal_statuses(session["email"], doc_ids)
+            )
+            
+            for doc_data in documents:
+                personal_data = personal_statuses.get(doc_data.get("document_id"))
+                if personal_data:
+                    doc_data["personal_status"] = personal_data.get("personal_status")
+                    doc_data["personal_comments"] = personal_data.get("comments")
                     
             return {"documents": documents}
-            
-        docs = docs_query.get()
-        documents = [doc.to_dict() for doc in docs]
-        
-        return {"documents": documents}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1181,31 +1177,22 @@ async def get_my_documents(request: Request):
             raise HTTPException(status_code=403, detail="Admins cannot access employee documents")
         
         # Get employee's document list
-        user_doc = db.collection("users").document(session["email"]).get()
-        if not user_doc.exists:
+        user_data = await user_cache.get_async(session["email"], request)
+        if not user_data:
             raise HTTPException(status_code=404, detail="User not found")
             
-        user_data = user_doc.to_dict()
         doc_ids = user_data.get("docs_received", [])
         
         documents = []
         personal_doc_statuses = []
         
         if doc_ids:
-            # Get documents by IDs
-            for doc_id in doc_ids:
-                doc = db.collection("documents").document(doc_id).get()
-                if doc.exists:
-                    doc_data = doc.to_dict()
-                    documents.append(doc_data)
-            
-            # Get personal statuses for all documents
-            personal_status_query = db.collection("personal_doc_status").where(
-                "employee_email", "==", session["email"]
-            ).get()
-            
-            for personal_doc in personal_status_query:
-                personal_doc_statuses.append(personal_doc.to_dict())
+            # Batch-get documents and their personal statuses by key, concurrently
+            documents, personal_statuses = await asyncio.gather(
+                repo.get_documents_by_ids(doc_ids),
+                repo.get_personal_statuses(session["email"], doc_ids)
+            )
+            personal_doc_statuses = list(personal_statuses.values())
         
         return {
             "success": True,
@@ -1227,41 +1214,37 @@ async def update_personal_doc_status(request: Request, status_request: UpdatePer
     try:
         session = require_auth(request)
         
-        # Check if user has access to this document
-        user_doc = db.collection("users").document(session["email"]).get()
-        user_data = user_doc.to_dict()
+        # The document and the user are independent reads
+        document_data, user_data = await asyncio.gather(
+            repo.get_document(status_request.document_id),
+            user_cache.get_async(session["email"], request)
+        )
+        if not document_data or document_data.get("company_name") != session["company_name"]:
+            raise HTTPException(status_code=404, detail="Document not found")
+        
+        # Check if user has access to this document (a cached record may
+        # predate the assignment, so confirm with a fresh read before refusing)
+        user_data = user_data or {}
+        if status_request.document_id not in user_data.get("docs_received", []):
+            user_data = await user_cache.get_async(session["email"], request, refresh=True) or {}
         
         if status_request.document_id not in user_data.get("docs_received", []):
             raise HTTPException(status_code=403, detail="Document not assigned to you")
             
-        # Find and update personal document status
-        personal_status_query = db.collection("personal_doc_status").where(
-            "document_id", "==", status_request.document_id
-        ).where("employee_email", "==", session["email"])
-        
-        personal_docs = list(personal_status_query.get())
-        
-        if personal_docs:
-            # Update existing record
-            personal_doc_ref = personal_docs[0].reference
-            personal_doc_ref.update({
-                "personal_status": status_request.status,
-                "comments": status_request.comments,
-                "last_updated": datetime.now()
-            })
-        else:
-            # Create new record
-            personal_doc = PersonalDocumentStatus(
-                document_id=status_request.document_id,
-                employee_email=session["email"],
-                personal_status=status_request.status,
-                comments=status_request.comments,
-                last_updated=datetime.now()
-            )
-            db.collection("personal_doc_status").add(personal_doc.dict())
+        # Keyed record: create or update in one write, no lookup query
+        personal_doc = PersonalDocumentStatus(
+            document_id=status_request.document_id,
+            employee_email=session["email"],
+            personal_status=status_request.status,
+            comments=status_request.comments,
+            last_updated=datetime.now()
+        )
+        await repo.set_personal_status(status_request.document_id, session["email"], personal_doc.dict())
             
         return {"message": "Personal document status updated successfully"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1272,36 +1255,33 @@ async def get_employee_document_status(request: Request, document_id: str):
     try:
         session = require_admin(request)
         
-        # Verify document belongs to admin's company
-        doc_ref = db.collection("documents").document(document_id)
-        doc = doc_ref.get()
+        document_data = await repo.get_document(document_id)
         
-        if not doc.exists:
+        if not document_data:
             raise HTTPException(status_code=404, detail="Document not found")
             
-        document_data = doc.to_dict()
         if document_data["company_name"] != session["company_name"]:
             raise HTTPException(status_code=403, detail="Access denied")
-            
-        # Get all personal statuses for this document
-        personal_status_query = db.collection("personal_doc_status").where(
-            "document_id", "==", document_id
-        )
         
-        personal_statuses = personal_status_query.get()
-        employee_statuses = []
+        assignees = document_data.get("assignees")
+        if assignees is None:
+            # Assigned before the assignees index (see migrations/document_assignees.py)
+            employee_statuses = await repo.list_document_statuses(document_id)
+            employees = await repo.get_users_by_emails(
+                [status_data["employee_email"] for status_data in employee_statuses]
+            )
+        else:
+            # The assignees' status records and user records: keyed, independent reads
+            employee_statuses, employees = await asyncio.gather(
+                repo.get_document_statuses(document_id, assignees),
+                repo.get_users_by_emails(assignees)
+            )
         
-        for status_doc in personal_statuses:
-            status_data = status_doc.to_dict()
-            
-            # Get employee name
-            employee_doc = db.collection("users").document(status_data["employee_email"]).get()
-            if employee_doc.exists:
-                employee_data = employee_doc.to_dict()
+        for status_data in employee_statuses:
+            employee_data = employees.get(status_data["employee_email"])
+            if employee_data:
                 status_data["employee_name"] = employee_data.get("name")
                 status_data["department_name"] = employee_data.get("department_name")
-                
-            employee_statuses.append(status_data)
             
         return {
             "document_id": document_id,
@@ -1309,5 +1289,25 @@ async def get_employee_document_status(request: Request, document_id: str):
             "employee_statuses": employee_statuses
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the DocuMind API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--preload", action="store_true",
+                        help="load the PDF libraries and model/storage clients at startup")
+    args = parser.parse_args()
+    if args.preload:
+        # Read by each worker process when it imports main
+        os.environ["PRELOAD"] = "true"
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
@@ -0,0 +1,169 @@
+# metrics.py - Per-request performance instrumentation
+#
+# The API's metrics middleware opens a RequestMetrics for every request. It is
+# held in a context variable that follows the request into the I/O pool and
+# the analysis threads, and these layers add to it:
+#   - repository:    data store round trips, document reads and writes
+#   - AsyncRepository: time spent in data calls
+#   - gemini_client: Gemini calls, input/output tokens and time in calls
+#   - fetch:         bytes downloaded
+# When the request ends the totals go to the Prometheus metrics served on
+# GET /metrics (labelled by route template) and to a Server-Timing header.
+# Work outside a request (job and batch workers) is counted under
+# route="background".
+#
+# With several worker processes, set PROMETHEUS_MULTIPROC_DIR so /metrics
+# aggregates all of them (see the prometheus_client docs).
+import contextlib
+import contextvars
+import os
+import threading
+from typing import Optional
+
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest,
+                               multiprocess, REGISTRY)
+
+BACKGROUND_ROUTE = "background"
+# Requests that matched no route share one label (no per-path series)
+UNMATCHED_ROUTE = "unmatched"
+
+REQUEST_LATENCY = Histogram(
+    "documind_http_request_duration_seconds", "Request latency by route",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+REQUEST_ROUND_TRIPS = Histogram(
+    "documind_request_datastore_round_trips", "Data store round trips per request",
+    ["route"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+)
+DATASTORE_OPERATIONS = Counter(
+    "documind_datastore_operations_total", "Data store round trips and documents read and written",
+    ["route", "operation"]
+)
+GEMINI_CALLS = Counter("documind_gemini_calls_total", "Gemini generate_content attempts", ["route"])
+GEMINI_TOKENS = Counter("documind_gemini_tokens_total", "Gemini tokens reported by the API",
+                        ["route", "direction"])
+DOWNLOAD_BYTES = Counter("documind_download_bytes_total", "Bytes downloaded by the file fetcher", ["route"])
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """What one request cost (thread-safe: gathered calls add concurrently)"""
+
+    def __init__(self):
+        self.round_trips = 0
+        self.reads = 0
+        self.writes = 0
+        self.db_seconds = 0.0
+        self.gemini_calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.llm_seconds = 0.0
+        self.bytes_downloaded = 0
+        self._lock = threading.Lock()
+
+    def add(self, **amounts):
+        with self._lock:
+            for field, amount in amounts.items():
+                setattr(self, field, getattr(self, field) + amount)
+
+
+def current() -> Optional[RequestMetrics]:
+    return _current.get()
+
+
+@contextlib.contextmanager
+def track_request():
+    """Collect the metrics of the work done inside the block (and by tasks and
+    threads that copy its context); yields the RequestMetrics"""
+    request_metrics = RequestMetrics()
+    token = _current.set(request_metrics)
+    try:
+        yield request_metrics
+    finally:
+        _current.reset(token)
+
+
+def record_datastore(round_trips: int = 1, reads: int = 0, writes: int = 0):
+    request_metrics = _current.get()
+    if request_metrics is not None:
+        request_metrics.add(round_trips=round_trips, reads=reads, writes=writes)
+    else:
+        _count_datastore(BACKGROUND_ROUTE, round_trips, reads, writes)
+
+
+def record_db_time(seconds: float):
+    request_metrics = _current.get()
+    if request_metrics is not None:
+        request_metrics.add(db_seconds=seconds)
+
+
+def record_gemini_call(seconds: float, input_tokens: int = 0, output_tokens: int = 0):
+    request_metrics = _current.get()
+    if request_metrics is not None:
+        request_metrics.add(gemini_calls=1, llm_seconds=seconds,
+                            input_tokens=input_tokens, output_tokens=output_tokens)
+    else:
+        _count_gemini(BACKGROUND_ROUTE, 1, input_tokens, output_tokens)
+
+
+def record_download(size: int):
+    request_metrics = _current.get()
+    if request_metrics is not None:
+        request_metrics.add(bytes_downloaded=size)
+    else:
+        DOWNLOAD_BYTES.labels(BACKGROUND_ROUTE).inc(size)
+
+
+def _count_datastore(route: str, round_trips: int, reads: int, writes: int):
+    for operation, amount in (("round_trips", round_trips), ("reads", reads), ("writes", writes)):
+        if amount:
+            DATASTORE_OPERATIONS.labels(route, operation).inc(amount)
+
+
+def _count_gemini(route: str, calls: int, input_tokens: int, output_tokens: int):
+    if calls:
+        GEMINI_CALLS.labels(route).inc(calls)
+    if input_tokens:
+        GEMINI_TOKENS.labels(route, "input").inc(input_tokens)
+    if output_tokens:
+        GEMINI_TOKENS.labels(route, "output").inc(output_tokens)
+
+
+def observe_request(method: str, route: Optional[str], status: int, seconds: float,
+                    request_metrics: RequestMetrics):
+    """Export a finished request's latency and costs"""
+    route = route or UNMATCHED_ROUTE
+    REQUEST_LATENCY.labels(method, route, str(status)).observe(seconds)
+    REQUEST_ROUND_TRIPS.labels(route).observe(request_metrics.round_trips)
+    _count_datastore(route, request_metrics.round_trips, request_metrics.reads, request_metrics.writes)
+    _count_gemini(route, request_metrics.gemini_calls, request_metrics.input_tokens, request_metrics.output_tokens)
+    if request_metrics.bytes_downloaded:
+        DOWNLOAD_BYTES.labels(route).inc(request_metrics.bytes_downloaded)
+
+
+def server_timing(seconds: float, request_metrics: RequestMetrics) -> str:
+    """Server-Timing header value (durations in ms; db and llm are summed
+    over calls, so concurrent calls can add up to more than app)"""
+    entries = [
+        f"app;dur={seconds * 1000:.1f}",
+        f'db;dur={request_metrics.db_seconds * 1000:.1f};desc="{request_metrics.round_trips} round trips, '
+        f'{request_metrics.reads} reads, {request_metrics.writes} writes"'
+    ]
+    if request_metrics.gemini_calls:
+        entries.append(f'llm;dur={request_metrics.llm_seconds * 1000:.1f};desc="{request_metrics.gemini_calls} '
+                       f'calls, {request_metrics.input_tokens} in / {request_metrics.output_tokens} out tokens"')
+    if request_metrics.bytes_downloaded:
+        entries.append(f'download;desc="{request_metrics.bytes_downloaded} bytes"')
+    return ", ".join(entries)
+
+
+def render_latest() -> tuple:
+    """(body, content type) for GET /metrics"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,71 @@
+"""Recompute the stored employee_count on departments from the users collection.
+
+Usage (from backend/):
+    python migrations/department_employee_counts.py [--dry-run] [--page-size N]
+
+Departments created before add/delete employee maintained employee_count
+incrementally can hold a stale count, which the counts-only overview of
+GET /departments/ (include_employees=false) returns as-is. Users are scanned
+page by page and counted per (company_name, department_name); departments
+whose stored count differs are corrected in batched writes. Safe to re-run.
+"""
+import argparse
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from firebase_admin_init import db  # noqa: E402
+from repository import DEPARTMENTS_COLLECTION, USERS_COLLECTION, FirestoreRepository  # noqa: E402
+
+
+def count_employees(page_size: int) -> Counter:
+    """Employees per (company_name, department_name), over every user"""
+    counts = Counter()
+    last = None
+    while True:
+        query = db.collection(USERS_COLLECTION).order_by("__name__").select(
+            ["company_name", "department_name"]
+        ).limit(page_size)
+        if last is not None:
+            query = query.start_after(last)
+        snapshots = list(query.stream())
+        if not snapshots:
+            break
+        last = snapshots[-1]
+        for snapshot in snapshots:
+            user_data = snapshot.to_dict()
+            if user_data.get("department_name"):
+                counts[(user_data.get("company_name"), user_data["department_name"])] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    parser.add_argument("--page-size", type=int, default=500)
+    args = parser.parse_args()
+
+    repo = FirestoreRepository(db)
+    counts = count_employees(args.page_size)
+
+    writes = []
+    scanned = 0
+    for dept_doc in db.collection(DEPARTMENTS_COLLECTION).select(
+        ["company_name", "department_name", "employee_count"]
+    ).stream():
+        scanned += 1
+        dept_data = dept_doc.to_dict()
+        count = counts.get((dept_data.get("company_name"), dept_data.get("department_name")), 0)
+        if dept_data.get("employee_count") != count:
+            writes.append(("update", dept_doc.reference, {"employee_count": count}))
+    if not args.dry_run:
+        repo.commit_writes(writes)
+
+    prefix = "[dry run] would have " if args.dry_run else ""
+    print(f"{prefix}corrected {len(writes)} department employee counts ({scanned} departments scanned)")
+
+
+if __name__ == "__main__":
+    main()
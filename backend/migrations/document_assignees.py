@@ -0,0 +1,69 @@
+"""Backfill the assignees array on documents from users' docs_received.
+
+Usage (from backend/):
+    python migrations/document_assignees.py [--dry-run] [--page-size N]
+
+Documents assigned before assignees existed are missing the reverse index.
+Deleting employees and departments finds assignments only through it (their
+statuses and assignee entries would be left behind), and
+/employee-document-status/ reads it. Run this before deploying that code.
+Users are scanned page by page and each document gets an ArrayUnion of its
+employees, so the script is safe to re-run.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from firebase_admin import firestore  # noqa: E402
+from firebase_admin_init import db  # noqa: E402
+from repository import DOCUMENTS_COLLECTION, USERS_COLLECTION, FirestoreRepository  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    parser.add_argument("--page-size", type=int, default=500)
+    args = parser.parse_args()
+
+    repo = FirestoreRepository(db)
+    scanned = updated = 0
+    last = None
+    while True:
+        query = db.collection(USERS_COLLECTION).order_by("__name__").select(
+            ["email", "docs_received"]
+        ).limit(args.page_size)
+        if last is not None:
+            query = query.start_after(last)
+        snapshots = list(query.stream())
+        if not snapshots:
+            break
+        last = snapshots[-1]
+
+        assignees = {}
+        for snapshot in snapshots:
+            user_data = snapshot.to_dict()
+            for doc_id in user_data.get("docs_received") or []:
+                assignees.setdefault(doc_id, []).append(user_data.get("email", snapshot.id))
+
+        existing = repo.existing_document_ids(list(assignees))
+        writes = [
+            ("update", db.collection(DOCUMENTS_COLLECTION).document(doc_id),
+             {"assignees": firestore.ArrayUnion(emails)})
+            for doc_id, emails in assignees.items()
+            if doc_id in existing
+        ]
+        if not args.dry_run:
+            repo.commit_writes(writes)
+
+        scanned += len(snapshots)
+        updated += len(writes)
+        print(f"scanned {scanned} users, document updates {updated}")
+
+    prefix = "[dry run] would have " if args.dry_run else ""
+    print(f"{prefix}applied {updated} document assignee updates ({scanned} users scanned)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Rewrite personal_doc_status records to {document_id}__{employee_email} IDs.
+
+Usage (from backend/):
+    python migrations/personal_status_ids.py [--dry-run] [--page-size N]
+
+Records created with auto IDs (or the older {document_id}:{email} form) are
+copied to the keyed ID and the old record is deleted. When several records
+exist for the same document and employee, the most recently updated one wins.
+Safe to re-run: records already under the keyed ID are left alone.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from firebase_admin_init import db  # noqa: E402
+from repository import (WRITE_BATCH_SIZE, PERSONAL_STATUS_COLLECTION as COLLECTION,  # noqa: E402
+                        FirestoreRepository, personal_status_id)
+
+
+def _newer(candidate: dict, current: dict) -> bool:
+    if current is None:
+        return True
+    candidate_time, current_time = candidate.get("last_updated"), current.get("last_updated")
+    if candidate_time is None:
+        return False
+    return current_time is None or candidate_time > current_time
+
+
+def migrate_page(snapshots, dry_run: bool) -> tuple:
+    """Migrate one page of records; returns (rewritten, deleted)"""
+    # Newest legacy record per keyed ID on this page
+    winners, legacy_refs = {}, []
+    for snapshot in snapshots:
+        data = snapshot.to_dict()
+        if not data.get("document_id") or not data.get("employee_email"):
+            print(f"  skipping {snapshot.id}: missing document_id/employee_email")
+            continue
+        target_id = personal_status_id(data["document_id"], data["employee_email"])
+        if snapshot.id == target_id:
+            continue
+        legacy_refs.append(snapshot.reference)
+        if _newer(data, winners.get(target_id)):
+            winners[target_id] = data
+
+    if not legacy_refs:
+        return 0, 0
+
+    # Keep an existing keyed record unless the legacy one is newer
+    target_refs = [db.collection(COLLECTION).document(target_id) for target_id in winners]
+    existing = {s.id: s.to_dict() for s in db.get_all(target_refs) if s.exists}
+    writes = [
+        ("set", db.collection(COLLECTION).document(target_id), data)
+        for target_id, data in winners.items()
+        if _newer(data, existing.get(target_id))
+    ]
+    writes += [("delete", ref, None) for ref in legacy_refs]
+
+    if not dry_run:
+        FirestoreRepository(db).commit_writes(writes)
+    return sum(1 for op, _, _ in writes if op == "set"), len(legacy_refs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    parser.add_argument("--page-size", type=int, default=WRITE_BATCH_SIZE // 2)
+    args = parser.parse_args()
+
+    scanned = rewritten = deleted = 0
+    last = None
+    while True:
+        query = db.collection(COLLECTION).order_by("__name__").limit(args.page_size)
+        if last is not None:
+            query = query.start_after(last)
+        snapshots = list(query.stream())
+        if not snapshots:
+            break
+        last = snapshots[-1]
+
+        page_rewritten, page_deleted = migrate_page(snapshots, args.dry_run)
+        scanned += len(snapshots)
+        rewritten += page_rewritten
+        deleted += page_deleted
+        print(f"scanned {scanned}, rewritten {rewritten}, legacy removed {deleted}")
+
+    prefix = "[dry run] would have " if args.dry_run else ""
+    print(f"{prefix}rewritten {rewritten} and removed {deleted} legacy records ({scanned} scanned)")
+
+
+if __name__ == "__main__":
+    main()
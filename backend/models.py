@@ -1,6 +1,6 @@
 # models.py
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List, Dict
 from datetime import datetime
 from enum import Enum
@@ -19,6 +19,12 @@ class DocumentStatus(str, Enum):
     DELETED = "deleted"
     IGNORED = "ignored"
 
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
 class PersonalDocStatus(str, Enum):
     PENDING = "pending"
     IN_PROGRESS = "in_progress"
@@ -93,12 +99,67 @@ class Document(BaseModel):
     importance_score: Optional[float] = None # 0–100
     departments_responsible: Optional[List[str]] = []
     departments_assigned: Optional[List[str]] = []  # Departments assigned by admin
+    assignees: Optional[List[str]] = []  # Emails of employees the document was assigned to
     confidence: Optional[float] = None
     key_findings: Optional[List[str]] = []
     analyzed_at: Optional[datetime] = None
     error_message: Optional[str] = None
     assigned_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
+    analysis_job_id: Optional[str] = None  # Latest analysis job for this document
+    content_hash: Optional[str] = None  # SHA-256 of analyzed text/file bytes (analysis cache key)
+    prompt_version: Optional[str] = None  # Prompt id ("name@version") that produced the analysis
+
+# Analysis fields returned by the model (validated before they are stored)
+class DocumentAnalysis(BaseModel):
+    summary: str
+    document_type: str
+    key_findings: List[str] = []
+    urgency_score: float = Field(ge=0, le=100)
+    importance_score: float = Field(ge=0, le=100)
+    departments_responsible: List[str] = []
+    confidence: float = Field(ge=0, le=100)
+
+# Background analysis job (polled via /jobs/{job_id})
+class AnalysisJob(BaseModel):
+    job_id: str
+    document_id: str
+    company_name: str
+    requested_by: EmailStr
+    status: JobStatus = JobStatus.QUEUED
+    executor: str
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error_message: Optional[str] = None
+    result: Optional[Dict] = None
+    attempts: int = 0
+    # A QUEUED/RUNNING job past this is presumed lost (see jobs.py)
+    lease_expires_at: Optional[datetime] = None
+
+# Server-side analysis of many documents (see bulk_analysis.py)
+class AnalysisBatch(BaseModel):
+    batch_id: str
+    company_name: str
+    requested_by: EmailStr
+    status: JobStatus = JobStatus.QUEUED
+    executor: str
+    filters: Dict = {}
+    document_ids: Optional[List[str]] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    total: int = 0
+    processed: int = 0
+    analyzed: int = 0      # sent to the model
+    cached: int = 0        # served from the analysis cache
+    deduplicated: int = 0  # same content as another document in the batch
+    skipped: int = 0       # owned by a single-document job, or deleted meanwhile
+    failed: int = 0
+    errors: List[Dict] = []  # the first few failures
+    error_message: Optional[str] = None
+    # Renewed with every progress flush; an active batch past it is presumed lost
+    lease_expires_at: Optional[datetime] = None
 
 # Personal document tracking for employees
 class PersonalDocumentStatus(BaseModel):
@@ -116,6 +177,7 @@ class Department(BaseModel):
     created_by: EmailStr
     created_at: Optional[datetime] = None
     description: Optional[str] = None
+    employee_count: int = 0  # Maintained by add/delete employee
 
 class DepartmentWithEmployees(BaseModel):
     department_id: str
@@ -132,6 +194,14 @@ class CreateDepartmentRequest(BaseModel):
 class AnalyzeDocumentRequest(BaseModel):
     document_id: str
 
+class BulkAnalyzeRequest(BaseModel):
+    # Either explicit ids, or filters over the company's documents
+    document_ids: Optional[List[str]] = None
+    processing_status: Optional[DocumentStatus] = None
+    stale_only: bool = False  # only documents analyzed with an older prompt version
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+
 class AssignDocumentRequest(BaseModel):
     document_id: str
     departments: List[str]
@@ -154,3 +224,12 @@ class FileUploadResponse(BaseModel):
     file_url: Optional[str] = None
     document_id: str
     message: str
+    job_id: Optional[str] = None  # Set when analysis was queued
+
+class FileUploadFailure(BaseModel):
+    file_name: Optional[str] = None
+    error: str
+
+class BulkUploadResponse(BaseModel):
+    uploaded: List[FileUploadResponse]
+    failed: List[FileUploadFailure] = []
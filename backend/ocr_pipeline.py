@@ -0,0 +1,119 @@
+# ocr_pipeline.py - Page pipeline for scanned PDFs
+#
+# Pages are rendered in a process pool and handed to the OCR step in chunks of
+# OCR_CHUNK_PAGES. At most OCR_RENDER_WORKERS chunks are rendered ahead of the
+# OCR step, so peak memory depends on the chunk size, not the page count.
+# Per-page OCR text is cached by the hash of the rendered page, so re-analyzing
+# a document only re-transcribes pages that changed.
+#
+# Keep this module light: it is imported by the spawned render processes and
+# by the API at startup (PyMuPDF is imported on first use).
+import hashlib
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, Optional, Tuple
+
+OCR_DPI = int(os.getenv("OCR_DPI", "180"))  # good DPI for OCR
+OCR_CHUNK_PAGES = int(os.getenv("OCR_CHUNK_PAGES", "8"))
+OCR_RENDER_WORKERS = int(os.getenv("OCR_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# (page_number, png_bytes)
+RenderedPage = Tuple[int, bytes]
+
+_render_pool = None
+
+
+def _get_render_pool() -> ProcessPoolExecutor:
+    global _render_pool
+    if _render_pool is None:
+        # spawn, not fork: the API process has gRPC/Firestore threads running
+        _render_pool = ProcessPoolExecutor(
+            max_workers=OCR_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _render_pool
+
+
+def render_pages(pdf_path: str, page_numbers: List[int], dpi: int) -> List[RenderedPage]:
+    """Render the given pages to PNG (runs in a render process)"""
+    import fitz  # PyMuPDF
+    pdf = fitz.open(pdf_path)
+    try:
+        return [(i, pdf.load_page(i).get_pixmap(dpi=dpi).tobytes("png")) for i in page_numbers]
+    finally:
+        pdf.close()
+
+
+def iter_rendered_chunks(
+    pdf_path: str,
+    page_numbers: List[int],
+    dpi: int,
+    chunk_pages: int,
+) -> Iterator[List[RenderedPage]]:
+    """Yield rendered chunks in page order, keeping a bounded number in flight"""
+    pool = _get_render_pool()
+    chunks = iter([page_numbers[i:i + chunk_pages] for i in range(0, len(page_numbers), chunk_pages)])
+
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.submit(render_pages, pdf_path, chunk, dpi))
+        if len(pending) >= OCR_RENDER_WORKERS:
+            break
+
+    while pending:
+        rendered = pending.popleft().result()
+        chunk = next(chunks, None)
+        if chunk is not None:
+            pending.append(pool.submit(render_pages, pdf_path, chunk, dpi))
+        yield rendered
+
+
+def page_hash(png_bytes: bytes) -> str:
+    return hashlib.sha256(png_bytes).hexdigest()
+
+
+def ocr_pdf_pages(
+    pdf_path: str,
+    transcribe: Callable[[List[bytes]], List[str]],
+    cache=None,
+    cache_key: Optional[Callable[[str], str]] = None,
+    dpi: int = OCR_DPI,
+    chunk_pages: int = OCR_CHUNK_PAGES,
+    page_numbers: Optional[List[int]] = None,
+) -> List[str]:
+    """OCR pages of the scanned PDF at pdf_path and return their texts in order.
+
+    page_numbers limits OCR to those pages (default: every page).
+    transcribe receives the PNGs of one chunk's uncached pages and returns
+    one text per image. cache/cache_key (an AnalysisCache and a page-hash ->
+    key function) enable per-page caching.
+    """
+    if page_numbers is None:
+        import fitz  # PyMuPDF
+        pdf = fitz.open(pdf_path)
+        page_numbers = list(range(len(pdf)))
+        pdf.close()
+
+    page_texts = []
+    for rendered in iter_rendered_chunks(pdf_path, sorted(page_numbers), dpi, chunk_pages):
+        chunk_texts = {}
+        uncached = []
+        for page_number, png_bytes in rendered:
+            key = cache_key(page_hash(png_bytes)) if cache is not None else None
+            cached = cache.get(key) if key else None
+            if cached is not None:
+                chunk_texts[page_number] = cached["text"]
+            else:
+                uncached.append((page_number, png_bytes, key))
+
+        if uncached:
+            texts = transcribe([png_bytes for _, png_bytes, _ in uncached])
+            for (page_number, _, key), text in zip(uncached, texts):
+                chunk_texts[page_number] = text
+                if key:
+                    cache.set(key, {"text": text})
+
+        page_texts.extend(chunk_texts[page_number] for page_number, _ in rendered)
+    return page_texts
@@ -0,0 +1,130 @@
+# passwords.py - Salted, tunable password hashing that runs off the event loop
+#
+# New hashes use scrypt (default) or PBKDF2-SHA256, selected by PASSWORD_HASHER,
+# and are stored with their parameters:
+#   scrypt$<n>$<r>$<p>$<salt>$<hash>
+#   pbkdf2_sha256$<iterations>$<salt>$<hash>
+# Legacy unsalted SHA-256 hex digests still verify and are reported as needing
+# a rehash, so login upgrades them transparently. Routes use the *_async
+# helpers, which run on a dedicated bounded pool (PASSWORD_HASH_WORKERS). A
+# burst of logins therefore queues there instead of blocking the event loop or
+# starving the default threadpool.
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PASSWORD_HASHER = os.getenv("PASSWORD_HASHER", "scrypt").lower()
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+PASSWORD_PBKDF2_ITERATIONS = int(os.getenv("PASSWORD_PBKDF2_ITERATIONS", "600000"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+_pool = None
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    # hashlib releases the GIL while hashing, so threads give real parallelism
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+    return _pool
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+        maxmem=2 * 128 * n * r * p + 1024 * 1024, dklen=HASH_BYTES
+    )
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations, dklen=HASH_BYTES)
+
+
+def hash_password(password: str) -> str:
+    """Hash a password with the configured algorithm and a random salt"""
+    salt = os.urandom(SALT_BYTES)
+    if PASSWORD_HASHER == "pbkdf2":
+        digest = _pbkdf2(password, salt, PASSWORD_PBKDF2_ITERATIONS)
+        return f"pbkdf2_sha256${PASSWORD_PBKDF2_ITERATIONS}${_b64encode(salt)}${_b64encode(digest)}"
+    if PASSWORD_HASHER != "scrypt":
+        raise ValueError(f"Unknown PASSWORD_HASHER '{PASSWORD_HASHER}' (choose scrypt or pbkdf2)")
+    digest = _scrypt(password, salt, PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+    return (f"scrypt${PASSWORD_SCRYPT_N}${PASSWORD_SCRYPT_R}${PASSWORD_SCRYPT_P}$"
+            f"{_b64encode(salt)}${_b64encode(digest)}")
+
+
+def _current_prefix() -> str:
+    if PASSWORD_HASHER == "pbkdf2":
+        return f"pbkdf2_sha256${PASSWORD_PBKDF2_ITERATIONS}$"
+    return f"scrypt${PASSWORD_SCRYPT_N}${PASSWORD_SCRYPT_R}${PASSWORD_SCRYPT_P}$"
+
+
+def verify_password(password: str, stored_hash: str) -> Tuple[bool, bool]:
+    """Check a password against a stored hash.
+
+    Returns (matches, needs_rehash); needs_rehash is True for legacy SHA-256
+    hashes and for hashes made with other algorithms or cost parameters.
+    """
+    if not stored_hash:
+        return False, False
+
+    parts = stored_hash.split("$")
+    try:
+        if parts[0] == "scrypt" and len(parts) == 6:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            expected = base64.b64decode(parts[5])
+            digest = _scrypt(password, base64.b64decode(parts[4]), n, r, p)
+        elif parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+            expected = base64.b64decode(parts[3])
+            digest = _pbkdf2(password, base64.b64decode(parts[2]), int(parts[1]))
+        elif len(parts) == 1:
+            # Legacy: unsalted SHA-256 hex digest
+            legacy = hashlib.sha256(password.encode()).hexdigest()
+            return hmac.compare_digest(legacy, stored_hash), True
+        else:
+            return False, False
+    except (ValueError, TypeError):
+        return False, False
+
+    matches = hmac.compare_digest(digest, expected)
+    return matches, matches and not stored_hash.startswith(_current_prefix())
+
+
+# Verified when the user does not exist, so unknown emails take as long as wrong passwords
+_DUMMY_HASH = None
+
+
+def verify_missing_user(password: str):
+    global _DUMMY_HASH
+    if _DUMMY_HASH is None:
+        _DUMMY_HASH = hash_password("not-a-real-password")
+    verify_password(password, _DUMMY_HASH)
+
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_get_pool(), hash_password, password)
+
+
+async def verify_password_async(password: str, stored_hash: str) -> Tuple[bool, bool]:
+    return await asyncio.get_running_loop().run_in_executor(_get_pool(), verify_password, password, stored_hash)
+
+
+async def verify_missing_user_async(password: str):
+    await asyncio.get_running_loop().run_in_executor(_get_pool(), verify_missing_user, password)
@@ -0,0 +1,108 @@
+# prompts.py - Versioned prompt templates
+#
+# Every prompt sent to the model is registered here under a name and version.
+# Templates are parsed once at import; rendering is a single str.format call.
+# A prompt's id ("name@version") is stored with each analysis and is part of
+# the analysis cache key. Registering a new version therefore makes documents
+# analyzed with the old one stale (see analysis.is_analysis_stale) without
+# invalidating anything else.
+#
+# The newest registered version of each prompt is active. PROMPT_VERSIONS pins
+# versions, e.g. PROMPT_VERSIONS="document_analysis=v1,ocr_pages=v1".
+import os
+import string
+import textwrap
+from typing import Dict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class PromptTemplate:
+    """A prompt plus optional named fragments, versioned together"""
+
+    def __init__(self, name: str, version: str, template: str, **fragments: str):
+        self.name = name
+        self.version = version
+        self.id = f"{name}@{version}"
+        self.template = textwrap.dedent(template).strip()
+        self.fields = _fields(self.template)
+        self.fragments = {key: textwrap.dedent(text).strip() for key, text in fragments.items()}
+
+    def render(self, **values) -> str:
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Prompt {self.id} is missing values for: {', '.join(sorted(missing))}")
+        return self.template.format(**values)
+
+    def fragment(self, key: str, **values) -> str:
+        return self.fragments[key].format(**values)
+
+
+def _fields(template: str) -> set:
+    return {field for _, field, _, _ in string.Formatter().parse(template) if field}
+
+
+_registry: Dict[str, Dict[str, PromptTemplate]] = {}
+
+
+def register(name: str, version: str, template: str, **fragments: str) -> PromptTemplate:
+    prompt = PromptTemplate(name, version, template, **fragments)
+    _registry.setdefault(name, {})[version] = prompt
+    return prompt
+
+
+def get_prompt(name: str, version: str = None) -> PromptTemplate:
+    """A registered prompt (the active version unless one is given)"""
+    versions = _registry[name]
+    return versions[version or _active_versions.get(name) or list(versions)[-1]]
+
+
+def _parse_pins(value: str) -> Dict[str, str]:
+    pins = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, version = item.split("=", 1)
+            pins[name.strip()] = version.strip()
+    return pins
+
+
+_active_versions = _parse_pins(os.getenv("PROMPT_VERSIONS", ""))
+
+
+# ---------------------------- PROMPTS ----------------------------
+# Register new versions below the old ones; never edit a registered version.
+
+register("document_analysis", "v1", """
+    Analyze this document and return ONLY JSON with:
+    summary (2-3 sentences), document_type, key_findings (list),
+    urgency_score (0-100), importance_score (0-100),
+    departments_responsible (list of departments that should handle it),
+    confidence (0-100).
+    {part_note}
+    Document text:
+    {text}
+""", part_note="""
+    This is part {part} of {total} of a longer document; analyze this part only.
+""")
+
+register("image_analysis", "v1", """
+    Analyze this image (OCR if needed).
+    Return ONLY valid JSON with:
+    summary (2-3 sentences), document_type, key_findings (list),
+    urgency_score (0-100), importance_score (0-100),
+    departments_responsible (list of departments that should handle it),
+    confidence (0-100).
+""")
+
+register("ocr_pages", "v1", """
+    Perform OCR on these {page_count} scanned pages.
+    Return ONLY valid JSON: {{"pages": ["<text of page 1>", ...]}}
+    with exactly {page_count} strings, in page order.
+""")
+
+# Active versions, used by the analysis providers and cache keys
+DOCUMENT_PROMPT = get_prompt("document_analysis")
+IMAGE_PROMPT = get_prompt("image_analysis")
+OCR_PROMPT = get_prompt("ocr_pages")
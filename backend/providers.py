@@ -0,0 +1,441 @@
+# providers.py - Pluggable analysis providers
+#
+# ANALYSIS_PROVIDER selects who analyzes documents:
+#   gemini     - Google Gemini (default; needs GENAI_API_KEY/GOOGLE_API_KEY)
+#   stub       - deterministic offline answers with configurable latency and
+#                failure injection (STUB_LATENCY_MS, STUB_FAILURE_RATE), for
+#                load tests without network access or API spend
+#   heuristic  - keyword-based classifier, no network; text only
+# A comma-separated list ("gemini,heuristic") fails over in order. Results
+# from a fallback provider are marked with "fallback" and are not cached.
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from pydantic import ValidationError
+
+from models import DocumentAnalysis
+from gemini_client import GeminiClient, OverloadedError  # noqa: F401
+from prompts import DOCUMENT_PROMPT, IMAGE_PROMPT, OCR_PROMPT
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_PROVIDER = os.getenv("ANALYSIS_PROVIDER", "gemini").lower()
+
+# Accept either GENAI_API_KEY or GOOGLE_API_KEY
+GENAI_API_KEY = os.getenv("GENAI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+GEMINI_NOT_CONFIGURED = "Gemini API not configured. Set GENAI_API_KEY or GOOGLE_API_KEY in environment."
+GEMINI_MODEL_NAME = "gemini-2.5-flash-image"
+# Ask for JSON responses constrained to a schema (set false for models without JSON mode)
+GEMINI_JSON_MODE = os.getenv("GEMINI_JSON_MODE", "true").lower() == "true"
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "0"))
+STUB_FAILURE_RATE = float(os.getenv("STUB_FAILURE_RATE", "0"))
+STUB_SEED = int(os.getenv("STUB_SEED", "0"))
+
+
+class AnalysisError(Exception):
+    """Raised when a document cannot be analyzed"""
+
+
+class MalformedResponseError(AnalysisError):
+    """The model's response was not a valid analysis"""
+
+
+class ProviderUnavailableError(AnalysisError):
+    """The provider cannot serve the request (not configured, failing, unsupported input)"""
+
+
+# ---------------------------- RESPONSE PARSING ----------------------------
+
+_SCORE = {"type": "number", "description": "0-100"}
+_STRINGS = {"type": "array", "items": {"type": "string"}}
+
+# Mirrors models.DocumentAnalysis
+ANALYSIS_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "document_type": {"type": "string"},
+        "key_findings": _STRINGS,
+        "urgency_score": _SCORE,
+        "importance_score": _SCORE,
+        "departments_responsible": _STRINGS,
+        "confidence": _SCORE
+    },
+    "required": ["summary", "document_type", "key_findings", "urgency_score",
+                 "importance_score", "departments_responsible", "confidence"]
+}
+
+OCR_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {"pages": _STRINGS},
+    "required": ["pages"]
+}
+
+
+def _json_config(schema: dict) -> Optional[dict]:
+    if not GEMINI_JSON_MODE:
+        return None
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+
+ANALYSIS_GENERATION_CONFIG = _json_config(ANALYSIS_RESPONSE_SCHEMA)
+OCR_GENERATION_CONFIG = _json_config(OCR_RESPONSE_SCHEMA)
+
+# How model responses parsed: "json" (the whole text), "recovered" (JSON found
+# inside fences/prose/trailing text) or "malformed" (no valid analysis)
+_response_stats = {"json": 0, "recovered": 0, "malformed": 0}
+_response_stats_lock = threading.Lock()
+_json_decoder = json.JSONDecoder()
+
+
+def _count_response(outcome: str):
+    with _response_stats_lock:
+        _response_stats[outcome] += 1
+
+
+def response_stats() -> dict:
+    with _response_stats_lock:
+        return dict(_response_stats)
+
+
+def extract_json_object(response_text: str) -> Optional[dict]:
+    """The first JSON object in the text, or None.
+
+    JSON-mode responses parse in one json.loads. Otherwise the text is scanned
+    from each "{" with raw_decode, which stops at the end of the object, so
+    markdown fences, prose and trailing text are skipped without regexes.
+    """
+    text = response_text.strip()
+    try:
+        value = json.loads(text)
+        if isinstance(value, dict):
+            return value
+    except ValueError:
+        pass
+
+    start = text.find("{")
+    while start != -1:
+        try:
+            value, _ = _json_decoder.raw_decode(text, start)
+            if isinstance(value, dict):
+                return value
+        except ValueError:
+            pass
+        start = text.find("{", start + 1)
+    return None
+
+
+def parse_gemini_response(response_text: str) -> dict:
+    """Parse and validate an analysis response.
+
+    Raises MalformedResponseError instead of guessing scores when the
+    response is not a valid analysis.
+    """
+    text = (response_text or "").strip()
+    try:
+        value = json.loads(text)
+        outcome = "json"
+    except ValueError:
+        value = extract_json_object(text)
+        outcome = "recovered"
+
+    try:
+        if not isinstance(value, dict):
+            raise ValueError("no JSON object in response")
+        analysis = DocumentAnalysis.model_validate(value).model_dump()
+    except (ValueError, ValidationError) as e:
+        _count_response("malformed")
+        logger.warning("Malformed Gemini response", extra={"chars": len(text), "error": str(e)})
+        raise MalformedResponseError(f"Malformed analysis response: {e}")
+
+    _count_response(outcome)
+    return analysis
+
+
+# ---------------------------- PROVIDERS ----------------------------
+
+class AnalysisProvider(ABC):
+    name = "base"
+
+    @property
+    def model_name(self) -> str:
+        """Identifies the model in cache keys (different models never share entries)"""
+        return self.name
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    def stats(self) -> dict:
+        return {"name": self.name}
+
+    @abstractmethod
+    def analyze_text(self, text: str, part: int = 1, total: int = 1) -> dict:
+        """Analyze one chunk of document text (part/total when chunked)"""
+
+    @abstractmethod
+    def analyze_image(self, image_bytes: bytes, mime_type: str) -> dict:
+        """Analyze an image document"""
+
+    @abstractmethod
+    def transcribe_pages(self, png_pages: List[bytes]) -> List[str]:
+        """OCR rendered pages, one text per page"""
+
+
+class GeminiProvider(AnalysisProvider):
+    name = "gemini"
+
+    def __init__(self, api_key: Optional[str] = GENAI_API_KEY, model_name: str = GEMINI_MODEL_NAME):
+        self._model_name = model_name
+        self.model = None
+        self.client = None
+        self.types = None
+        if not api_key:
+            logger.warning("No Gemini API key found in env (GENAI_API_KEY/GOOGLE_API_KEY)")
+            return
+        try:
+            import google.generativeai as genai
+            try:
+                # types provides Blob/Part for multimodal inputs
+                from google.generativeai import types
+                self.types = types
+            except Exception:
+                self.types = None
+            genai.configure(api_key=api_key)
+            self.model = genai.GenerativeModel(model_name)
+            self.client = GeminiClient(self.model)
+            logger.info("Gemini model initialized", extra={"model": model_name})
+        except Exception as e:
+            logger.error("Failed to initialize Gemini model", extra={"error": str(e)})
+            self.model = None
+
+    @property
+    def model_name(self) -> str:
+        return self._model_name
+
+    @property
+    def available(self) -> bool:
+        return self.model is not None
+
+    def stats(self) -> dict:
+        return {"name": self.name, "model": self.model_name,
+                "client": self.client.stats() if self.client else None}
+
+    def _require_model(self):
+        if self.model is None:
+            raise ProviderUnavailableError(GEMINI_NOT_CONFIGURED)
+
+    def _image_part(self, data: bytes, mime_type: str):
+        if self.types is None:
+            raise ProviderUnavailableError("google.generativeai 'types' module not available for multimodal inputs. Please upgrade/install the latest google-generativeai package.")
+        return self.types.Part(inline_data=self.types.Blob(mime_type=mime_type, data=data))
+
+    def analyze_text(self, text: str, part: int = 1, total: int = 1) -> dict:
+        self._require_model()
+        part_note = DOCUMENT_PROMPT.fragment("part_note", part=part, total=total) if total > 1 else ""
+        prompt = DOCUMENT_PROMPT.render(text=text, part_note=part_note)
+        response = self.client.generate(prompt, generation_config=ANALYSIS_GENERATION_CONFIG)
+        return parse_gemini_response(response.text)
+
+    def analyze_image(self, image_bytes: bytes, mime_type: str) -> dict:
+        self._require_model()
+        image_part = self._image_part(image_bytes, mime_type)
+        # gemini-2.5-flash supports image inputs without the -image suffix
+        result = self.client.generate([image_part, IMAGE_PROMPT.render()], generation_config=ANALYSIS_GENERATION_CONFIG)
+        return parse_gemini_response(result.text)
+
+    def transcribe_pages(self, png_pages: List[bytes]) -> List[str]:
+        self._require_model()
+        parts = [self._image_part(png_bytes, "image/png") for png_bytes in png_pages]
+        prompt = OCR_PROMPT.render(page_count=len(png_pages))
+
+        result = self.client.generate([*parts, prompt], generation_config=OCR_GENERATION_CONFIG)
+        pages = (extract_json_object(result.text) or {}).get("pages")
+
+        if isinstance(pages, list) and len(pages) == len(png_pages):
+            return [str(page) for page in pages]
+        if len(png_pages) == 1:
+            # Plain-text answer for a single page is still a usable transcription
+            return [result.text]
+        # Page count mismatch: fall back to one request per page
+        return [self.transcribe_pages([png_bytes])[0] for png_bytes in png_pages]
+
+
+class StubProvider(AnalysisProvider):
+    """Deterministic offline provider: the same input always gives the same analysis"""
+    name = "stub"
+
+    DOCUMENT_TYPES = ["Invoice", "Contract", "Report", "Memo", "Policy", "Notice"]
+    DEPARTMENTS = ["Finance", "Legal", "HR", "Operations", "IT", "Sales"]
+
+    def __init__(self, latency_ms: float = STUB_LATENCY_MS, failure_rate: float = STUB_FAILURE_RATE,
+                 seed: int = STUB_SEED):
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _simulate_call(self):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if self.failure_rate:
+            with self._lock:
+                failed = self._random.random() < self.failure_rate
+            if failed:
+                raise ProviderUnavailableError("Injected stub provider failure")
+
+    def _analysis(self, content: bytes, summary: str) -> dict:
+        digest = hashlib.sha256(content).digest()
+        return {
+            "summary": summary,
+            "document_type": self.DOCUMENT_TYPES[digest[0] % len(self.DOCUMENT_TYPES)],
+            "key_findings": [f"Stub finding {digest[1] % 10}"],
+            "urgency_score": float(digest[2] % 101),
+            "importance_score": float(digest[3] % 101),
+            "departments_responsible": [self.DEPARTMENTS[digest[4] % len(self.DEPARTMENTS)]],
+            "confidence": float(50 + digest[5] % 51)
+        }
+
+    def analyze_text(self, text: str, part: int = 1, total: int = 1) -> dict:
+        self._simulate_call()
+        return self._analysis(text.encode("utf-8"), " ".join(text.split()[:30]))
+
+    def analyze_image(self, image_bytes: bytes, mime_type: str) -> dict:
+        self._simulate_call()
+        return self._analysis(image_bytes, f"Stub analysis of a {len(image_bytes)} byte {mime_type} image")
+
+    def transcribe_pages(self, png_pages: List[bytes]) -> List[str]:
+        self._simulate_call()
+        return [f"Stub transcription of page image {hashlib.sha256(png).hexdigest()[:12]}" for png in png_pages]
+
+
+class HeuristicProvider(AnalysisProvider):
+    """Keyword-based classifier that needs no network (text documents only)"""
+    name = "heuristic"
+
+    DOCUMENT_TYPES = {
+        "Invoice": ["invoice", "amount due", "bill to", "payment terms", "total due"],
+        "Contract": ["agreement", "hereby", "parties", "terms and conditions", "shall"],
+        "Legal Notice": ["court", "lawsuit", "legal notice", "summons", "plaintiff"],
+        "Policy": ["policy", "compliance", "procedure", "guidelines"],
+        "Report": ["report", "summary of findings", "analysis", "quarter"],
+        "Resume": ["resume", "curriculum vitae", "work experience", "education"],
+        "Memo": ["memo", "memorandum", "to all staff"],
+    }
+    DEPARTMENTS = {
+        "Finance": ["invoice", "payment", "budget", "tax", "refund", "expense"],
+        "Legal": ["agreement", "contract", "court", "liability", "compliance"],
+        "HR": ["employee", "hiring", "leave", "payroll", "resume", "benefits"],
+        "IT": ["software", "server", "password", "security incident", "outage"],
+        "Operations": ["delivery", "shipment", "inventory", "vendor", "maintenance"],
+        "Sales": ["customer", "quote", "order", "pricing", "lead"],
+    }
+    URGENCY = {"urgent": 30, "immediately": 25, "asap": 25, "overdue": 25, "past due": 25,
+               "final notice": 30, "deadline": 15, "within 24 hours": 25, "as soon as possible": 20}
+    IMPORTANCE = {"legal": 15, "termination": 20, "penalty": 20, "breach": 25, "confidential": 15,
+                  "audit": 15, "security": 15, "contract": 10}
+
+    def analyze_text(self, text: str, part: int = 1, total: int = 1) -> dict:
+        lowered = text.lower()
+
+        def hits(keywords):
+            return sum(lowered.count(keyword) for keyword in keywords)
+
+        type_hits = {doc_type: hits(keywords) for doc_type, keywords in self.DOCUMENT_TYPES.items()}
+        document_type, best = max(type_hits.items(), key=lambda item: item[1])
+        departments = [dept for dept, keywords in self.DEPARTMENTS.items() if hits(keywords)]
+        urgency = min(100, 20 + sum(weight for keyword, weight in self.URGENCY.items() if keyword in lowered))
+        importance = min(100, 30 + sum(weight for keyword, weight in self.IMPORTANCE.items() if keyword in lowered))
+
+        sentences = [s.strip() for s in text.replace("\n", " ").split(". ") if s.strip()]
+        flagged = [s for s in sentences if any(keyword in s.lower() for keyword in self.URGENCY)]
+        return {
+            "summary": ". ".join(sentences[:2])[:300],
+            "document_type": document_type if best else "Unknown",
+            "key_findings": [s[:200] for s in flagged[:5]],
+            "urgency_score": float(urgency),
+            "importance_score": float(importance),
+            "departments_responsible": departments or ["General"],
+            "confidence": float(min(80, 30 + 5 * best))
+        }
+
+    def analyze_image(self, image_bytes: bytes, mime_type: str) -> dict:
+        raise ProviderUnavailableError("The heuristic provider cannot analyze images")
+
+    def transcribe_pages(self, png_pages: List[bytes]) -> List[str]:
+        raise ProviderUnavailableError("The heuristic provider cannot transcribe scanned pages")
+
+
+class FailoverProvider(AnalysisProvider):
+    """Tries providers in order; a result from a later one is marked as a fallback"""
+
+    def __init__(self, providers: List[AnalysisProvider]):
+        self.providers = providers
+        self.name = ",".join(provider.name for provider in providers)
+
+    @property
+    def model_name(self) -> str:
+        return self.providers[0].model_name
+
+    @property
+    def available(self) -> bool:
+        return any(provider.available for provider in self.providers)
+
+    def stats(self) -> dict:
+        return {"name": self.name, "providers": [provider.stats() for provider in self.providers]}
+
+    def _call(self, method: str, *args):
+        error = None
+        for index, provider in enumerate(self.providers):
+            if not provider.available:
+                continue
+            try:
+                result = getattr(provider, method)(*args)
+            except Exception as e:
+                logger.warning("Analysis provider failed", extra={
+                    "provider": provider.name, "method": method, "error": str(e)
+                })
+                error = e
+                continue
+            if index and isinstance(result, dict):
+                result["fallback"] = provider.name
+            return result
+        raise error or ProviderUnavailableError("No analysis provider available")
+
+    def analyze_text(self, text: str, part: int = 1, total: int = 1) -> dict:
+        return self._call("analyze_text", text, part, total)
+
+    def analyze_image(self, image_bytes: bytes, mime_type: str) -> dict:
+        return self._call("analyze_image", image_bytes, mime_type)
+
+    def transcribe_pages(self, png_pages: List[bytes]) -> List[str]:
+        # Transcriptions are cached per page, so only the primary may produce them
+        return self.providers[0].transcribe_pages(png_pages)
+
+
+PROVIDERS = {
+    GeminiProvider.name: GeminiProvider,
+    StubProvider.name: StubProvider,
+    HeuristicProvider.name: HeuristicProvider,
+}
+
+
+def create_provider(spec: str = ANALYSIS_PROVIDER) -> AnalysisProvider:
+    """Provider for a spec like "gemini" or "gemini,heuristic" (failover order)"""
+    names = [name.strip() for name in spec.split(",") if name.strip()]
+    unknown = [name for name in names if name not in PROVIDERS]
+    if not names or unknown:
+        raise ValueError(f"Unknown ANALYSIS_PROVIDER '{spec}' (choose from {', '.join(PROVIDERS)})")
+    providers = [PROVIDERS[name]() for name in names]
+    return providers[0] if len(providers) == 1 else FailoverProvider(providers)
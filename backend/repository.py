@@ -0,0 +1,1134 @@
+# repository.py - Data access for the API routes and workers
+#
+# Each method maps to one access pattern and issues a bounded number of round
+# trips regardless of how many records are involved (no per-item reads).
+# Collection names live here only. DATA_BACKEND selects the implementation:
+#   firestore (default) - FirestoreRepository (also runs against the Firestore
+#                         emulator when FIRESTORE_EMULATOR_HOST is set)
+#   memory              - InMemoryRepository, dict-backed with the same round-trip
+#                         shapes (for benchmarks and local runs without Firebase)
+# Both report each call's round trips, document reads and writes to metrics.py,
+# which attributes them to the current request.
+# Routes use it through AsyncRepository, which runs the blocking calls on a
+# dedicated I/O pool so the event loop keeps serving requests.
+# The Firestore SDK (and gRPC) is imported by the methods that need it, and the
+# repository is only created on first use, so importing this module is cheap.
+import asyncio
+import contextvars
+import copy
+import functools
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+import metrics
+from models import JobStatus
+
+load_dotenv()
+
+DATA_BACKEND = os.getenv("DATA_BACKEND", "firestore").lower()
+
+USERS_COLLECTION = "users"
+DOCUMENTS_COLLECTION = "documents"
+DEPARTMENTS_COLLECTION = "departments"
+PERSONAL_STATUS_COLLECTION = "personal_doc_status"
+JOBS_COLLECTION = "analysis_jobs"
+BATCHES_COLLECTION = "analysis_batches"
+# Emails of changed users, for other processes' user caches (watch_users)
+USER_CHANGES_COLLECTION = "user_changes"
+# Change records are only read by listeners already running: expire them with a
+# Firestore TTL policy on expires_at
+USER_CHANGES_RETENTION = timedelta(hours=1)
+
+# Documents fetched per db.get_all() call
+GET_ALL_CHUNK_SIZE = 300
+# Firestore's limit on writes per batch commit
+WRITE_BATCH_SIZE = 500
+# Firestore's limit on values in an "in" filter
+IN_QUERY_LIMIT = 30
+# Threads for blocking Firestore calls made from async routes
+FIRESTORE_IO_WORKERS = int(os.getenv("FIRESTORE_IO_WORKERS", "32"))
+
+
+def chunked(items: List, size: int) -> Iterable[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def personal_status_id(document_id: str, employee_email: str) -> str:
+    """personal_doc_status records are keyed by (document, employee).
+
+    Lookups are single-document gets and updates are blind writes; see
+    migrations/personal_status_ids.py for rewriting older auto-ID records.
+    """
+    return f"{document_id}__{employee_email}"
+
+
+class FirestoreRepository:
+    def __init__(self, db):
+        self.db = db
+
+    def _record(self, round_trips: int = 1, reads: int = 0, writes: int = 0):
+        metrics.record_datastore(round_trips, reads, writes)
+
+    # ---------------------------- USERS ----------------------------
+
+    def get_user(self, email: str) -> Optional[dict]:
+        self._record(reads=1)
+        doc = self.db.collection(USERS_COLLECTION).document(email).get()
+        return doc.to_dict() if doc.exists else None
+
+    def create_user(self, user_data: dict):
+        self._record(writes=1)
+        self.db.collection(USERS_COLLECTION).document(user_data["email"]).set(user_data)
+
+    def create_employee(self, user_data: dict):
+        """Create a user and add one to its department's employee_count in one batch commit"""
+        from firebase_admin import firestore
+        writes = [("set", self.db.collection(USERS_COLLECTION).document(user_data["email"]), user_data)]
+        department_name = user_data.get("department_name")
+        if department_name:
+            dept_ref = self._department_refs(user_data["company_name"], [department_name]).get(department_name)
+            if dept_ref is not None:
+                writes.append(("update", dept_ref, {"employee_count": firestore.Increment(1)}))
+        self.commit_writes(writes)
+
+    def update_user(self, email: str, fields: dict):
+        self._record(writes=1)
+        self.db.collection(USERS_COLLECTION).document(email).update(fields)
+
+    def list_company_users(self, company_name: str, fields: Optional[List[str]] = None) -> List[dict]:
+        """Every user in a company in one query (optionally projected)"""
+        query = self.db.collection(USERS_COLLECTION).where("company_name", "==", company_name)
+        if fields:
+            query = query.select(fields)
+        users = [user_doc.to_dict() for user_doc in query.get()]
+        self._record(reads=max(1, len(users)))
+        return users
+
+    def add_user_department(self, email: str, department_name: str):
+        """Add a department name to an admin's departments list"""
+        from firebase_admin import firestore
+        self._record(writes=1)
+        self.db.collection(USERS_COLLECTION).document(email).update(
+            {"departments": firestore.ArrayUnion([department_name])}
+        )
+
+    def get_users_by_emails(self, emails: List[str]) -> Dict[str, dict]:
+        """Batch-get users keyed by email (missing users are skipped)"""
+        users = {}
+        for chunk in chunked(list(dict.fromkeys(emails)), GET_ALL_CHUNK_SIZE):
+            refs = [self.db.collection(USERS_COLLECTION).document(email) for email in chunk]
+            self._record(reads=len(refs))
+            for snapshot in self.db.get_all(refs):
+                if snapshot.exists:
+                    users[snapshot.id] = snapshot.to_dict()
+        return users
+
+    def list_department_users(self, company_name: str, department_names: List[str],
+                              fields: Optional[List[str]] = None) -> List[dict]:
+        """Users of the named departments (one query per IN_QUERY_LIMIT departments)"""
+        users = []
+        for names in chunked(list(dict.fromkeys(department_names)), IN_QUERY_LIMIT):
+            query = self.db.collection(USERS_COLLECTION).where(
+                "company_name", "==", company_name
+            ).where("department_name", "in", names)
+            if fields:
+                query = query.select(fields)
+            matches = [user_doc.to_dict() for user_doc in query.get()]
+            self._record(reads=max(1, len(matches)))
+            users.extend(matches)
+        return users
+
+    # ---------------------------- DEPARTMENTS ----------------------------
+
+    def get_department(self, department_id: str) -> Optional[dict]:
+        self._record(reads=1)
+        doc = self.db.collection(DEPARTMENTS_COLLECTION).document(department_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def find_department(self, company_name: str, department_name: str) -> Optional[dict]:
+        query = self.db.collection(DEPARTMENTS_COLLECTION).where(
+            "company_name", "==", company_name
+        ).where("department_name", "==", department_name).limit(1)
+        matches = query.get()
+        self._record(reads=1)
+        return matches[0].to_dict() if matches else None
+
+    def create_department(self, department_data: dict):
+        self._record(writes=1)
+        self.db.collection(DEPARTMENTS_COLLECTION).document(department_data["department_id"]).set(department_data)
+
+    def count_department_users(self, company_name: str, department_name: str) -> int:
+        """Users already naming the department (count aggregation, no user documents read)"""
+        query = self.db.collection(USERS_COLLECTION).where(
+            "company_name", "==", company_name
+        ).where("department_name", "==", department_name)
+        count = int(query.count().get()[0][0].value)
+        # Billed as one read per 1000 index entries
+        self._record(reads=max(1, -(-count // 1000)))
+        return count
+
+    def _department_refs(self, company_name: str, department_names: List[str]) -> Dict[str, object]:
+        """References to a company's departments by name (one query per IN_QUERY_LIMIT names)"""
+        refs = {}
+        for names in chunked(list(dict.fromkeys(department_names)), IN_QUERY_LIMIT):
+            matches = self.db.collection(DEPARTMENTS_COLLECTION).where(
+                "company_name", "==", company_name
+            ).where("department_name", "in", names).get()
+            self._record(reads=max(1, len(matches)))
+            for dept_doc in matches:
+                refs.setdefault(dept_doc.to_dict().get("department_name"), dept_doc.reference)
+        return refs
+
+    def list_departments(self, company_name: str) -> List[dict]:
+        """A company's departments, each with its department_id"""
+        departments = []
+        for dept_doc in self.db.collection(DEPARTMENTS_COLLECTION).where("company_name", "==", company_name).get():
+            dept_data = dept_doc.to_dict()
+            dept_data["department_id"] = dept_doc.id
+            departments.append(dept_data)
+        self._record(reads=max(1, len(departments)))
+        return departments
+
+    def delete_employees(self, employees: List[dict], department_id: Optional[str] = None):
+        """Delete employees with their personal statuses and document assignee entries.
+
+        Their assignments are found through the documents' assignees (reverse
+        index, see migrations/document_assignees.py), so only those documents
+        are touched; all writes, including the optional department delete, go
+        in batches. Each user delete shares a batch commit with its
+        department's employee_count decrement (unless that department is being
+        deleted).
+        """
+        from firebase_admin import firestore
+        dept_refs = {}
+        if not department_id:
+            for company_name in dict.fromkeys(e.get("company_name") for e in employees):
+                names = [e["department_name"] for e in employees
+                         if e.get("company_name") == company_name and e.get("department_name")]
+                for name, ref in self._department_refs(company_name, names).items():
+                    dept_refs[(company_name, name)] = ref
+
+        # (user delete, count decrement) pairs go first: WRITE_BATCH_SIZE is even,
+        # so no pair is split across two batch commits
+        counted, writes = [], []
+        for employee in employees:
+            user_delete = ("delete", self.db.collection(USERS_COLLECTION).document(employee["email"]), None)
+            dept_ref = dept_refs.get((employee.get("company_name"), employee.get("department_name")))
+            if dept_ref is not None:
+                counted.extend([user_delete, ("update", dept_ref, {"employee_count": firestore.Increment(-1)})])
+            else:
+                writes.append(user_delete)
+        writes = counted + writes
+
+        for doc_id, emails in self.assigned_documents([e["email"] for e in employees]).items():
+            for email in emails:
+                writes.append(("delete", self.db.collection(PERSONAL_STATUS_COLLECTION).document(
+                    personal_status_id(doc_id, email)), None))
+            writes.append(("update", self.db.collection(DOCUMENTS_COLLECTION).document(doc_id),
+                           {"assignees": firestore.ArrayRemove(emails)}))
+        if department_id:
+            writes.append(("delete", self.db.collection(DEPARTMENTS_COLLECTION).document(department_id), None))
+        self.commit_writes(writes)
+
+    # ---------------------------- DOCUMENTS ----------------------------
+
+    def get_document(self, document_id: str) -> Optional[dict]:
+        self._record(reads=1)
+        doc = self.db.collection(DOCUMENTS_COLLECTION).document(document_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def update_document(self, document_id: str, fields: dict):
+        self._record(writes=1)
+        self.db.collection(DOCUMENTS_COLLECTION).document(document_id).update(fields)
+
+    def get_documents_by_ids(self, document_ids: List[str]) -> List[dict]:
+        """Batch-get documents, preserving the order of document_ids.
+
+        Missing documents are skipped. One round trip per GET_ALL_CHUNK_SIZE ids.
+        """
+        unique_ids = list(dict.fromkeys(document_ids))
+        found = {}
+        for ids in chunked(unique_ids, GET_ALL_CHUNK_SIZE):
+            refs = [self.db.collection(DOCUMENTS_COLLECTION).document(doc_id) for doc_id in ids]
+            self._record(reads=len(refs))
+            for snapshot in self.db.get_all(refs):
+                if snapshot.exists:
+                    doc_data = snapshot.to_dict()
+                    doc_data.setdefault("document_id", snapshot.id)
+                    found[snapshot.id] = doc_data
+        return [found[doc_id] for doc_id in unique_ids if doc_id in found]
+
+    def create_documents(self, documents: List[dict]):
+        """Write new document records, one batch commit per WRITE_BATCH_SIZE"""
+        for chunk in chunked(documents, WRITE_BATCH_SIZE):
+            self._record(writes=len(chunk))
+            batch = self.db.batch()
+            for doc_data in chunk:
+                batch.set(self.db.collection(DOCUMENTS_COLLECTION).document(doc_data["document_id"]), doc_data)
+            batch.commit()
+
+    def assigned_documents(self, emails: List[str]) -> Dict[str, List[str]]:
+        """document_id -> which of emails it is assigned to, from the assignees
+        index (one query per IN_QUERY_LIMIT emails, reading only assignees)"""
+        wanted = set(emails)
+        assigned = {}
+        for chunk in chunked(list(dict.fromkeys(emails)), IN_QUERY_LIMIT):
+            query = self.db.collection(DOCUMENTS_COLLECTION).where(
+                "assignees", "array_contains_any", chunk
+            ).select(["assignees"])
+            snapshots = query.get()
+            self._record(reads=max(1, len(snapshots)))
+            for snapshot in snapshots:
+                found = assigned.setdefault(snapshot.id, [])
+                found.extend(e for e in snapshot.to_dict().get("assignees") or [] if e in wanted and e not in found)
+        return assigned
+
+    def existing_document_ids(self, document_ids: List[str]) -> set:
+        existing = set()
+        for ids in chunked(document_ids, GET_ALL_CHUNK_SIZE):
+            refs = [self.db.collection(DOCUMENTS_COLLECTION).document(doc_id) for doc_id in ids]
+            self._record(reads=len(refs))
+            existing.update(s.id for s in self.db.get_all(refs, field_paths=["company_name"]) if s.exists)
+        return existing
+
+    def assign_document(self, document_id: str, document_update: dict, status_records: List[dict]):
+        """Update the document, and give each employee the document and a personal status.
+
+        Per employee: docs_received gets an ArrayUnion (no read-modify-write)
+        and the status record is written under personal_status_id(). The
+        document's assignees array (document -> employees reverse index) gets
+        the same employees. Writes go in batches of WRITE_BATCH_SIZE; the
+        document update commits with the first.
+        """
+        from firebase_admin import firestore
+        if status_records:
+            document_update = dict(document_update, assignees=firestore.ArrayUnion(
+                [record["employee_email"] for record in status_records]
+            ))
+        writes = [("update", self.db.collection(DOCUMENTS_COLLECTION).document(document_id), document_update)]
+        for record in status_records:
+            email = record["employee_email"]
+            writes.append(("update", self.db.collection(USERS_COLLECTION).document(email),
+                           {"docs_received": firestore.ArrayUnion([document_id])}))
+            writes.append(("set", self.db.collection(PERSONAL_STATUS_COLLECTION).document(
+                personal_status_id(document_id, email)), record))
+        self.commit_writes(writes)
+
+    def commit_writes(self, writes: List[tuple]):
+        """Commit (op, ref, data) writes in batches of WRITE_BATCH_SIZE"""
+        for chunk in chunked(writes, WRITE_BATCH_SIZE):
+            self._record(writes=len(chunk))
+            batch = self.db.batch()
+            for op, ref, data in chunk:
+                if op == "delete":
+                    batch.delete(ref)
+                else:
+                    getattr(batch, op)(ref, data)
+            batch.commit()
+
+    def update_documents(self, updates: List[Tuple[str, dict]]):
+        """Apply (document_id, fields) updates in batches of WRITE_BATCH_SIZE"""
+        self.commit_writes([
+            ("update", self.db.collection(DOCUMENTS_COLLECTION).document(doc_id), fields)
+            for doc_id, fields in updates
+        ])
+
+    def list_company_documents(
+        self,
+        company_name: str,
+        limit: int,
+        start_after: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        processing_status: Optional[str] = None,
+        document_type: Optional[str] = None,
+        min_urgency: Optional[float] = None,
+        max_urgency: Optional[float] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """One page of a company's documents, newest first.
+
+        Returns (documents, next_cursor); pass next_cursor back as start_after.
+        With an urgency range Firestore requires ordering by urgency_score
+        first, so those pages are sorted by urgency, then timestamp.
+        Every filter combination is backed by an index in firestore.indexes.json.
+        """
+        from google.cloud.firestore_v1 import Query
+        collection = self.db.collection(DOCUMENTS_COLLECTION)
+        query = collection.where("company_name", "==", company_name)
+
+        if processing_status:
+            query = query.where("processing_status", "==", processing_status)
+        if document_type:
+            query = query.where("document_type", "==", document_type)
+        if min_urgency is not None:
+            query = query.where("urgency_score", ">=", min_urgency)
+        if max_urgency is not None:
+            query = query.where("urgency_score", "<=", max_urgency)
+        if min_urgency is not None or max_urgency is not None:
+            query = query.order_by("urgency_score", direction=Query.DESCENDING)
+        query = query.order_by("timestamp", direction=Query.DESCENDING)
+
+        if fields:
+            # document_id identifies rows; the cursor snapshot needs the ordering fields
+            query = query.select(list(dict.fromkeys(["document_id", "timestamp", "urgency_score", *fields])))
+
+        if start_after:
+            self._record(reads=1)
+            cursor = collection.document(start_after).get()
+            if not cursor.exists or cursor.to_dict().get("company_name") != company_name:
+                raise ValueError("Invalid start_after cursor")
+            query = query.start_after(cursor)
+
+        # One extra row tells us whether another page exists
+        snapshots = list(query.limit(limit + 1).stream())
+        self._record(reads=max(1, len(snapshots)))
+        has_more = len(snapshots) > limit
+        snapshots = snapshots[:limit]
+
+        documents = []
+        for snapshot in snapshots:
+            doc_data = snapshot.to_dict()
+            doc_data.setdefault("document_id", snapshot.id)
+            documents.append(doc_data)
+
+        next_cursor = snapshots[-1].id if has_more else None
+        return documents, next_cursor
+
+    def iter_company_documents(
+        self,
+        company_name: str,
+        processing_status: Optional[str] = None,
+        uploaded_after=None,
+        uploaded_before=None,
+        fields: Optional[List[str]] = None,
+        page_size: int = GET_ALL_CHUNK_SIZE,
+    ) -> Iterable[dict]:
+        """Every matching company document, newest first, one query per page_size.
+
+        Served by the company_name(+processing_status)+timestamp indexes.
+        """
+        from google.cloud.firestore_v1 import Query
+        query = self.db.collection(DOCUMENTS_COLLECTION).where("company_name", "==", company_name)
+        if processing_status:
+            query = query.where("processing_status", "==", processing_status)
+        if uploaded_after:
+            query = query.where("timestamp", ">=", uploaded_after)
+        if uploaded_before:
+            query = query.where("timestamp", "<", uploaded_before)
+        query = query.order_by("timestamp", direction=Query.DESCENDING)
+        if fields:
+            query = query.select(list(dict.fromkeys(["document_id", "timestamp", *fields])))
+
+        last = None
+        while True:
+            page = query.start_after(last) if last is not None else query
+            snapshots = list(page.limit(page_size).stream())
+            self._record(reads=max(1, len(snapshots)))
+            for snapshot in snapshots:
+                doc_data = snapshot.to_dict()
+                doc_data.setdefault("document_id", snapshot.id)
+                yield doc_data
+            if len(snapshots) < page_size:
+                return
+            last = snapshots[-1]
+
+    # ---------------------------- PERSONAL STATUS ----------------------------
+
+    def get_personal_statuses(self, employee_email: str, document_ids: List[str]) -> Dict[str, dict]:
+        """An employee's personal status records for the given documents, keyed by document_id"""
+        statuses = {}
+        for ids in chunked(list(dict.fromkeys(document_ids)), GET_ALL_CHUNK_SIZE):
+            refs = [
+                self.db.collection(PERSONAL_STATUS_COLLECTION).document(personal_status_id(doc_id, employee_email))
+                for doc_id in ids
+            ]
+            self._record(reads=len(refs))
+            for snapshot in self.db.get_all(refs):
+                if snapshot.exists:
+                    status_data = snapshot.to_dict()
+                    statuses[status_data["document_id"]] = status_data
+        return statuses
+
+    def set_personal_status(self, document_id: str, employee_email: str, status_data: dict):
+        """Create or update an employee's status for a document (one blind write)"""
+        self._record(writes=1)
+        self.db.collection(PERSONAL_STATUS_COLLECTION).document(
+            personal_status_id(document_id, employee_email)
+        ).set(status_data, merge=True)
+
+    def get_document_statuses(self, document_id: str, employee_emails: List[str]) -> List[dict]:
+        """The status records of a document's assignees (keyed batch get, no query)"""
+        statuses = []
+        for emails in chunked(list(dict.fromkeys(employee_emails)), GET_ALL_CHUNK_SIZE):
+            refs = [self.db.collection(PERSONAL_STATUS_COLLECTION).document(personal_status_id(document_id, email))
+                    for email in emails]
+            self._record(reads=len(refs))
+            statuses.extend(snapshot.to_dict() for snapshot in self.db.get_all(refs) if snapshot.exists)
+        return statuses
+
+    def list_document_statuses(self, document_id: str) -> List[dict]:
+        """Every employee's status record for a document (one query)"""
+        query = self.db.collection(PERSONAL_STATUS_COLLECTION).where("document_id", "==", document_id)
+        statuses = [status_doc.to_dict() for status_doc in query.get()]
+        self._record(reads=max(1, len(statuses)))
+        return statuses
+
+
+    # ---------------------------- ANALYSIS JOBS ----------------------------
+
+    def create_job(self, job_data: dict):
+        self._record(writes=1)
+        self.db.collection(JOBS_COLLECTION).document(job_data["job_id"]).set(job_data)
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        self._record(reads=1)
+        doc = self.db.collection(JOBS_COLLECTION).document(job_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def update_job(self, job_id: str, fields: dict):
+        self._record(writes=1)
+        self.db.collection(JOBS_COLLECTION).document(job_id).update(fields)
+
+    def _claim(self, collection: str, doc_id: str, fields: dict) -> Optional[dict]:
+        from firebase_admin import firestore
+
+        @firestore.transactional
+        def claim(transaction, ref):
+            self._record(reads=1)
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists or snapshot.to_dict().get("status") != JobStatus.QUEUED:
+                return None
+            self._record(writes=1)
+            transaction.update(ref, fields)
+            return snapshot.to_dict()
+
+        return claim(self.db.transaction(), self.db.collection(collection).document(doc_id))
+
+    def claim_job(self, job_id: str, fields: dict) -> Optional[dict]:
+        """Atomically apply fields to a QUEUED job (in a transaction).
+
+        Returns the job as it was, or None if it is missing or another worker owns it.
+        """
+        return self._claim(JOBS_COLLECTION, job_id, fields)
+
+    def list_jobs(self, status: str, executor: str, limit: int = 500) -> List[dict]:
+        """Jobs in a status on an executor (equality filters only: no composite index)"""
+        query = self.db.collection(JOBS_COLLECTION).where("status", "==", status).where(
+            "executor", "==", executor
+        ).limit(limit)
+        jobs = [job_doc.to_dict() for job_doc in query.get()]
+        self._record(reads=max(1, len(jobs)))
+        return jobs
+
+    # ---------------------------- ANALYSIS BATCHES ----------------------------
+
+    def create_batch(self, batch_data: dict):
+        self._record(writes=1)
+        self.db.collection(BATCHES_COLLECTION).document(batch_data["batch_id"]).set(batch_data)
+
+    def get_batch(self, batch_id: str) -> Optional[dict]:
+        self._record(reads=1)
+        doc = self.db.collection(BATCHES_COLLECTION).document(batch_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def update_batch(self, batch_id: str, fields: dict):
+        self._record(writes=1)
+        self.db.collection(BATCHES_COLLECTION).document(batch_id).update(fields)
+
+    def claim_batch(self, batch_id: str, fields: dict) -> Optional[dict]:
+        """Atomically apply fields to a QUEUED batch; None if missing or already claimed"""
+        return self._claim(BATCHES_COLLECTION, batch_id, fields)
+
+    def list_batches(self, status: str, executor: str, limit: int = 500) -> List[dict]:
+        """Batches in a status on an executor (equality filters only: no composite index)"""
+        query = self.db.collection(BATCHES_COLLECTION).where("status", "==", status).where(
+            "executor", "==", executor
+        ).limit(limit)
+        batches = [batch_doc.to_dict() for batch_doc in query.get()]
+        self._record(reads=max(1, len(batches)))
+        return batches
+
+    # ---------------------------- WATCHES ----------------------------
+
+    def publish_user_changes(self, emails: List[str]):
+        """Record that these users changed, for every process's watch_users"""
+        now = datetime.now(timezone.utc)
+        self._record(writes=1)
+        self.db.collection(USER_CHANGES_COLLECTION).add({
+            "emails": list(emails),
+            "changed_at": now,
+            "expires_at": now + USER_CHANGES_RETENTION
+        })
+
+    def watch_users(self, on_change: Callable[[List[str]], None]):
+        """Call on_change(emails) for each publish_user_changes (Firestore on_snapshot).
+
+        Listens to the change records written from a minute before now (clock
+        skew between processes), not to the users collection: the initial
+        snapshot is that minute's records and each event carries only emails.
+        Returns the watch; call .unsubscribe() to stop it.
+        """
+        since = datetime.now(timezone.utc) - timedelta(minutes=1)
+
+        def on_snapshot(snapshots, changes, read_time):
+            emails = [email for change in changes if change.type.name == "ADDED"
+                      for email in change.document.to_dict().get("emails", [])]
+            if emails:
+                on_change(emails)
+
+        return self.db.collection(USER_CHANGES_COLLECTION).where("changed_at", ">=", since).on_snapshot(on_snapshot)
+
+
+# ---------------------------- OPERATION COUNTS ----------------------------
+
+class OperationCounts:
+    """Round trips, documents read and documents written"""
+
+    def __init__(self):
+        self.round_trips = 0
+        self.reads = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def add(self, round_trips: int, reads: int, writes: int):
+        with self._lock:
+            self.round_trips += round_trips
+            self.reads += reads
+            self.writes += writes
+
+    def as_dict(self) -> dict:
+        return {"round_trips": self.round_trips, "reads": self.reads, "writes": self.writes}
+
+
+def _not_found(collection: str, doc_id: str) -> Exception:
+    """The NotFound Firestore raises for an update of a missing document"""
+    from google.api_core.exceptions import NotFound
+    return NotFound(f"No document to update: {collection}/{doc_id}")
+
+
+def _order_key(data: dict, doc_id: str, order_fields: List[str]) -> Optional[tuple]:
+    # Firestore leaves out documents missing an ordering field; __name__ breaks ties
+    if any(data.get(field) is None for field in order_fields):
+        return None
+    return tuple(data[field] for field in order_fields) + (doc_id,)
+
+
+def _project(data: dict, fields: Optional[List[str]]) -> dict:
+    return {field: data[field] for field in fields if field in data} if fields else data
+
+
+class InMemoryRepository:
+    """FirestoreRepository's methods over dicts, for benchmarks and local runs.
+
+    Each call records the round trips, document reads and document writes the
+    Firestore implementation issues for it (a get, query page, get_all chunk
+    or batch commit is one round trip; queries read at least one document),
+    in .totals and in the request's metrics (see track()). Records are
+    copied in and out, like snapshots. No credentials or network are needed.
+    """
+
+    def __init__(self):
+        self.collections = defaultdict(dict)  # collection -> {document id: data}
+        self.totals = OperationCounts()
+        self._lock = threading.RLock()
+        self._user_watchers = []
+
+    def track(self):
+        """Count the operations made inside the block (and by tasks and
+        AsyncRepository calls started from it); yields the RequestMetrics"""
+        return metrics.track_request()
+
+    def _record(self, round_trips: int = 1, reads: int = 0, writes: int = 0):
+        self.totals.add(round_trips, reads, writes)
+        metrics.record_datastore(round_trips, reads, writes)
+
+    def _get(self, collection: str, doc_id: str) -> Optional[dict]:
+        with self._lock:
+            data = self.collections[collection].get(doc_id)
+            return copy.deepcopy(data) if data is not None else None
+
+    def _set(self, collection: str, doc_id: str, data: dict, merge: bool = False):
+        with self._lock:
+            if merge and doc_id in self.collections[collection]:
+                self.collections[collection][doc_id].update(copy.deepcopy(data))
+            else:
+                self.collections[collection][doc_id] = copy.deepcopy(data)
+
+    def _update(self, collection: str, doc_id: str, fields: dict):
+        """Like DocumentReference.update: fails if the document does not exist"""
+        with self._lock:
+            data = self.collections[collection].get(doc_id)
+            if data is None:
+                raise _not_found(collection, doc_id)
+            data.update(copy.deepcopy(fields))
+
+    def _array_change(self, collection: str, doc_id: str, field: str, add=(), remove=()):
+        """ArrayUnion/ArrayRemove on one field"""
+        with self._lock:
+            data = self.collections[collection].get(doc_id)
+            if data is None:
+                raise _not_found(collection, doc_id)
+            values = [v for v in (data.get(field) or []) if v not in remove]
+            values.extend(v for v in dict.fromkeys(add) if v not in values)
+            data[field] = values
+
+    def _increment(self, collection: str, doc_id: str, field: str, delta: int):
+        """firestore.Increment on one field"""
+        with self._lock:
+            data = self.collections[collection].get(doc_id)
+            if data is None:
+                raise _not_found(collection, doc_id)
+            data[field] = (data.get(field) or 0) + delta
+
+    def _delete(self, collection: str, doc_id: str):
+        with self._lock:
+            self.collections[collection].pop(doc_id, None)
+
+    def _where(self, collection: str, predicate: Callable[[dict], bool]) -> List[Tuple[str, dict]]:
+        with self._lock:
+            return [(doc_id, copy.deepcopy(data)) for doc_id, data in self.collections[collection].items()
+                    if predicate(data)]
+
+    def _commit(self, writes: List[Callable[[], None]]):
+        """Apply writes as batch commits of WRITE_BATCH_SIZE"""
+        for chunk in chunked(writes, WRITE_BATCH_SIZE):
+            self._record(writes=len(chunk))
+            for write in chunk:
+                write()
+
+    def _get_many(self, collection: str, doc_ids: List[str]) -> Dict[str, dict]:
+        """db.get_all: one round trip per GET_ALL_CHUNK_SIZE ids"""
+        found = {}
+        for ids in chunked(doc_ids, GET_ALL_CHUNK_SIZE):
+            self._record(reads=len(ids))
+            for doc_id in ids:
+                data = self._get(collection, doc_id)
+                if data is not None:
+                    found[doc_id] = data
+        return found
+
+    def _query(self, collection: str, predicate: Callable[[dict], bool], fields=None, limit=None) -> List[dict]:
+        """One unordered query"""
+        matches = self._where(collection, predicate)[:limit]
+        self._record(reads=max(1, len(matches)))
+        return [_project(data, fields) for _, data in matches]
+
+    # ---------------------------- USERS ----------------------------
+
+    def get_user(self, email: str) -> Optional[dict]:
+        self._record(reads=1)
+        return self._get(USERS_COLLECTION, email)
+
+    def create_user(self, user_data: dict):
+        self._record(writes=1)
+        self._set(USERS_COLLECTION, user_data["email"], user_data)
+
+    def create_employee(self, user_data: dict):
+        writes = [functools.partial(self._set, USERS_COLLECTION, user_data["email"], user_data)]
+        department_name = user_data.get("department_name")
+        if department_name:
+            dept_id = self._department_ids(user_data["company_name"], [department_name]).get(department_name)
+            if dept_id is not None:
+                writes.append(functools.partial(self._increment, DEPARTMENTS_COLLECTION, dept_id, "employee_count", 1))
+        self._commit(writes)
+
+    def update_user(self, email: str, fields: dict):
+        self._record(writes=1)
+        self._update(USERS_COLLECTION, email, fields)
+
+    def list_company_users(self, company_name: str, fields: Optional[List[str]] = None) -> List[dict]:
+        return self._query(USERS_COLLECTION, lambda u: u.get("company_name") == company_name, fields)
+
+    def add_user_department(self, email: str, department_name: str):
+        self._record(writes=1)
+        self._array_change(USERS_COLLECTION, email, "departments", add=[department_name])
+
+    def get_users_by_emails(self, emails: List[str]) -> Dict[str, dict]:
+        return self._get_many(USERS_COLLECTION, list(dict.fromkeys(emails)))
+
+    def list_department_users(self, company_name: str, department_names: List[str],
+                              fields: Optional[List[str]] = None) -> List[dict]:
+        users = []
+        for names in chunked(list(dict.fromkeys(department_names)), IN_QUERY_LIMIT):
+            users.extend(self._query(
+                USERS_COLLECTION,
+                lambda u: u.get("company_name") == company_name and u.get("department_name") in names,
+                fields
+            ))
+        return users
+
+    # ---------------------------- DEPARTMENTS ----------------------------
+
+    def get_department(self, department_id: str) -> Optional[dict]:
+        self._record(reads=1)
+        return self._get(DEPARTMENTS_COLLECTION, department_id)
+
+    def find_department(self, company_name: str, department_name: str) -> Optional[dict]:
+        matches = self._query(
+            DEPARTMENTS_COLLECTION,
+            lambda d: d.get("company_name") == company_name and d.get("department_name") == department_name,
+            limit=1
+        )
+        return matches[0] if matches else None
+
+    def create_department(self, department_data: dict):
+        self._record(writes=1)
+        self._set(DEPARTMENTS_COLLECTION, department_data["department_id"], department_data)
+
+    def count_department_users(self, company_name: str, department_name: str) -> int:
+        matches = self._where(
+            USERS_COLLECTION,
+            lambda u: u.get("company_name") == company_name and u.get("department_name") == department_name
+        )
+        self._record(reads=max(1, -(-len(matches) // 1000)))
+        return len(matches)
+
+    def _department_ids(self, company_name: str, department_names: List[str]) -> Dict[str, str]:
+        ids = {}
+        for names in chunked(list(dict.fromkeys(department_names)), IN_QUERY_LIMIT):
+            matches = self._where(
+                DEPARTMENTS_COLLECTION,
+                lambda d: d.get("company_name") == company_name and d.get("department_name") in names
+            )
+            self._record(reads=max(1, len(matches)))
+            for doc_id, data in matches:
+                ids.setdefault(data.get("department_name"), doc_id)
+        return ids
+
+    def list_departments(self, company_name: str) -> List[dict]:
+        matches = self._where(DEPARTMENTS_COLLECTION, lambda d: d.get("company_name") == company_name)
+        self._record(reads=max(1, len(matches)))
+        return [dict(data, department_id=doc_id) for doc_id, data in matches]
+
+    def delete_employees(self, employees: List[dict], department_id: Optional[str] = None):
+        dept_ids = {}
+        if not department_id:
+            for company_name in dict.fromkeys(e.get("company_name") for e in employees):
+                names = [e["department_name"] for e in employees
+                         if e.get("company_name") == company_name and e.get("department_name")]
+                for name, dept_id in self._department_ids(company_name, names).items():
+                    dept_ids[(company_name, name)] = dept_id
+
+        counted, writes = [], []
+        for employee in employees:
+            user_delete = functools.partial(self._delete, USERS_COLLECTION, employee["email"])
+            dept_id = dept_ids.get((employee.get("company_name"), employee.get("department_name")))
+            if dept_id is not None:
+                counted.extend([user_delete, functools.partial(
+                    self._increment, DEPARTMENTS_COLLECTION, dept_id, "employee_count", -1
+                )])
+            else:
+                writes.append(user_delete)
+        writes = counted + writes
+
+        for doc_id, emails in self.assigned_documents([e["email"] for e in employees]).items():
+            for email in emails:
+                writes.append(functools.partial(
+                    self._delete, PERSONAL_STATUS_COLLECTION, personal_status_id(doc_id, email)
+                ))
+            writes.append(functools.partial(
+                self._array_change, DOCUMENTS_COLLECTION, doc_id, "assignees", remove=emails
+            ))
+        if department_id:
+            writes.append(functools.partial(self._delete, DEPARTMENTS_COLLECTION, department_id))
+        self._commit(writes)
+
+    # ---------------------------- DOCUMENTS ----------------------------
+
+    def get_document(self, document_id: str) -> Optional[dict]:
+        self._record(reads=1)
+        return self._get(DOCUMENTS_COLLECTION, document_id)
+
+    def update_document(self, document_id: str, fields: dict):
+        self._record(writes=1)
+        self._update(DOCUMENTS_COLLECTION, document_id, fields)
+
+    def update_documents(self, updates: List[Tuple[str, dict]]):
+        self._commit([functools.partial(self._update, DOCUMENTS_COLLECTION, doc_id, fields)
+                      for doc_id, fields in updates])
+
+    def get_documents_by_ids(self, document_ids: List[str]) -> List[dict]:
+        unique_ids = list(dict.fromkeys(document_ids))
+        found = self._get_many(DOCUMENTS_COLLECTION, unique_ids)
+        return [dict(found[doc_id], document_id=found[doc_id].get("document_id", doc_id))
+                for doc_id in unique_ids if doc_id in found]
+
+    def create_documents(self, documents: List[dict]):
+        self._commit([functools.partial(self._set, DOCUMENTS_COLLECTION, doc_data["document_id"], doc_data)
+                      for doc_data in documents])
+
+    def assigned_documents(self, emails: List[str]) -> Dict[str, List[str]]:
+        assigned = {}
+        for chunk in chunked(list(dict.fromkeys(emails)), IN_QUERY_LIMIT):
+            matches = self._where(DOCUMENTS_COLLECTION, lambda d: any(e in (d.get("assignees") or []) for e in chunk))
+            self._record(reads=max(1, len(matches)))
+            for doc_id, data in matches:
+                found = assigned.setdefault(doc_id, [])
+                found.extend(e for e in data.get("assignees") or [] if e in emails and e not in found)
+        return assigned
+
+    def existing_document_ids(self, document_ids: List[str]) -> set:
+        return set(self._get_many(DOCUMENTS_COLLECTION, document_ids))
+
+    def assign_document(self, document_id: str, document_update: dict, status_records: List[dict]):
+        emails = [record["employee_email"] for record in status_records]
+
+        def update_document():
+            self._update(DOCUMENTS_COLLECTION, document_id, document_update)
+            if emails:
+                self._array_change(DOCUMENTS_COLLECTION, document_id, "assignees", add=emails)
+
+        writes = [update_document]
+        for email, record in zip(emails, status_records):
+            writes.append(functools.partial(self._array_change, USERS_COLLECTION, email,
+                                            "docs_received", add=[document_id]))
+            writes.append(functools.partial(self._set, PERSONAL_STATUS_COLLECTION,
+                                            personal_status_id(document_id, email), record))
+        self._commit(writes)
+
+    def _company_documents(self, company_name: str, predicate: Callable[[dict], bool],
+                           order_fields: List[str]) -> List[Tuple[tuple, dict]]:
+        """Matching documents as (order key, data), in descending order"""
+        rows = []
+        for doc_id, data in self._where(
+            DOCUMENTS_COLLECTION, lambda d: d.get("company_name") == company_name and predicate(d)
+        ):
+            key = _order_key(data, doc_id, order_fields)
+            if key is not None:
+                data.setdefault("document_id", doc_id)
+                rows.append((key, data))
+        rows.sort(key=lambda row: row[0], reverse=True)
+        return rows
+
+    def list_company_documents(
+        self,
+        company_name: str,
+        limit: int,
+        start_after: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        processing_status: Optional[str] = None,
+        document_type: Optional[str] = None,
+        min_urgency: Optional[float] = None,
+        max_urgency: Optional[float] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        def matches(d):
+            return ((not processing_status or d.get("processing_status") == processing_status)
+                    and (not document_type or d.get("document_type") == document_type)
+                    and (min_urgency is None or (d.get("urgency_score") is not None
+                                                 and d["urgency_score"] >= min_urgency))
+                    and (max_urgency is None or (d.get("urgency_score") is not None
+                                                 and d["urgency_score"] <= max_urgency)))
+
+        order_fields = ["timestamp"]
+        if min_urgency is not None or max_urgency is not None:
+            order_fields = ["urgency_score", "timestamp"]
+        rows = self._company_documents(company_name, matches, order_fields)
+
+        if start_after:
+            self._record(reads=1)
+            cursor = self._get(DOCUMENTS_COLLECTION, start_after)
+            if cursor is None or cursor.get("company_name") != company_name:
+                raise ValueError("Invalid start_after cursor")
+            cursor_key = _order_key(cursor, start_after, order_fields)
+            rows = [row for row in rows if cursor_key is None or row[0] < cursor_key]
+
+        page = rows[:limit + 1]
+        self._record(reads=max(1, len(page)))
+        has_more = len(page) > limit
+        page = page[:limit]
+
+        if fields:
+            fields = list(dict.fromkeys(["document_id", "timestamp", "urgency_score", *fields]))
+        documents = [_project(data, fields) for _, data in page]
+        next_cursor = page[-1][0][-1] if has_more else None
+        return documents, next_cursor
+
+    def iter_company_documents(
+        self,
+        company_name: str,
+        processing_status: Optional[str] = None,
+        uploaded_after=None,
+        uploaded_before=None,
+        fields: Optional[List[str]] = None,
+        page_size: int = GET_ALL_CHUNK_SIZE,
+    ) -> Iterable[dict]:
+        def matches(d):
+            timestamp = d.get("timestamp")
+            return ((not processing_status or d.get("processing_status") == processing_status)
+                    and (not uploaded_after or (timestamp is not None and timestamp >= uploaded_after))
+                    and (not uploaded_before or (timestamp is not None and timestamp < uploaded_before)))
+
+        rows = self._company_documents(company_name, matches, ["timestamp"])
+        if fields:
+            fields = list(dict.fromkeys(["document_id", "timestamp", *fields]))
+        for start in range(0, len(rows) + 1, page_size):
+            page = rows[start:start + page_size]
+            self._record(reads=max(1, len(page)))
+            for _, data in page:
+                yield _project(data, fields)
+            if len(page) < page_size:
+                return
+
+    # ---------------------------- PERSONAL STATUS ----------------------------
+
+    def get_personal_statuses(self, employee_email: str, document_ids: List[str]) -> Dict[str, dict]:
+        found = self._get_many(PERSONAL_STATUS_COLLECTION, [
+            personal_status_id(doc_id, employee_email) for doc_id in dict.fromkeys(document_ids)
+        ])
+        return {status_data["document_id"]: status_data for status_data in found.values()}
+
+    def set_personal_status(self, document_id: str, employee_email: str, status_data: dict):
+        self._record(writes=1)
+        self._set(PERSONAL_STATUS_COLLECTION, personal_status_id(document_id, employee_email),
+                  status_data, merge=True)
+
+    def get_document_statuses(self, document_id: str, employee_emails: List[str]) -> List[dict]:
+        found = self._get_many(PERSONAL_STATUS_COLLECTION, [
+            personal_status_id(document_id, email) for email in dict.fromkeys(employee_emails)
+        ])
+        return list(found.values())
+
+    def list_document_statuses(self, document_id: str) -> List[dict]:
+        return self._query(PERSONAL_STATUS_COLLECTION, lambda s: s.get("document_id") == document_id)
+
+    # ---------------------------- ANALYSIS JOBS ----------------------------
+
+    def create_job(self, job_data: dict):
+        self._record(writes=1)
+        self._set(JOBS_COLLECTION, job_data["job_id"], job_data)
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        self._record(reads=1)
+        return self._get(JOBS_COLLECTION, job_id)
+
+    def update_job(self, job_id: str, fields: dict):
+        self._record(writes=1)
+        self._update(JOBS_COLLECTION, job_id, fields)
+
+    def _claim(self, collection: str, doc_id: str, fields: dict) -> Optional[dict]:
+        # Transaction: the read, then the commit
+        self._record(reads=1)
+        with self._lock:
+            data = self._get(collection, doc_id)
+            if data is None or data.get("status") != JobStatus.QUEUED:
+                return None
+            self._record(writes=1)
+            self._update(collection, doc_id, fields)
+        return data
+
+    def claim_job(self, job_id: str, fields: dict) -> Optional[dict]:
+        return self._claim(JOBS_COLLECTION, job_id, fields)
+
+    def list_jobs(self, status: str, executor: str, limit: int = 500) -> List[dict]:
+        return self._query(JOBS_COLLECTION, lambda j: j.get("status") == status and j.get("executor") == executor,
+                           limit=limit)
+
+    # ---------------------------- ANALYSIS BATCHES ----------------------------
+
+    def create_batch(self, batch_data: dict):
+        self._record(writes=1)
+        self._set(BATCHES_COLLECTION, batch_data["batch_id"], batch_data)
+
+    def get_batch(self, batch_id: str) -> Optional[dict]:
+        self._record(reads=1)
+        return self._get(BATCHES_COLLECTION, batch_id)
+
+    def update_batch(self, batch_id: str, fields: dict):
+        self._record(writes=1)
+        self._update(BATCHES_COLLECTION, batch_id, fields)
+
+    def claim_batch(self, batch_id: str, fields: dict) -> Optional[dict]:
+        return self._claim(BATCHES_COLLECTION, batch_id, fields)
+
+    def list_batches(self, status: str, executor: str, limit: int = 500) -> List[dict]:
+        return self._query(BATCHES_COLLECTION, lambda b: b.get("status") == status and b.get("executor") == executor,
+                           limit=limit)
+
+    # ---------------------------- WATCHES ----------------------------
+
+    def publish_user_changes(self, emails: List[str]):
+        self._record(writes=1)
+        for watch in list(self._user_watchers):
+            watch.on_change(list(emails))
+
+    def watch_users(self, on_change: Callable[[List[str]], None]):
+        watch = _Watch(self._user_watchers, on_change)
+        with self._lock:
+            self._user_watchers.append(watch)
+        return watch
+
+
+class _Watch:
+    def __init__(self, watchers: list, on_change: Callable[[List[str]], None]):
+        self.watchers = watchers
+        self.on_change = on_change
+
+    def unsubscribe(self):
+        if self in self.watchers:
+            self.watchers.remove(self)
+
+class AsyncRepository:
+    """Awaitable facade over a repository.
+
+    Every method of the wrapped repository becomes a coroutine that runs the
+    blocking call on a dedicated thread pool (FIRESTORE_IO_WORKERS), so
+    independent reads can be awaited together with asyncio.gather. run()
+    offloads any other blocking function (job queueing, cache lookups).
+    Without a repository it wraps get_repository(), created on first use.
+    """
+
+    def __init__(self, repository=None, max_workers: int = FIRESTORE_IO_WORKERS):
+        self._sync = repository
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="firestore-io")
+
+    @property
+    def sync(self):
+        if self._sync is None:
+            self._sync = get_repository()
+        return self._sync
+
+    async def run(self, fn, *args, **kwargs):
+        # Carry the caller's context (per-request metrics) into the thread
+        context = contextvars.copy_context()
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, functools.partial(context.run, fn, *args, **kwargs)
+            )
+        finally:
+            metrics.record_db_time(time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        method = getattr(self.sync, name)
+        if not callable(method):
+            return method
+
+        async def call(*args, **kwargs):
+            return await self.run(method, *args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_repository():
+    """The process-wide repository for DATA_BACKEND (shared by routes and workers)"""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            if DATA_BACKEND == "memory":
+                _repository = InMemoryRepository()
+            else:
+                from firebase_admin_init import db
+                _repository = FirestoreRepository(db)
+        return _repository
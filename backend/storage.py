@@ -0,0 +1,109 @@
+# storage.py - File storage backends for uploaded documents
+#
+# STORAGE_BACKEND selects where uploads go:
+#   cloudinary (default) - streamed to Cloudinary in STORAGE_CHUNK_SIZE chunks
+#   local                - written under LOCAL_STORAGE_DIR and served by the API
+#                          at LOCAL_STORAGE_BASE_URL (for load tests without Cloudinary)
+# Backends are blocking; routes call them from a thread pool.
+import hashlib
+import os
+import re
+import shutil
+import uuid
+from typing import BinaryIO, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cloudinary").lower()
+STORAGE_CHUNK_SIZE = int(os.getenv("STORAGE_CHUNK_SIZE", str(20 * 1024 * 1024)))
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "uploads")
+LOCAL_STORAGE_BASE_URL = os.getenv("LOCAL_STORAGE_BASE_URL", "http://localhost:8000/files").rstrip("/")
+# URL path the API serves LOCAL_STORAGE_DIR under
+LOCAL_STORAGE_MOUNT = "/files"
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class StoredFile:
+    def __init__(self, url: str, size: int, sha256: str):
+        self.url = url
+        self.size = size
+        self.sha256 = sha256  # same digest fetch_file() computes when analyzing
+
+
+def hash_fileobj(fileobj: BinaryIO) -> tuple:
+    """(sha256, size) of a seekable file object, rewound afterwards"""
+    digest = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(_HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+        size += len(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest(), size
+
+
+class CloudinaryStorage:
+    name = "cloudinary"
+
+    def __init__(self):
+        import cloudinary
+        cloudinary.config(
+            cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
+            api_key=os.getenv("CLOUDINARY_API_KEY"),
+            api_secret=os.getenv("CLOUDINARY_API_SECRET")
+        )
+
+    def save(self, fileobj: BinaryIO, filename: str) -> StoredFile:
+        import cloudinary.uploader
+        sha256, size = hash_fileobj(fileobj)
+        # upload_large streams the file in chunks instead of buffering it whole
+        upload_result = cloudinary.uploader.upload_large(
+            fileobj,
+            resource_type="raw",
+            folder="documents",
+            filename=filename,
+            chunk_size=STORAGE_CHUNK_SIZE
+        )
+        return StoredFile(upload_result["secure_url"], size, sha256)
+
+
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, directory: str = LOCAL_STORAGE_DIR, base_url: str = LOCAL_STORAGE_BASE_URL):
+        self.directory = directory
+        self.base_url = base_url
+        os.makedirs(os.path.join(directory, "documents"), exist_ok=True)
+
+    def save(self, fileobj: BinaryIO, filename: str) -> StoredFile:
+        sha256, size = hash_fileobj(fileobj)
+        safe_name = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(filename or "file"))
+        relative_path = f"documents/{uuid.uuid4().hex}_{safe_name}"
+        with open(os.path.join(self.directory, relative_path), "wb") as out:
+            shutil.copyfileobj(fileobj, out, _HASH_CHUNK_SIZE)
+        return StoredFile(f"{self.base_url}/{relative_path}", size, sha256)
+
+
+STORAGE_BACKENDS = {
+    CloudinaryStorage.name: CloudinaryStorage,
+    LocalStorage.name: LocalStorage,
+}
+
+_storage = None
+
+
+def get_storage():
+    """The configured storage backend (created on first use)"""
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND not in STORAGE_BACKENDS:
+            raise ValueError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}' (choose from {', '.join(STORAGE_BACKENDS)})")
+        _storage = STORAGE_BACKENDS[STORAGE_BACKEND]()
+    return _storage
+
+
+def save_upload(fileobj: BinaryIO, filename: Optional[str]) -> StoredFile:
+    return get_storage().save(fileobj, filename or "file")
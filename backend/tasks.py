@@ -11,8 +11,14 @@
 #     send_otp_email(receiver_email, otp)
 #     return "sent"
 
+from celery.signals import worker_process_shutdown
+
 from celery_worker import celery_app
-from email_utils import send_email, send_otp_email
+from email_utils import send_email, send_otp_email, send_credentials_emails
+from mail_transport import close_transport
+
+# Email tasks share the worker process's mail transport (mail_transport.py), so
+# consecutive tasks reuse its logged-in SMTP connections
 
 @celery_app.task
 def send_email_task(receiver_email, password):
@@ -23,3 +29,25 @@ def send_email_task(receiver_email, password):
 def send_otp_email_task(receiver_email, otp):
     send_otp_email(receiver_email, otp)
     return "sent"
+
+@celery_app.task
+def send_credentials_emails_task(accounts):
+    """accounts: [email, password] pairs, e.g. a department being onboarded"""
+    return send_credentials_emails(accounts)
+
+@worker_process_shutdown.connect
+def close_mail_connections(**kwargs):
+    close_transport()
+
+@celery_app.task(acks_late=True)
+def analyze_document_task(job_id):
+    # Imported here so email-only workers don't load Firebase and Gemini
+    from jobs import run_analysis_job
+    run_analysis_job(job_id)
+    return job_id
+
+@celery_app.task(acks_late=True)
+def analyze_batch_task(batch_id):
+    from bulk_analysis import run_batch
+    run_batch(batch_id)
+    return batch_id
@@ -0,0 +1,120 @@
+# text_extraction.py - Pluggable PDF text extraction
+#
+# The default engine is PyMuPDF (much faster than PyPDF2). Decisions are made
+# per page instead of for the whole document:
+#   - table-heavy pages are re-extracted with pdfplumber's layout mode, which
+#     keeps rows and columns aligned;
+#   - pages with no text layer (scans) are reported in ocr_pages so only those
+#     pages go through the OCR pipeline.
+# EXTRACTION_ENGINE selects pymupdf (default), pypdf2 or pdfplumber. Each
+# engine imports its library on first use.
+import os
+from typing import Dict, List
+
+EXTRACTION_ENGINE = os.getenv("EXTRACTION_ENGINE", "pymupdf").lower()
+# Pages with less text than this are treated as having no text layer
+MIN_PAGE_TEXT_CHARS = int(os.getenv("MIN_PAGE_TEXT_CHARS", "20"))
+# Vector drawings on a page before it is checked for tables
+TABLE_DRAWINGS_THRESHOLD = int(os.getenv("TABLE_DRAWINGS_THRESHOLD", "10"))
+
+
+class ExtractionResult:
+    def __init__(self, pages: List[str], ocr_pages: List[int], engines: Dict[int, str]):
+        self.pages = pages          # text per page ("" for pages awaiting OCR)
+        self.ocr_pages = ocr_pages  # page numbers with no usable text layer
+        self.engines = engines      # page number -> engine that produced its text
+
+    @property
+    def text(self) -> str:
+        return "\n".join(page for page in self.pages if page).strip()
+
+
+class PyMuPDFEngine:
+    name = "pymupdf"
+
+    def extract(self, pdf_path: str) -> ExtractionResult:
+        import fitz  # PyMuPDF
+        pages, ocr_pages, engines, table_pages = [], [], {}, []
+        pdf = fitz.open(pdf_path)
+        try:
+            for page in pdf:
+                text = page.get_text("text").strip()
+                if len(text) < MIN_PAGE_TEXT_CHARS:
+                    # Scanned page: OCR it (blank pages have nothing to OCR)
+                    if page.get_images(full=False) or page.get_drawings():
+                        ocr_pages.append(page.number)
+                    pages.append("")
+                    continue
+                if self._is_table_heavy(page):
+                    table_pages.append(page.number)
+                pages.append(text)
+                engines[page.number] = self.name
+        finally:
+            pdf.close()
+
+        if table_pages:
+            for page_number, text in PdfPlumberEngine().extract_pages(pdf_path, table_pages).items():
+                if text:
+                    pages[page_number] = text
+                    engines[page_number] = PdfPlumberEngine.name
+
+        return ExtractionResult(pages, ocr_pages, engines)
+
+    @staticmethod
+    def _is_table_heavy(page) -> bool:
+        # get_drawings() is cheap; only confirm with find_tables() when it looks ruled
+        if len(page.get_drawings()) < TABLE_DRAWINGS_THRESHOLD:
+            return False
+        try:
+            return bool(page.find_tables().tables)
+        except Exception:
+            return False
+
+
+class PdfPlumberEngine:
+    name = "pdfplumber"
+
+    def extract_pages(self, pdf_path: str, page_numbers: List[int]) -> Dict[int, str]:
+        import pdfplumber
+        texts = {}
+        with pdfplumber.open(pdf_path) as pdf:
+            for page_number in page_numbers:
+                texts[page_number] = (pdf.pages[page_number].extract_text(layout=True) or "").strip()
+        return texts
+
+    def extract(self, pdf_path: str) -> ExtractionResult:
+        import pdfplumber
+        with pdfplumber.open(pdf_path) as pdf:
+            pages = [(page.extract_text() or "").strip() for page in pdf.pages]
+        return _result_from_pages(pages, self.name)
+
+
+class PyPDF2Engine:
+    name = "pypdf2"
+
+    def extract(self, pdf_path: str) -> ExtractionResult:
+        import PyPDF2
+        pdf_reader = PyPDF2.PdfReader(pdf_path)
+        pages = [(page.extract_text() or "").strip() for page in pdf_reader.pages]
+        return _result_from_pages(pages, self.name)
+
+
+def _result_from_pages(pages: List[str], engine_name: str) -> ExtractionResult:
+    ocr_pages = [i for i, text in enumerate(pages) if len(text) < MIN_PAGE_TEXT_CHARS]
+    pages = ["" if len(text) < MIN_PAGE_TEXT_CHARS else text for text in pages]
+    engines = {i: engine_name for i, text in enumerate(pages) if text}
+    return ExtractionResult(pages, ocr_pages, engines)
+
+
+ENGINES = {
+    PyMuPDFEngine.name: PyMuPDFEngine,
+    PdfPlumberEngine.name: PdfPlumberEngine,
+    PyPDF2Engine.name: PyPDF2Engine,
+}
+
+
+def extract_pdf_text(pdf_path: str, engine: str = EXTRACTION_ENGINE) -> ExtractionResult:
+    """Extract per-page text with the selected engine"""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown extraction engine '{engine}' (choose from {', '.join(ENGINES)})")
+    return ENGINES[engine]().extract(pdf_path)
@@ -0,0 +1,160 @@
+# user_cache.py - Request-scoped and process-level cache of user records
+#
+# Authenticated routes read users/{email} on nearly every request. Records are
+# memoized on the request (one read per request at most) and in a process-wide
+# TTL cache shared by requests. Routes that change a user invalidate its entry.
+# Other workers see the change when their entry expires (USER_CACHE_TTL), or
+# immediately with USER_CACHE_LISTENER=true: invalidate() then also publishes
+# the emails as a small change record (repository.publish_user_changes) and
+# every worker's on_snapshot listener on those records invalidates them too.
+# Nothing listens to the users collection itself, so a worker receives one
+# tiny event per write, not every tenant's user documents.
+import asyncio
+import contextvars
+import copy
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+USER_CACHE_LISTENER = os.getenv("USER_CACHE_LISTENER", "false").lower() == "true"
+
+
+class UserCache:
+    def __init__(self, loader: Callable[[str], Optional[dict]], ttl: float = USER_CACHE_TTL,
+                 max_entries: int = USER_CACHE_MAX_ENTRIES, executor=None):
+        self.loader = loader  # email -> user record or None (blocking)
+        self.executor = executor  # where get_async runs the loader (None: the loop's default)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # email -> (expires_at, user_data)
+        self._lock = threading.Lock()
+        self._watch = None
+        self._repository = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, email: str, request=None, refresh: bool = False) -> Optional[dict]:
+        """The user record (a copy callers may modify), or None if there is no such user.
+
+        refresh=True skips both cache levels and reloads from Firestore.
+        """
+        request_users = _request_users(request)
+        if not refresh and request_users is not None and email in request_users:
+            return copy.deepcopy(request_users[email])
+
+        user_data = None if refresh else self._get_cached(email)
+        if user_data is None:
+            self.misses += 1
+            user_data = self.loader(email)
+            if user_data is not None:
+                self._set(email, user_data)
+        else:
+            self.hits += 1
+
+        if request_users is not None and user_data is not None:
+            request_users[email] = user_data
+        return copy.deepcopy(user_data)
+
+    async def get_async(self, email: str, request=None, refresh: bool = False) -> Optional[dict]:
+        """get() for async routes: cache hits return inline, misses load off the event loop"""
+        if not refresh:
+            request_users = _request_users(request)
+            if request_users is not None and email in request_users:
+                return copy.deepcopy(request_users[email])
+            user_data = self._get_cached(email)
+            if user_data is not None:
+                self.hits += 1
+                if request_users is not None:
+                    request_users[email] = user_data
+                return copy.deepcopy(user_data)
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, lambda: context.run(self.get, email, request, refresh)
+        )
+
+    def invalidate(self, *emails: str):
+        """Drop the entries here and, with the listener on, in every other worker"""
+        self._drop(emails)
+        if self._repository is not None and emails:
+            if self.executor is not None:
+                self.executor.submit(self._publish, list(emails))
+            else:
+                self._publish(list(emails))
+
+    def _drop(self, emails):
+        with self._lock:
+            for email in emails:
+                self._entries.pop(email, None)
+
+    def _publish(self, emails):
+        try:
+            self._repository.publish_user_changes(emails)
+        except Exception as e:
+            # Other workers fall back to the TTL
+            logger.warning("Failed to publish user cache invalidation", extra={"error": str(e)})
+
+    def _get_cached(self, email: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[email]
+                return None
+            self._entries.move_to_end(email)
+            return entry[1]
+
+    def _set(self, email: str, user_data: dict):
+        with self._lock:
+            self._entries[email] = (time.monotonic() + self.ttl, user_data)
+            self._entries.move_to_end(email)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def start_listener(self, repository):
+        """Invalidate entries when users change in any worker (repository.watch_users)"""
+        if self._watch is not None:
+            return
+        self._watch = repository.watch_users(self._drop)
+        self._repository = repository
+        logger.info("User cache listener started")
+
+    def stop_listener(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+            self._repository = None
+        self._repository = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "ttl": self.ttl,
+            "listener": self._watch is not None
+        }
+
+
+def _request_users(request) -> Optional[dict]:
+    """Per-request memo stored on request.state"""
+    if request is None:
+        return None
+    users = getattr(request.state, "users", None)
+    if users is None:
+        users = {}
+        request.state.users = users
+    return users
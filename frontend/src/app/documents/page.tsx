@@ -33,6 +33,11 @@ interface EmployeeStatus {
 
 type TabType = 'upload' | 'list' | 'assign';
 
+const PAGE_SIZE = 50;
+// Analysis job polling: every 2s, for up to 3 minutes
+const JOB_POLL_INTERVAL_MS = 2000;
+const JOB_POLL_TIMEOUT_MS = 3 * 60 * 1000;
+
 export default function DocumentsPage() {
   const [activeTab, setActiveTab] = useState<TabType>('list');
   const [documents, setDocuments] = useState<Document[]>([]);
@@ -48,20 +53,25 @@ export default function DocumentsPage() {
   const [viewingDoc, setViewingDoc] = useState<Document | null>(null);
   const [employeeStatuses, setEmployeeStatuses] = useState<Record<string, EmployeeStatus[]>>({});
   const [statusLoading, setStatusLoading] = useState<string | null>(null);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
 
   useEffect(() => {
     fetchDocuments();
   }, []);
 
-  const fetchDocuments = async () => {
+  const fetchDocuments = async (cursor: string | null = null) => {
     setLoading(true);
     try {
-      const response = await fetch(`${API_BASE_URL}/documents/`, {
+      const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
+      if (cursor) params.set('start_after', cursor);
+      const response = await fetch(`${API_BASE_URL}/documents/?${params}`, {
         credentials: 'include',
       });
       if (response.ok) {
         const data = await response.json();
-        setDocuments(data.documents || []);
+        const page: Document[] = data.documents || [];
+        setDocuments((prev) => (cursor ? [...prev, ...page] : page));
+        setNextCursor(data.next_cursor || null);
       } else {
         setError('Failed to load documents');
       }
@@ -143,6 +153,36 @@ export default function DocumentsPage() {
         throw new Error('Failed to analyze document');
       }
 
+      // Analysis runs as a background job (unless served from cache); poll until it finishes
+      const { job_id, cached } = await response.json();
+      if (!cached) {
+        setMessage('Document queued for analysis...');
+        await fetchDocuments();
+      }
+
+      let job: { status: string; error_message?: string } | null = cached ? { status: 'succeeded' } : null;
+      const deadline = Date.now() + JOB_POLL_TIMEOUT_MS;
+      while (!job || !['succeeded', 'failed'].includes(job.status)) {
+        if (Date.now() >= deadline) {
+          // The job keeps running on the server; the list shows the result once it is done
+          setMessage('Document is still processing. Check back in a few minutes.');
+          await fetchDocuments();
+          return;
+        }
+        await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+        const jobResponse = await fetch(`${API_BASE_URL}/jobs/${job_id}`, {
+          credentials: 'include',
+        });
+        if (!jobResponse.ok) {
+          throw new Error('Failed to fetch analysis job');
+        }
+        job = (await jobResponse.json()).job;
+      }
+
+      if (job.status === 'failed') {
+        throw new Error(job.error_message || 'Failed to analyze document');
+      }
+
       setMessage('Document analyzed successfully!');
       await fetchDocuments();
     } catch (err) {
@@ -393,6 +433,14 @@ export default function DocumentsPage() {
                       </div>
                     </div>
                   ))}
+                  {nextCursor && (
+                    <button
+                      onClick={() => fetchDocuments(nextCursor)}
+                      className="px-4 py-2 bg-gray-200 text-gray-900 rounded-lg hover:bg-gray-300 transition text-sm font-semibold"
+                    >
+                      Load more
+                    </button>
+                  )}
                 </div>
               )}
             </div>